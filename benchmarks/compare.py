@@ -0,0 +1,90 @@
+# benchmarks/compare.py
+# Compares two result files from run.py, benchmark by benchmark:
+#
+#   python benchmarks/compare.py before.json after.json --threshold 0.1
+#
+# Exits with 1 if any benchmark got slower by more than the threshold (as a fraction of the
+# baseline median), so it can gate a CI job. Changes smaller than the spread between runs are
+# reported as noise rather than as regressions.
+import argparse
+import json
+import sys
+
+DEFAULT_THRESHOLD = 0.10
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    return report.get("meta", {}), report.get("results", {})
+
+
+def spread(result):
+    # Relative spread of a benchmark's runs, as a rough noise floor.
+    return (result["max"] - result["min"]) / result["seconds"] if result.get("seconds") else 0.0
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    # Returns rows of (name, baseline seconds, current seconds, relative change, verdict).
+    rows = []
+    for name in sorted(set(baseline) | set(current)):
+        before, after = baseline.get(name), current.get(name)
+        if before is None or after is None:
+            rows.append((name, before and before["seconds"], after and after["seconds"], None,
+                         "new" if before is None else "missing"))
+            continue
+        if not before["seconds"]:
+            rows.append((name, before["seconds"], after["seconds"], None, "n/a"))
+            continue
+        change = after["seconds"] / before["seconds"] - 1
+        noise = max(spread(before), spread(after))
+        if abs(change) <= noise:
+            verdict = "noise"
+        elif change > threshold:
+            verdict = "SLOWER"
+        elif change < -threshold:
+            verdict = "faster"
+        else:
+            verdict = "same"
+        rows.append((name, before["seconds"], after["seconds"], change, verdict))
+    return rows
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    if seconds < 1:
+        return f"{seconds * 1000:.1f} ms"
+    return f"{seconds:.2f} s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files from run.py.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown that counts as a regression (default 0.10)")
+    args = parser.parse_args(argv)
+    baseline_meta, baseline = load_results(args.baseline)
+    current_meta, current = load_results(args.current)
+    for label, meta in (("baseline", baseline_meta), ("current", current_meta)):
+        dirty = " (uncommitted changes)" if meta.get("dirty") else ""
+        print(f"{label}: {meta.get('commit') or 'unknown commit'}{dirty}, {meta.get('timestamp', '')}")
+    if baseline_meta.get("platform") != current_meta.get("platform"):
+        print("warning: the results come from different platforms")
+
+    rows = compare(baseline, current, args.threshold)
+    width = max((len(row[0]) for row in rows), default=10)
+    print(f"{'benchmark':<{width}}  {'baseline':>10}  {'current':>10}  {'change':>8}")
+    for name, before, after, change, verdict in rows:
+        change_text = f"{change:+.1%}" if change is not None else ""
+        print(f"{name:<{width}}  {format_seconds(before):>10}  {format_seconds(after):>10}  {change_text:>8}  {verdict}")
+    regressions = [row for row in rows if row[4] == "SLOWER"]
+    if regressions:
+        print(f"{len(regressions)} benchmarks slower than the {args.threshold:.0%} threshold")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
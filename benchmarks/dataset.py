@@ -0,0 +1,145 @@
+# benchmarks/dataset.py
+# Generates synthetic image folders for the benchmarks:
+#
+#   python benchmarks/dataset.py /tmp/bench-1k --count 1000
+#
+# The same count, seed and size mix always produce the same files, so timings from different
+# commits are measured on identical data. Images are spread over subfolders, mix formats and
+# sizes the way a real dataset does, and some of them get a caption sidecar.
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw
+
+# (extension, PIL format, weight)
+FORMATS = (
+    (".jpg", "JPEG", 55),
+    (".png", "PNG", 20),
+    (".webp", "WEBP", 15),
+    (".gif", "GIF", 5),
+    (".bmp", "BMP", 5),
+)
+# (min side, max side, weight) per size class. "mixed" is mostly small files with some photos at
+# full camera resolution; "small" keeps generating 100k images quick.
+SIZE_MIXES = {
+    "mixed": ((64, 320, 70), (640, 1600, 25), (2000, 4096, 5)),
+    "small": ((64, 320, 1),),
+}
+DEFAULT_SEED = 0
+DEFAULT_CAPTIONED = 0.5
+FILES_PER_FOLDER = 1000
+MARKER_FILE = ".dataset.json"
+WORDS = (
+    "a", "the", "cat", "dog", "red", "blue", "car", "house", "tree", "person", "sitting", "standing",
+    "on", "in", "near", "old", "small", "large", "street", "beach", "mountain", "photo", "of", "with",
+)
+
+
+def _weighted_choice(rng, choices):
+    return rng.choices(choices, weights=[choice[-1] for choice in choices])[0]
+
+
+def describe_file(index, seed, size_mix, captioned):
+    # Everything about file `index`, drawn from its own RNG so it doesn't depend on the order
+    # (or the process) in which files are generated.
+    rng = random.Random(f"{seed}:{index}")
+    ext, fmt, _ = _weighted_choice(rng, FORMATS)
+    min_side, max_side, _ = _weighted_choice(rng, SIZE_MIXES[size_mix])
+    width = rng.randint(min_side, max_side)
+    height = max(16, int(width * rng.uniform(0.5, 1.5)))
+    folder = f"part{index // FILES_PER_FOLDER:04d}"
+    caption = None
+    if rng.random() < captioned:
+        caption = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))
+    return {
+        "path": os.path.join(folder, f"img{index:06d}{ext}"),
+        "format": fmt,
+        "width": width,
+        "height": height,
+        "caption": caption,
+        "color_seed": rng.getrandbits(32),
+    }
+
+
+def _write_file(root, spec):
+    rng = random.Random(spec["color_seed"])
+    img = Image.new("RGB", (spec["width"], spec["height"]), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    # A few shapes so files compress like images rather than flat colour, and differ in content.
+    for _ in range(rng.randint(3, 8)):
+        x0, y0 = rng.randrange(spec["width"]), rng.randrange(spec["height"])
+        x1, y1 = rng.randint(x0, spec["width"]), rng.randint(y0, spec["height"])
+        draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    path = os.path.join(root, spec["path"])
+    img.save(path, format=spec["format"])
+    if spec["caption"] is not None:
+        with open(os.path.splitext(path)[0] + ".txt", "w", encoding="utf-8") as f:
+            f.write(spec["caption"])
+    return os.path.getsize(path)
+
+
+def _write_range(root, start, stop, seed, size_mix, captioned):
+    return sum(_write_file(root, describe_file(i, seed, size_mix, captioned)) for i in range(start, stop))
+
+
+def generate_dataset(root, count, seed=DEFAULT_SEED, size_mix="mixed", captioned=DEFAULT_CAPTIONED,
+                     workers=None, on_progress=None):
+    # Returns the dataset description. A folder that already holds the same dataset is reused;
+    # one with different parameters is replaced.
+    params = {"count": count, "seed": seed, "size_mix": size_mix, "captioned": captioned}
+    marker_path = os.path.join(root, MARKER_FILE)
+    try:
+        with open(marker_path, encoding="utf-8") as f:
+            marker = json.load(f)
+        if marker["params"] == params:
+            return marker
+    except (OSError, ValueError, KeyError):
+        pass
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+    for part in range((count + FILES_PER_FOLDER - 1) // FILES_PER_FOLDER):
+        os.makedirs(os.path.join(root, f"part{part:04d}"), exist_ok=True)
+
+    total_bytes = 0
+    chunk = 250
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_write_range, root, start, min(start + chunk, count), seed, size_mix, captioned)
+            for start in range(0, count, chunk)
+        ]
+        for done, future in enumerate(futures, 1):
+            total_bytes += future.result()
+            if on_progress is not None:
+                on_progress(min(done * chunk, count), count)
+    marker = {"params": params, "bytes": total_bytes}
+    # Written last: a folder without it is an interrupted generation and is rebuilt next time.
+    with open(marker_path, "w", encoding="utf-8") as f:
+        json.dump(marker, f)
+    return marker
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic image folder for the benchmarks.")
+    parser.add_argument("folder")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--sizes", choices=sorted(SIZE_MIXES), default="mixed")
+    parser.add_argument("--captioned", type=float, default=DEFAULT_CAPTIONED,
+                        help="Fraction of images that get a caption sidecar")
+    args = parser.parse_args(argv)
+    marker = generate_dataset(
+        args.folder, args.count, seed=args.seed, size_mix=args.sizes, captioned=args.captioned,
+        on_progress=lambda done, total: print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True),
+    )
+    print(file=sys.stderr)
+    print(f"{args.folder}: {args.count} images, {marker['bytes'] / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
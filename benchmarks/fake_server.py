@@ -0,0 +1,368 @@
+# benchmarks/fake_server.py
+# Local OpenAI-compatible chat completions server for benchmarks and offline testing:
+#
+#   python benchmarks/fake_server.py --port 8000 --latency 0.5 --rate-limit-rate 0.05
+#   OPENAI_BASE_URL=http://127.0.0.1:8000/v1 python src/cli.py caption /tmp/bench-1k
+#
+# Every request sleeps for the configured latency (plus jitter) and answers with a canned caption
+# and token usage, or with an injected 429 / 500. Packed requests (response_format json_object)
+# get one caption per image, so the packing path can be benchmarked too. Tests queue exact
+# responses with inject(), e.g. server.inject(429, headers={"retry-after-ms": "200"}).
+#
+# It also stands in for the Files and Batches endpoints used by `cli.py batch`: uploaded request
+# files are kept in memory, and a batch is processed the first time it is retrieved. Individual
+# requests can be made to fail (batch_errors) or expire (batch_expired), and whole batches to
+# fail validation (fail_batches).
+import argparse
+import collections
+import email.parser
+import email.policy
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_LATENCY = 0.2
+DEFAULT_JITTER = 0.25  # +-25% of the latency
+DEFAULT_RETRY_AFTER = 0.5
+# Roughly what a 1024px image costs at high detail.
+IMAGE_TOKENS = 765
+COMPLETION_TOKENS = 40
+ERROR_TYPES = {400: "invalid_request_error", 429: "rate_limit_error", 500: "server_error"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API, so clients reuse their connection pool.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_bytes(self, data, content_type="application/octet-stream"):
+        self.send_response(200)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self):
+        self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_GET(self):
+        # /v1/models, /v1/files/{id}/content and /v1/batches/{id}
+        parts = self.path.split("?")[0].strip("/").split("/")[1:]
+        fake = self.server.fake
+        if parts == ["models"]:
+            self._send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+        elif len(parts) == 3 and parts[0] == "files" and parts[2] == "content" and parts[1] in fake.files:
+            self._send_bytes(fake.files[parts[1]]["content"])
+        elif len(parts) == 2 and parts[0] == "batches" and parts[1] in fake.batches:
+            self._send_json(200, fake.retrieve_batch(parts[1]))
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        # /v1/chat/completions, /v1/files (multipart upload) and /v1/batches
+        length = int(self.headers.get("content-length", 0))
+        data = self.rfile.read(length)
+        parts = self.path.split("?")[0].strip("/").split("/")[1:]
+        if parts == ["files"]:
+            self._send_json(200, self.server.fake.create_file(self.headers.get("content-type", ""), data))
+            return
+        try:
+            body = json.loads(data)
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON", "type": "invalid_request_error"}})
+            return
+        if parts == ["chat", "completions"]:
+            self.server.fake.handle_completion(self, body)
+        elif parts == ["batches"]:
+            if body.get("input_file_id") not in self.server.fake.files:
+                self._send_json(400, {"error": {"message": "Unknown input file", "type": "invalid_request_error"}})
+                return
+            self._send_json(200, self.server.fake.create_batch(body))
+        else:
+            self._not_found()
+
+
+class _Server(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connections when many clients connect at once, and
+    # each dropped SYN costs the client a second before it retries.
+    request_queue_size = 128
+
+
+class FakeOpenAIServer:
+    # Serves in a background thread; use as a context manager or call start() / stop().
+    # `stats` counts requests by outcome.
+
+    def __init__(self, host="127.0.0.1", port=0, latency=DEFAULT_LATENCY, jitter=DEFAULT_JITTER,
+                 rate_limit_rate=0.0, server_error_rate=0.0, retry_after=DEFAULT_RETRY_AFTER, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._injected = collections.deque()
+        self._in_flight = 0
+        self.files = {}  # file id -> {"object": FileObject fields, "content": bytes}
+        self.batches = {}  # batch id -> Batch fields
+        self.batch_errors = {}  # custom_id -> HTTP status its request fails with
+        self.batch_expired = set()  # custom_ids left unprocessed when their batch expires
+        self._failing_batches = 0
+        self.stats = {
+            "requests": 0, "ok": 0, "rate_limited": 0, "server_errors": 0, "client_errors": 0, "images": 0,
+            "max_in_flight": 0, "files": 0, "batches": 0,
+        }
+        self._server = _Server((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def serve_forever(self):
+        # Serves on the calling thread until interrupted.
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def start(self):
+        # A short poll interval keeps stop() quick.
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), name="fake-openai", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def inject(self, status, count=1, headers=None, content=None):
+        # The next `count` completions answer with this status (and extra headers) instead of a
+        # random outcome; injected responses are served in order. For a 200, content replaces
+        # the reply text, e.g. to send a malformed packed reply.
+        with self._lock:
+            self._injected.extend([(status, headers, content)] * count)
+
+    def _draw(self):
+        # One locked draw per request keeps injected failures reproducible for a given seed.
+        with self._lock:
+            self.stats["requests"] += 1
+            number = self.stats["requests"]
+            delay = self.latency * (1 + self._rng.uniform(-self.jitter, self.jitter))
+            outcome = self._rng.random()
+            if self._injected:
+                return number, delay, *self._injected.popleft()
+        if outcome < self.rate_limit_rate:
+            return number, delay, 429, None, None
+        if outcome < self.rate_limit_rate + self.server_error_rate:
+            return number, delay, 500, None, None
+        return number, delay, 200, None, None
+
+    def handle_completion(self, handler, body):
+        with self._lock:
+            self._in_flight += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+        try:
+            self._complete(handler, body)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _complete(self, handler, body):
+        number, delay, status, headers, reply = self._draw()
+        if status == 429:
+            # Rejected requests come back quickly, like the real API's.
+            time.sleep(min(delay, 0.01))
+            with self._lock:
+                self.stats["rate_limited"] += 1
+            handler._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                headers or {"retry-after": str(self.retry_after)},
+            )
+            return
+        time.sleep(max(delay, 0))
+        if status != 200:
+            with self._lock:
+                self.stats["server_errors" if status >= 500 else "client_errors"] += 1
+            error_type = ERROR_TYPES.get(status, "server_error" if status >= 500 else "invalid_request_error")
+            handler._send_json(status, {"error": {"message": f"Injected {status}", "type": error_type}}, headers)
+            return
+
+        handler._send_json(200, self._completion(body, number, reply))
+
+    def _completion(self, body, number, reply=None):
+        content = body.get("messages", [{}])[-1].get("content", [])
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        images = sum(1 for part in content if part.get("type") == "image_url")
+        text = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            caption = json.dumps({"captions": {str(i): f"A synthetic caption for image {i}." for i in range(1, images + 1)}})
+        else:
+            caption = "A synthetic caption of a few coloured rectangles on a plain background."
+        if reply is not None:
+            caption = reply
+        prompt_tokens = len(text) // 4 + IMAGE_TOKENS * images
+        completion_tokens = COMPLETION_TOKENS * max(images, 1)
+        with self._lock:
+            self.stats["ok"] += 1
+            self.stats["images"] += images
+        return {
+            "id": f"chatcmpl-fake-{number}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": caption}}
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def fail_batches(self, count=1):
+        # The next `count` batches created fail validation: no output or error file at all.
+        with self._lock:
+            self._failing_batches += count
+
+    def _add_file(self, content, filename, purpose):
+        with self._lock:
+            self.stats["files"] += 1
+            file_id = f"file-fake-{self.stats['files']}"
+            info = {
+                "id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed",
+            }
+            self.files[file_id] = {"object": info, "content": content}
+        return info
+
+    def create_file(self, content_type, data):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"content-type: {content_type}\r\n\r\n".encode("latin-1") + data
+        )
+        fields = {}
+        filename = "upload.jsonl"
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            fields[name] = part.get_payload(decode=True)
+            filename = part.get_filename() or filename
+        return self._add_file(fields.get("file", b""), filename, (fields.get("purpose") or b"batch").decode())
+
+    def create_batch(self, body):
+        with self._lock:
+            self.stats["batches"] += 1
+            batch_id = f"batch-fake-{self.stats['batches']}"
+            failing = self._failing_batches > 0
+            self._failing_batches -= failing
+            self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"),
+                "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window"),
+                "status": "validating", "created_at": int(time.time()), "metadata": body.get("metadata"),
+                "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                "_fail": failing,
+            }
+        return self._public_batch(batch_id)
+
+    def _public_batch(self, batch_id):
+        return {key: value for key, value in self.batches[batch_id].items() if not key.startswith("_")}
+
+    def retrieve_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        if batch["status"] == "validating":
+            self._process_batch(batch)
+        return self._public_batch(batch_id)
+
+    def _process_batch(self, batch):
+        # Runs every request line at once, without the configured latency.
+        if batch["_fail"]:
+            batch["status"] = "failed"
+            batch["errors"] = {"object": "list", "data": [{"code": "invalid_request", "message": "Injected failure"}]}
+            return
+        lines = [json.loads(line) for line in self.files[batch["input_file_id"]]["content"].splitlines() if line.strip()]
+        output, errors = [], []
+        for number, request in enumerate(lines, 1):
+            custom_id = request.get("custom_id")
+            if custom_id in self.batch_expired:
+                errors.append({"id": f"batch-req-{number}", "custom_id": custom_id, "response": None,
+                               "error": {"code": "batch_expired", "message": "This request could not be executed"}})
+                continue
+            status = self.batch_errors.get(custom_id)
+            if status is not None:
+                error_type = ERROR_TYPES.get(status, "server_error" if status >= 500 else "invalid_request_error")
+                errors.append({"id": f"batch-req-{number}", "custom_id": custom_id, "error": None, "response": {
+                    "status_code": status, "body": {"error": {"message": f"Injected {status}", "type": error_type}},
+                }})
+                continue
+            output.append({"id": f"batch-req-{number}", "custom_id": custom_id, "error": None, "response": {
+                "status_code": 200, "request_id": f"req-{number}",
+                "body": self._completion(request.get("body") or {}, number),
+            }})
+        if output:
+            batch["output_file_id"] = self._add_file(
+                "".join(json.dumps(line) + "\n" for line in output).encode("utf-8"), "output.jsonl", "batch_output"
+            )["id"]
+        if errors:
+            batch["error_file_id"] = self._add_file(
+                "".join(json.dumps(line) + "\n" for line in errors).encode("utf-8"), "errors.jsonl", "batch_output"
+            )["id"]
+        expired = any(line["custom_id"] in self.batch_expired for line in lines)
+        batch["status"] = "expired" if expired else "completed"
+        batch["request_counts"] = {"total": len(lines), "completed": len(output), "failed": len(errors)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="Seconds per request")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_JITTER, help="Latency varies by +- this fraction")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Fraction answered with 500")
+    parser.add_argument("--retry-after", type=float, default=DEFAULT_RETRY_AFTER)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    server = FakeOpenAIServer(
+        args.host, args.port, latency=args.latency, jitter=args.jitter, rate_limit_rate=args.rate_limit_rate,
+        server_error_rate=args.server_error_rate, retry_after=args.retry_after, seed=args.seed,
+    )
+    print(f"Serving on {server.url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+# benchmarks/run.py
+# Times the app's hot paths on synthetic datasets and writes the results as JSON:
+#
+#   python benchmarks/run.py --sizes 1000,10000 --output before.json
+#   python benchmarks/run.py --sizes 1000,10000 --output after.json
+#   python benchmarks/compare.py before.json after.json
+#
+# Suites:
+#   scan        listing a folder, as on_directory_picked does (time to first chunk and to the end)
+#   thumbnails  building thumbnails in the process pool, cold and from the disk cache
+#   captions    load_caption/save_caption: reading sidecars, queueing and writing them, indexing them for search
+#   tags        TagStore add / search / rename / remove on a large vocabulary
+#   captioning  caption_image through the request scheduler against a local fake OpenAI server
+#
+# Datasets are generated once per size and seed (see dataset.py) and reused by later runs. Every
+# benchmark runs --repeat times; the JSON keeps every run, and the median is what compare.py uses.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from components.batch import BatchCaptioner  # noqa: E402
+from components.caption_cache import CaptionCache  # noqa: E402
+from components.caption_writer import FSYNC_POLICIES, CaptionWriter  # noqa: E402
+from components.captioning import DEFAULT_PROMPT, caption_image  # noqa: E402
+from components.metrics import MetricsRegistry, record_caption_result  # noqa: E402
+from components.preprocess import PreprocessOptions  # noqa: E402
+from components.providers import Provider, create_async_client  # noqa: E402
+from components.ratelimit import RequestScheduler  # noqa: E402
+from components.scanner import scan_images  # noqa: E402
+from components.search import CaptionIndex  # noqa: E402
+from components.sidecars import read_caption  # noqa: E402
+from components.tags import TagStore  # noqa: E402
+from components.thumbnails import ThumbnailCache  # noqa: E402
+
+from dataset import DEFAULT_SEED, SIZE_MIXES, generate_dataset  # noqa: E402
+from fake_server import DEFAULT_LATENCY, FakeOpenAIServer  # noqa: E402
+
+RESULTS_VERSION = 1
+SUITES = ("scan", "thumbnails", "captions", "tags", "captioning")
+DEFAULT_SIZES = "1000"
+DEFAULT_REPEAT = 3
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "image-captioning-benchmarks")
+# The slower suites work on a prefix of the dataset so a 100k run doesn't take hours.
+DEFAULT_THUMBNAIL_LIMIT = 500
+DEFAULT_CAPTION_LIMIT = 200
+DEFAULT_TAG_COUNT = 10000
+DEFAULT_CONCURRENCY = 16
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+class Recorder:
+    # Collects benchmark results as {name: {"seconds": median, "runs": [...], ...}}.
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = {}
+
+    def measure(self, name, fn, items=None, setup=None):
+        # fn() returns its elapsed seconds (so setup inside it isn't timed) and optionally a dict
+        # of extra numbers, reported from the last run. setup() runs untimed before every run.
+        runs = []
+        extra = {}
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            outcome = fn()
+            if isinstance(outcome, tuple):
+                elapsed, extra = outcome
+            else:
+                elapsed = outcome
+            runs.append(elapsed)
+        self.add(name, runs, items, extra)
+
+    def add(self, name, runs, items=None, extra=None):
+        median = statistics.median(runs)
+        result = {"seconds": median, "min": min(runs), "max": max(runs), "runs": runs}
+        if items:
+            result["items"] = items
+            result["per_second"] = items / median if median else None
+        result.update(extra or {})
+        self.results[name] = result
+        rate = f", {result['per_second']:,.0f}/s" if result.get("per_second") else ""
+        print(f"  {name}: {median * 1000:,.1f} ms (min {min(runs) * 1000:,.1f}){rate}", file=sys.stderr)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def bench_scan(recorder, size, folder, files):
+    def first_chunk():
+        started = time.perf_counter()
+        for _ in scan_images(folder):
+            return time.perf_counter() - started
+
+    recorder.measure(f"scan.first_chunk@{size}", first_chunk)
+    recorder.measure(f"scan.full@{size}", lambda: timed(lambda: sum(len(chunk) for chunk in scan_images(folder))),
+                     items=len(files))
+
+
+def bench_thumbnails(recorder, size, files, work_dir, limit):
+    paths = files[:limit]
+    cache_dir = os.path.join(work_dir, "thumbnails")
+    metrics = MetricsRegistry()
+
+    def build(cache):
+        # Requests every thumbnail and waits for the ones that had to be built. on_ready can run
+        # before request() returns, so finished builds are collected rather than counted down.
+        building = set()
+        ready = set()
+        cond = threading.Condition()
+
+        def on_ready(image_path, thumb_path):
+            with cond:
+                ready.add(image_path)
+                cond.notify_all()
+
+        started = time.perf_counter()
+        for image_path in paths:
+            if cache.request(image_path, on_ready) is None:
+                building.add(image_path)
+        with cond:
+            cond.wait_for(lambda: building <= ready)
+        return time.perf_counter() - started
+
+    def cold():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        # A fresh pool each time, so worker start-up is part of every cold run like it is in the app.
+        cache = ThumbnailCache(cache_dir, metrics=metrics)
+        try:
+            elapsed = build(cache)
+        finally:
+            cache.shutdown()
+        timer = metrics.timer("thumbnail_build_seconds")
+        return elapsed, {"build_p50": timer.quantile(0.5), "build_p95": timer.quantile(0.95)}
+
+    recorder.measure(f"thumbnails.cold@{size}", cold, items=len(paths))
+    cache = ThumbnailCache(cache_dir)
+    try:
+        recorder.measure(f"thumbnails.cached@{size}", lambda: build(cache), items=len(paths))
+    finally:
+        cache.shutdown()
+
+
+def bench_captions(recorder, size, files, work_dir, fsync):
+    captions = {}
+
+    def load():
+        started = time.perf_counter()
+        for image_path in files:
+            captions[image_path] = read_caption(image_path)
+        return time.perf_counter() - started
+
+    recorder.measure(f"captions.load@{size}", load, items=len(files))
+
+    def index():
+        caption_index = CaptionIndex()
+        started = time.perf_counter()
+        for image_path, caption in captions.items():
+            caption_index.update(image_path, caption)
+        return time.perf_counter() - started
+
+    recorder.measure(f"captions.index@{size}", index, items=len(files))
+
+    caption_index = CaptionIndex()
+    for image_path, caption in captions.items():
+        caption_index.update(image_path, caption)
+    queries = ("cat", "red car", "-dog house", "str", "is:empty", "photo of a", "mountain -beach", "is:captioned")
+    recorder.measure(
+        f"captions.search@{size}",
+        lambda: timed(lambda: [caption_index.search(query) for query in queries]),
+        items=len(queries),
+    )
+
+    # Saves go to a scratch folder so the dataset stays the same for later runs.
+    save_dir = os.path.join(work_dir, "captions")
+    targets = [os.path.join(save_dir, f"img{i:06d}.jpg") for i in range(len(files))]
+    text = "A synthetic caption of a few coloured rectangles on a plain background."
+
+    def reset_save_dir():
+        shutil.rmtree(save_dir, ignore_errors=True)
+        os.makedirs(save_dir)
+
+    def save():
+        metrics = MetricsRegistry()
+        writer = CaptionWriter(fsync, metrics=metrics)
+        started = time.perf_counter()
+        for image_path in targets:
+            with metrics.time("caption_save_seconds"):
+                writer.save(image_path, text)
+        queued = time.perf_counter() - started
+        writer.flush()
+        elapsed = time.perf_counter() - started
+        writer.close()
+        write = metrics.timer("caption_write_seconds")
+        return elapsed, {"enqueue_seconds": queued, "write_p50": write.quantile(0.5), "write_p95": write.quantile(0.95)}
+
+    recorder.measure(f"captions.save[{fsync}]@{size}", save, items=len(targets), setup=reset_save_dir)
+
+
+def bench_tags(recorder, tag_count, work_dir):
+    path = os.path.join(work_dir, "tags.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(f"tag{i:06d}\n" for i in range(tag_count))
+    operations = 200
+
+    recorder.measure(f"tags.load@{tag_count}", lambda: timed(lambda: TagStore(path)), items=tag_count)
+
+    def run(operation):
+        store = TagStore(path)
+        started = time.perf_counter()
+        for i in range(operations):
+            operation(store, i)
+        return time.perf_counter() - started
+
+    def reset():
+        # add/rename/remove change the file; every run starts from the same vocabulary.
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(f"tag{i:06d}\n" for i in range(tag_count))
+
+    recorder.measure(f"tags.add@{tag_count}", lambda: run(lambda store, i: store.add(f"new{i}")),
+                     items=operations, setup=reset)
+    recorder.measure(f"tags.search@{tag_count}", lambda: run(lambda store, i: store.search(f"tag{i % 100:03d}")),
+                     items=operations, setup=reset)
+    recorder.measure(f"tags.rename@{tag_count}", lambda: run(lambda store, i: store.rename(f"tag{i:06d}", f"renamed{i}")),
+                     items=operations, setup=reset)
+    recorder.measure(f"tags.remove@{tag_count}", lambda: run(lambda store, i: store.remove(f"tag{i:06d}")),
+                     items=operations, setup=reset)
+
+
+async def _caption_batch(server, paths, concurrency, cache=None, max_retries=6):
+    # Mirrors run_batch_captioning in main.py: BatchCaptioner workers calling caption_image
+    # through one shared RequestScheduler.
+    # A client of its own (not get_async_client's shared one): its pool is bound to this event loop.
+    provider = Provider(name="fake", base_url=server.url, requires_api_key=False)
+    client = create_async_client(provider, provider.resolve_api_key())
+    metrics = MetricsRegistry()
+    scheduler = RequestScheduler(max_concurrency=concurrency, max_retries=max_retries, base_delay=0.1, metrics=metrics)
+    preprocess = PreprocessOptions()
+
+    async def caption_fn(image_path):
+        started = time.perf_counter()
+        result = await caption_image(client, image_path, DEFAULT_PROMPT, preprocess=preprocess, cache=cache,
+                                     scheduler=scheduler)
+        metrics.observe("caption_seconds", time.perf_counter() - started)
+        record_caption_result(metrics, result, cache_enabled=cache is not None)
+        return result
+
+    batch = BatchCaptioner(caption_fn, lambda image_path, result: None, concurrency=concurrency)
+    try:
+        stats = await batch.run(paths)
+    finally:
+        await client.close()
+    api = metrics.timer("api_request_seconds")
+    per_caption = metrics.timer("caption_seconds")
+    return stats["elapsed"], {
+        "failed": stats["failed"],
+        "cached": stats["cached"],
+        "retries": scheduler.stats["retries"],
+        "rate_limited": scheduler.stats["rate_limited"],
+        "api_p50": api.quantile(0.5),
+        "api_p95": api.quantile(0.95),
+        "caption_p50": per_caption.quantile(0.5),
+        "caption_p95": per_caption.quantile(0.95),
+        "upload_bytes": metrics.value("upload_bytes_total"),
+        "prompt_tokens": metrics.value("prompt_tokens_total"),
+        "completion_tokens": metrics.value("completion_tokens_total"),
+    }
+
+
+def bench_captioning(recorder, size, files, work_dir, args):
+    paths = files[:args.caption_limit]
+    with FakeOpenAIServer(latency=args.latency, rate_limit_rate=args.rate_limit_rate,
+                          server_error_rate=args.server_error_rate, retry_after=args.retry_after, seed=args.seed) as server:
+        # generate_caption_from_openai: one image at a time, so the result is latency overhead.
+        single = paths[:20]
+        recorder.measure(f"captioning.single@{size}", lambda: asyncio.run(_caption_batch(server, single, 1)),
+                         items=len(single))
+        recorder.measure(
+            f"captioning.batch[c={args.concurrency}]@{size}",
+            lambda: asyncio.run(_caption_batch(server, paths, args.concurrency)),
+            items=len(paths),
+        )
+        cache_path = os.path.join(work_dir, "caption_cache.sqlite3")
+
+        def cached():
+            # The first pass fills the cache (untimed), the second is served from it.
+            cache = CaptionCache(cache_path)
+            try:
+                asyncio.run(_caption_batch(server, paths, args.concurrency, cache))
+                return asyncio.run(_caption_batch(server, paths, args.concurrency, cache))
+            finally:
+                cache.close()
+                os.remove(cache_path)
+
+        recorder.measure(f"captioning.cached[c={args.concurrency}]@{size}", cached, items=len(paths))
+
+
+def run_size(recorder, size, args):
+    folder = os.path.join(args.data_dir, f"{args.size_mix}-{size}-seed{args.seed}")
+    print(f"Dataset {folder}", file=sys.stderr)
+    started = time.perf_counter()
+    marker = generate_dataset(
+        folder, size, seed=args.seed, size_mix=args.size_mix,
+        on_progress=lambda done, total: print(f"\r  generating {done}/{total}", end="", file=sys.stderr, flush=True),
+    )
+    if time.perf_counter() - started > 1:
+        print(file=sys.stderr)
+    files = [path for chunk in scan_images(folder) for path in chunk]
+    work_dir = tempfile.mkdtemp(prefix="bench-", dir=args.data_dir)
+    try:
+        if "scan" in args.suites:
+            bench_scan(recorder, size, folder, files)
+        if "thumbnails" in args.suites:
+            bench_thumbnails(recorder, size, files, work_dir, args.thumbnail_limit)
+        if "captions" in args.suites:
+            bench_captions(recorder, size, files, work_dir, args.fsync)
+        if "captioning" in args.suites:
+            bench_captioning(recorder, size, files, work_dir, args)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {"folder": folder, "images": len(files), "bytes": marker["bytes"]}
+
+
+def parse_list(text, convert=str):
+    return [convert(item.strip()) for item in text.split(",") if item.strip()]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the Image Captioning Tool's hot paths.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated dataset sizes, e.g. 1000,10000,100000")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"Comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--output", help="Write the JSON results here instead of to stdout")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Where generated datasets are kept")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--size-mix", choices=sorted(SIZE_MIXES), default="mixed")
+    parser.add_argument("--thumbnail-limit", type=int, default=DEFAULT_THUMBNAIL_LIMIT)
+    parser.add_argument("--caption-limit", type=int, default=DEFAULT_CAPTION_LIMIT)
+    parser.add_argument("--tags", type=int, default=DEFAULT_TAG_COUNT, help="Size of the tag vocabulary")
+    parser.add_argument("--fsync", choices=FSYNC_POLICIES, default="none",
+                        help="fsync policy for the caption save benchmark")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="Fake server seconds per request")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of fake 429 responses")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Fraction of fake 500 responses")
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.suites = parse_list(args.suites)
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        print(f"Unknown suites: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+    sizes = parse_list(args.sizes, int)
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    commit, dirty = git_revision()
+    recorder = Recorder(max(1, args.repeat))
+    datasets = {}
+    started = time.perf_counter()
+    for size in sizes:
+        datasets[size] = run_size(recorder, size, args)
+    if "tags" in args.suites:
+        work_dir = tempfile.mkdtemp(prefix="bench-", dir=args.data_dir)
+        try:
+            bench_tags(recorder, args.tags, work_dir)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "elapsed": time.perf_counter() - started,
+            "args": {key: value for key, value in vars(args).items() if key != "data_dir"},
+            "datasets": datasets,
+        },
+        "results": recorder.results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
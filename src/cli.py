@@ -0,0 +1,610 @@
+# src/cli.py
+# Headless entry point for batch captioning, e.g. on a server or in a data pipeline:
+#
+#   python src/cli.py caption /data/images --concurrency 32 --rpm 500
+#
+# Progress is checkpointed to a manifest in the folder, so re-running the same
+# command after an interruption picks up where it stopped.
+#
+# For very large folders the same requests can go through the offline Batch API instead:
+#
+#   python src/cli.py batch submit /data/images
+#   python src/cli.py batch apply /data/images --wait
+#
+# --provider picks a backend from providers.json, e.g. a self-hosted OpenAI-compatible server:
+#
+#   python src/cli.py caption /data/images --provider lan --concurrency 64
+#
+# Captioned images can be exported as training shards (WebDataset tar or JSONL + images):
+#
+#   python src/cli.py export /data/images /data/shards --shard-size 5000 --max-side 768
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import time
+from dataclasses import replace
+
+import openai
+from dotenv import load_dotenv
+
+from components.batch import BatchCaptioner, DEFAULT_CONCURRENCY
+from components.batch_api import DEFAULT_JOB_DIR, BatchJob
+from components.caption_cache import CaptionCache
+from components.caption_store import CaptionStore
+from components.caption_writer import DEFAULT_FSYNC, FSYNC_POLICIES, CaptionWriter
+from components.captioning import DEFAULT_PROMPT, caption_image
+from components.export import (
+    DEFAULT_EXPORT_FORMAT,
+    DEFAULT_MAX_SHARD_BYTES,
+    DEFAULT_SHARD_SIZE,
+    EXPORT_FORMATS,
+    ExportError,
+    export_dataset,
+    read_export_manifest,
+    remove_export,
+    verify_export,
+)
+from components.manifest import Manifest, ManifestMismatchError
+from components.metrics import MetricsRegistry, record_caption_result
+from components.packing import PackedCaptioner
+from components.preprocess import (
+    DEFAULT_FORMAT,
+    DEFAULT_MAX_SIDE,
+    DEFAULT_QUALITY,
+    OUTPUT_FORMATS,
+    PreprocessOptions,
+    format_bytes,
+)
+from components.providers import (
+    DEFAULT_PROVIDER,
+    PROVIDERS_FILE,
+    create_sync_client,
+    describe_providers,
+    get_async_client,
+    load_providers,
+    parse_params,
+)
+from components.ratelimit import DEFAULT_MAX_RETRIES, RequestScheduler
+from components.scanner import IMAGE_EXTENSIONS, parse_extensions, scan_images
+from components.sidecars import has_caption
+
+CAPTION_CACHE_FILE = "caption_cache.sqlite3"
+CAPTION_STORE_FILE = "captions.sqlite3"
+MANIFEST_FILE = ".caption_manifest.jsonl"
+PROGRESS_INTERVAL = 1.0
+
+
+def add_provider_arguments(parser):
+    parser.add_argument("--provider", default=DEFAULT_PROVIDER, help="Backend from the providers file")
+    parser.add_argument("--providers-file", default=PROVIDERS_FILE)
+    parser.add_argument("--api-key", help="Defaults to the provider's key variable (OPENAI_API_KEY) from the environment or .env")
+    parser.add_argument("--base-url", help="Override the provider's endpoint, e.g. http://10.0.0.5:8000/v1")
+
+
+def add_caption_arguments(parser):
+    parser.add_argument("folder", help="Folder of images to caption")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT)
+    add_provider_arguments(parser)
+    parser.add_argument("--model", help="Override the provider's model")
+    parser.add_argument("--max-tokens", type=int, help="Override the provider's max_tokens")
+    parser.add_argument("--param", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra request argument, e.g. temperature=0.2 (repeatable)")
+    parser.add_argument("--extensions", default=",".join(IMAGE_EXTENSIONS))
+    parser.add_argument("--no-recursive", action="store_true", help="Don't descend into subfolders")
+    parser.add_argument("--max-side", type=int, default=DEFAULT_MAX_SIDE, help="0 disables resizing")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default=DEFAULT_FORMAT)
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless batch captioning for the Image Captioning Tool.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    caption = commands.add_parser("caption", help="Caption every image in a folder")
+    add_caption_arguments(caption)
+    caption.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    caption.add_argument("--pack", type=int, default=1, metavar="N",
+                         help="Caption N images per request (JSON output, falls back to single requests)")
+    caption.add_argument("--rpm", type=float, help="Maximum requests per minute")
+    caption.add_argument("--tpm", type=float, help="Maximum (estimated) tokens per minute")
+    caption.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                         help="Retries per image for 429, 5xx and connection errors")
+    caption.add_argument("--only-uncaptioned", action="store_true", help="Skip images that already have a caption")
+    caption.add_argument("--manifest", help=f"Checkpoint file (default: <folder>/{MANIFEST_FILE})")
+    caption.add_argument("--restart", action="store_true", help="Ignore the existing checkpoint and start over")
+    caption.add_argument("--no-cache", action="store_true", help="Don't use the caption cache")
+    caption.add_argument("--cache-file", default=CAPTION_CACHE_FILE)
+    caption.add_argument("--store", help="Also record captions in this SQLite caption store")
+    caption.add_argument("--fsync", choices=FSYNC_POLICIES, default=DEFAULT_FSYNC,
+                         help="none: leave flushing to the OS, file: fsync every caption, full: also fsync folders")
+    caption.add_argument("--metrics", metavar="PATH",
+                         help="Write timings and counters for the run here: CSV for .csv, Prometheus text otherwise")
+
+    store = commands.add_parser("store", help="Query or sync the SQLite caption store")
+    store.add_argument("action", choices=("import", "export", "status", "uncaptioned", "search"))
+    store.add_argument("folder")
+    store.add_argument("text", nargs="?", help="Text to search for (search only)")
+    store.add_argument("--store", default=CAPTION_STORE_FILE)
+    store.add_argument("--extensions", default=",".join(IMAGE_EXTENSIONS))
+    store.add_argument("--no-recursive", action="store_true", help="Don't descend into subfolders")
+
+    batch = commands.add_parser("batch", help="Caption through the offline Batch API (results within 24h)")
+    batch_actions = batch.add_subparsers(dest="action", required=True)
+    submit = batch_actions.add_parser("submit", help="Write request shards and submit them")
+    add_caption_arguments(submit)
+    submit.add_argument("--only-uncaptioned", action="store_true", help="Skip images that already have a caption")
+    submit.add_argument("--no-submit", action="store_true", help="Only write the request shards")
+    submit.add_argument("--restart", action="store_true", help="Discard an unfinished job and start a new one")
+    for name, help_text in (("status", "Show the status of the submitted shards"),
+                            ("apply", "Download finished shards and write their captions")):
+        action = batch_actions.add_parser(name, help=help_text)
+        action.add_argument("folder")
+        add_provider_arguments(action)
+    for action in batch_actions.choices.values():
+        action.add_argument("--job", help=f"Job directory (default: <folder>/{DEFAULT_JOB_DIR})")
+    apply = batch_actions.choices["apply"]
+    apply.add_argument("--wait", action="store_true", help="Poll until every shard has finished")
+    apply.add_argument("--poll-interval", type=float, default=60.0)
+    apply.add_argument("--store", help="Also record captions in this SQLite caption store")
+    apply.add_argument("--fsync", choices=FSYNC_POLICIES, default=DEFAULT_FSYNC,
+                       help="none: leave flushing to the OS, file: fsync every caption, full: also fsync folders")
+
+    export = commands.add_parser("export", help="Write captioned images as WebDataset tar or JSONL + image shards")
+    export.add_argument("folder", help="Folder of captioned images")
+    export.add_argument("output", help="Folder for the shards and manifest.json")
+    export.add_argument("--format", choices=EXPORT_FORMATS, default=DEFAULT_EXPORT_FORMAT)
+    export.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="Samples per shard")
+    export.add_argument("--max-shard-mb", type=float, default=DEFAULT_MAX_SHARD_BYTES / 1024 / 1024,
+                        help="Start a new shard before this size (0 = no limit)")
+    export.add_argument("--max-side", type=int, default=0,
+                        help="Resize images to fit this size (0 = export the original files)")
+    export.add_argument("--image-format", choices=OUTPUT_FORMATS,
+                        help="Re-encode images (default when resizing: JPEG)")
+    export.add_argument("--quality", type=int, default=DEFAULT_QUALITY)
+    export.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    export.add_argument("--extensions", default=",".join(IMAGE_EXTENSIONS))
+    export.add_argument("--no-recursive", action="store_true", help="Don't descend into subfolders")
+    export.add_argument("--overwrite", action="store_true", help="Replace an earlier export in the output folder")
+
+    verify = commands.add_parser("verify-export", help="Check the shards of an export against its manifest")
+    verify.add_argument("output")
+    return parser
+
+
+def get_provider(args):
+    # The chosen provider with the command line overrides applied, or None after printing why not.
+    try:
+        providers = load_providers(args.providers_file)
+        params = parse_params(getattr(args, "param", []))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return None
+    provider = providers.get(args.provider)
+    if provider is None:
+        print(f"Unknown provider {args.provider!r}; known: {', '.join(providers)}", file=sys.stderr)
+        return None
+    overrides = {"params": {**provider.params, **params}}
+    if args.base_url:
+        overrides["base_url"] = args.base_url
+    if getattr(args, "model", None):
+        overrides["model"] = args.model
+    if getattr(args, "max_tokens", None):
+        overrides["max_tokens"] = args.max_tokens
+    return replace(provider, **overrides)
+
+
+def get_api_key(args, provider):
+    api_key = provider.resolve_api_key(args.api_key)
+    if api_key is None:
+        print(
+            f"No API key for {provider.name}: pass --api-key or set {provider.api_key_env} in the environment "
+            "or .env file.", file=sys.stderr
+        )
+    return api_key
+
+
+def get_caption_config(args, provider):
+    # What a manifest or batch job was started with; params only appear when there are any, so
+    # checkpoints from before they existed still match.
+    config = {"prompt": args.prompt, "model": provider.model, "max_tokens": provider.max_tokens}
+    if provider.params:
+        config["params"] = provider.params
+    return config
+
+
+def get_preprocess_options(args):
+    return PreprocessOptions(max_side=args.max_side, output_format=args.format, quality=args.quality)
+
+
+def find_images(args):
+    image_files = []
+    for chunk in scan_images(args.folder, parse_extensions(args.extensions), recursive=not args.no_recursive):
+        image_files.extend(chunk)
+    return image_files
+
+
+def print_summary(stats, skipped, request_stats):
+    elapsed = stats["elapsed"]
+    rate = stats["done"] / elapsed if elapsed else 0.0
+    state = "Cancelled" if stats["cancelled"] else "Finished"
+    print(
+        f"{state}: {stats['done']} of {stats['total']} images captioned "
+        f"({stats['cached']} from cache), {stats['failed']} failed, {skipped} skipped"
+    )
+    print(f"Elapsed {elapsed:.1f}s, {rate:.2f} images/s")
+    print(
+        f"Requests: {request_stats['requests']} sent, {request_stats['retries']} retried "
+        f"({request_stats['rate_limited']} rate limited, {request_stats['server_errors']} server errors)"
+    )
+    print(f"Tokens: {stats['prompt_tokens']} prompt + {stats['completion_tokens']} completion")
+    if stats["upload_bytes"]:
+        print(f"Upload: {format_bytes(stats['original_bytes'])} -> {format_bytes(stats['upload_bytes'])}")
+
+
+async def run_caption(args):
+    provider = get_provider(args)
+    if provider is None:
+        return 2
+    api_key = get_api_key(args, provider)
+    if not api_key:
+        return 2
+
+    config = get_caption_config(args, provider)
+    manifest_path = args.manifest or os.path.join(args.folder, MANIFEST_FILE)
+    try:
+        manifest = Manifest(manifest_path, args.folder, config, restart=args.restart)
+    except ManifestMismatchError as e:
+        print(f"{e}\nRe-run with --restart to start a new run.", file=sys.stderr)
+        return 2
+
+    metrics = MetricsRegistry()
+    started = time.perf_counter()
+    image_files = find_images(args)
+    elapsed = time.perf_counter() - started
+    metrics.observe("scan_seconds", elapsed)
+    metrics.inc("scanned_images_total", len(image_files))
+    print(f"Found {len(image_files)} images in {elapsed:.1f}s")
+    targets = [image_path for image_path in image_files if not manifest.is_done(image_path)]
+    store = CaptionStore(args.store) if args.store else None
+    if store is not None:
+        store.import_sidecars(image_files)
+    if args.only_uncaptioned:
+        if store is not None:
+            uncaptioned = set(store.uncaptioned(args.folder))
+            targets = [image_path for image_path in targets if os.path.abspath(image_path) in uncaptioned]
+        else:
+            targets = [image_path for image_path in targets if not has_caption(image_path)]
+    skipped = len(image_files) - len(targets)
+    if skipped:
+        print(f"Skipping {skipped} images that are already done")
+
+    client = get_async_client(provider, api_key)
+    # Everything recorded about requests is labelled with the provider, so runs against different
+    # backends can be compared from their exported metrics.
+    provider_metrics = metrics.labeled(provider=provider.name)
+    cache = None if args.no_cache else CaptionCache(args.cache_file)
+    scheduler = RequestScheduler(
+        max_concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm, max_retries=args.max_retries,
+        metrics=provider_metrics,
+    )
+    preprocess = get_preprocess_options(args)
+    packer = None
+    if args.pack > 1:
+        packer = PackedCaptioner(
+            client, args.prompt, args.pack, model=provider.model, max_tokens=provider.max_tokens,
+            preprocess=preprocess, cache=cache, scheduler=scheduler, params=provider.params,
+        )
+
+    async def caption_fn(image_path):
+        started = time.perf_counter()
+        if packer is not None:
+            result = await packer.caption(image_path)
+        else:
+            result = await caption_image(
+                client, image_path, args.prompt, model=provider.model, max_tokens=provider.max_tokens,
+                preprocess=preprocess, cache=cache, scheduler=scheduler, params=provider.params,
+            )
+        provider_metrics.observe("caption_seconds", time.perf_counter() - started)
+        record_caption_result(provider_metrics, result, cache_enabled=cache is not None)
+        return result
+
+    last_report = 0.0
+    loop = asyncio.get_running_loop()
+
+    def on_written(image_path, caption, result):
+        # Runs on the writer thread. An image is checkpointed only once its caption is on disk, so
+        # a crash never marks an image done whose caption was still queued.
+        if store is not None:
+            store.put(image_path, caption, result)
+        loop.call_soon_threadsafe(manifest.record, image_path, result)
+
+    def on_write_error(image_path, error):
+        print(f"\nError writing caption for {image_path}: {error}", file=sys.stderr)
+
+    # Sidecars are written by a background thread so the request workers never wait on the disk.
+    writer = CaptionWriter(args.fsync, on_written=on_written, on_error=on_write_error, metrics=metrics)
+
+    def on_progress(image_path, result, error, stats):
+        nonlocal last_report
+        if error is not None:
+            manifest.record(image_path, result, error)
+            print(f"\nError captioning {image_path}: {error}", file=sys.stderr)
+        now = time.perf_counter()
+        finished = stats["done"] + stats["failed"]
+        if now - last_report >= PROGRESS_INTERVAL or finished == stats["total"]:
+            last_report = now
+            print(f"\r{finished}/{stats['total']} ({stats['failed']} failed)", end="", file=sys.stderr, flush=True)
+
+    def save_fn(image_path, result):
+        writer.save(image_path, result.caption, result)
+
+    batch = BatchCaptioner(caption_fn, save_fn, concurrency=args.concurrency, on_progress=on_progress)
+    try:
+        loop.add_signal_handler(signal.SIGINT, batch.cancel)
+    except NotImplementedError:  # Windows
+        pass
+    try:
+        stats = await batch.run(targets)
+    finally:
+        # The manifest records scheduled by on_written run before this coroutine resumes.
+        await asyncio.to_thread(writer.close)
+        manifest.close()
+        if cache is not None:
+            cache.close()
+        if store is not None:
+            store.close()
+    print(file=sys.stderr)
+    provider_metrics.inc("caption_wall_seconds_total", stats["elapsed"])
+    print_summary(stats, skipped, scheduler.stats)
+    for line in describe_providers(metrics):
+        print(f"Provider {line}")
+    if packer is not None:
+        print(f"Packing: {packer.describe_savings()}")
+    if args.metrics:
+        try:
+            metrics.export(args.metrics)
+            print(f"Metrics written to {args.metrics}")
+        except OSError as e:
+            print(f"Error writing metrics to {args.metrics}: {e}", file=sys.stderr)
+    if stats["cancelled"]:
+        return 130
+    return 1 if stats["failed"] else 0
+
+
+def run_store(args):
+    store = CaptionStore(args.store)
+    try:
+        if args.action == "import":
+            image_files = find_images(args)
+            read = store.import_sidecars(image_files)
+            removed = store.prune(args.folder, image_files)
+            print(f"Indexed {len(image_files)} images ({read} new or changed, {removed} stale rows removed)")
+        elif args.action == "export":
+            print(f"Wrote {store.export_sidecars(args.folder)} sidecars")
+        elif args.action == "status":
+            coverage = store.coverage(args.folder)
+            percent = coverage["captioned"] / coverage["images"] if coverage["images"] else 0.0
+            print(
+                f"{coverage['captioned']}/{coverage['images']} images captioned ({percent:.1%}), "
+                f"{coverage['uncaptioned']} uncaptioned, {coverage['errors']} error captions"
+            )
+        elif args.action == "uncaptioned":
+            for image_path in store.uncaptioned(args.folder):
+                print(image_path)
+        elif args.action == "search":
+            if not args.text:
+                print("search needs the text to look for", file=sys.stderr)
+                return 2
+            for image_path, caption in store.search(args.folder, args.text):
+                print(f"{image_path}\t{caption.strip()}")
+    finally:
+        store.close()
+    return 0
+
+
+def run_export(args):
+    preprocess = None
+    if args.max_side > 0 or args.image_format:
+        preprocess = PreprocessOptions(
+            max_side=args.max_side, output_format=args.image_format or DEFAULT_FORMAT, quality=args.quality
+        )
+    if args.overwrite:
+        remove_export(args.output)
+    elif read_export_manifest(args.output) is not None:
+        print(f"{args.output} already holds an export; pass --overwrite to replace it", file=sys.stderr)
+        return 2
+
+    started = time.perf_counter()
+    image_files = find_images(args)
+    print(f"Found {len(image_files)} images in {time.perf_counter() - started:.1f}s")
+    last_report = 0.0
+
+    def on_progress(done, total):
+        nonlocal last_report
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_INTERVAL or done == total:
+            last_report = now
+            print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    try:
+        manifest = export_dataset(
+            image_files, args.folder, args.output, export_format=args.format, shard_size=args.shard_size,
+            max_shard_bytes=int(args.max_shard_mb * 1024 * 1024), preprocess=preprocess,
+            max_workers=args.workers, on_progress=on_progress,
+        )
+    except ExportError as e:
+        print(e, file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        # Without a manifest the output counts as incomplete; the next run writes it again.
+        print("\nCancelled", file=sys.stderr)
+        return 130
+    print(file=sys.stderr)
+    elapsed = manifest["elapsed"]
+    rate = manifest["samples"] / elapsed if elapsed else 0.0
+    skipped = manifest["skipped"]
+    print(
+        f"Exported {manifest['samples']} of {manifest['images']} images into {len(manifest['shards'])} shards "
+        f"({format_bytes(manifest['image_bytes'])} of images) in {elapsed:.1f}s, {rate:.1f} images/s"
+    )
+    print(
+        f"Skipped {skipped['uncaptioned']} uncaptioned and {skipped['error_caption']} with error captions, "
+        f"{len(manifest['failed'])} failed"
+    )
+    if manifest["pattern"]:
+        print(f"Shards: {os.path.join(args.output, manifest['pattern'])}")
+    return 1 if manifest["failed"] else 0
+
+
+def run_verify_export(args):
+    try:
+        bad = verify_export(args.output)
+    except ExportError as e:
+        print(e, file=sys.stderr)
+        return 2
+    for file in bad:
+        print(f"{file}: missing or checksum mismatch")
+    if not bad:
+        print("All shards match the manifest")
+    return 1 if bad else 0
+
+
+def print_job_status(job):
+    counts = ", ".join(f"{count} {status}" for status, count in sorted(job.summary().items()))
+    print(f"{len(job.custom_ids)} requests in {len(job.shards)} shards: {counts}")
+
+
+def run_batch(args):
+    try:
+        return run_batch_action(args)
+    except openai.OpenAIError as e:
+        # The job state is saved after every step, so the same command can simply be re-run.
+        print(f"Batch API error: {e}", file=sys.stderr)
+        return 1
+    except OSError as e:
+        # e.g. captions that couldn't be written; their shard stays unapplied.
+        print(e, file=sys.stderr)
+        return 1
+
+
+def run_batch_action(args):
+    job_dir = args.job or os.path.join(args.folder, DEFAULT_JOB_DIR)
+    provider = get_provider(args)
+    if provider is None:
+        return 2
+    if args.action == "submit" and getattr(args, "no_submit", False):
+        client = None
+    else:
+        api_key = get_api_key(args, provider)
+        if not api_key:
+            return 2
+        client = create_sync_client(provider, api_key)
+
+    if args.action == "submit":
+        config = get_caption_config(args, provider)
+        job = BatchJob.load(job_dir) if BatchJob.exists(job_dir) else None
+        if job is not None and not job.finished and not args.restart:
+            if job.config != config:
+                print(
+                    f"{job_dir} holds an unfinished job with different settings: {job.config}\n"
+                    "Apply it first or re-run with --restart.", file=sys.stderr
+                )
+                return 2
+            print("Resuming the unfinished job")
+        else:
+            job = BatchJob(job_dir, os.path.abspath(args.folder), config)
+            image_files = find_images(args)
+            if args.only_uncaptioned:
+                image_files = [image_path for image_path in image_files if not has_caption(image_path)]
+            print(f"Preparing {len(image_files)} requests")
+            skipped = job.write_shards(
+                image_files,
+                get_preprocess_options(args),
+                on_progress=lambda done, total: print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True),
+            )
+            print(file=sys.stderr)
+            print(f"Wrote {len(job.shards)} shards to {job_dir} ({len(skipped)} images skipped)")
+        if client is not None:
+            print(f"Submitted {job.submit(client)} shards")
+        print_job_status(job)
+        return 0
+
+    if not BatchJob.exists(job_dir):
+        print(f"No batch job in {job_dir}; run `batch submit` first.", file=sys.stderr)
+        return 2
+    job = BatchJob.load(job_dir)
+    if args.action == "status":
+        job.refresh(client)
+        for shard in job.shards:
+            print(
+                f"{shard['file']}: {shard.get('status', 'not submitted')}, {shard['requests']} requests "
+                f"({shard.get('completed', 0)} completed, {shard.get('failed', 0)} failed)"
+                + (", applied" if shard.get("applied") else "")
+            )
+        print_job_status(job)
+        return 0
+
+    if args.wait:
+        job.wait(client, args.poll_interval, on_status=print_job_status)
+    else:
+        job.refresh(client)
+    store = CaptionStore(args.store) if args.store else None
+    write_errors = []
+
+    def on_written(image_path, caption, result):
+        if store is not None:
+            store.put(image_path, caption, result)
+
+    def on_write_error(image_path, error):
+        print(f"Error writing caption for {image_path}: {error}", file=sys.stderr)
+        write_errors.append(image_path)
+
+    writer = CaptionWriter(args.fsync, on_written=on_written, on_error=on_write_error)
+
+    def save_fn(image_path, result):
+        writer.save(image_path, result.caption, result)
+
+    def flush_fn():
+        # A shard is only marked applied once all of its captions are on disk.
+        writer.flush()
+        if write_errors:
+            raise OSError(f"{len(write_errors)} captions could not be written; run `batch apply` again")
+
+    def on_error(image_path, error):
+        print(f"Error captioning {image_path}: {error}", file=sys.stderr)
+
+    try:
+        applied, failed = job.apply(client, save_fn, on_error, flush_fn)
+    finally:
+        writer.close()
+        if store is not None:
+            store.close()
+    print(f"Applied {applied} captions ({failed} failed)")
+    print_job_status(job)
+    if any(not shard.get("batch_id") for shard in job.shards):
+        print("Some shards were never submitted; run `batch submit` again to submit them.")
+    elif not job.finished:
+        print("Some shards are still running; run `batch apply` again later (or pass --wait).")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    load_dotenv()
+    args = build_parser().parse_args(argv)
+    if args.command == "caption":
+        return asyncio.run(run_caption(args))
+    if args.command == "store":
+        return run_store(args)
+    if args.command == "batch":
+        return run_batch(args)
+    if args.command == "export":
+        return run_export(args)
+    if args.command == "verify-export":
+        return run_verify_export(args)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# src/components/batch.py
+import asyncio
+import time
+
+DEFAULT_CONCURRENCY = 16
+
+
+class BatchCaptioner:
+    # Captions a list of images with a fixed pool of worker tasks pulling from a queue,
+    # so at most `concurrency` requests are in flight no matter how large the folder is.
+    #
+    # caption_fn(image_path) -> awaitable CaptionResult
+    # save_fn(image_path, result) is called with the CaptionResult of every successful caption.
+    # on_progress(image_path, result, error, stats) is called after every image, on the event loop;
+    # result is None when the image failed.
+
+    def __init__(self, caption_fn, save_fn, concurrency=DEFAULT_CONCURRENCY, on_progress=None):
+        self.caption_fn = caption_fn
+        self.save_fn = save_fn
+        self.concurrency = max(1, int(concurrency))
+        self.on_progress = on_progress
+        self.stats = {
+            "total": 0,
+            "done": 0,
+            "failed": 0,
+            "cached": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "original_bytes": 0,
+            "upload_bytes": 0,
+            "elapsed": 0.0,
+            "cancelled": False,
+        }
+        self._workers = []
+        self._loop = None
+        self._cancelled = False
+
+    @property
+    def running(self):
+        return any(not w.done() for w in self._workers)
+
+    def cancel(self):
+        # Safe to call from any thread (Flet runs sync handlers in a thread pool).
+        self._cancelled = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._cancel_workers)
+
+    def _cancel_workers(self):
+        for worker in self._workers:
+            worker.cancel()
+
+    async def _worker(self, queue):
+        while True:
+            try:
+                image_path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            result = None
+            error = None
+            try:
+                result = await self.caption_fn(image_path)
+                self.save_fn(image_path, result)
+                self.stats["done"] += 1
+                self.stats["cached"] += result.cached
+                self.stats["prompt_tokens"] += result.prompt_tokens
+                self.stats["completion_tokens"] += result.completion_tokens
+                self.stats["original_bytes"] += result.original_bytes
+                self.stats["upload_bytes"] += result.upload_bytes
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result = None
+                error = e
+                self.stats["failed"] += 1
+            if self.on_progress:
+                self.on_progress(image_path, result, error, self.stats)
+
+    async def run(self, image_paths):
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        for image_path in image_paths:
+            queue.put_nowait(image_path)
+        self.stats["total"] = queue.qsize()
+
+        started = time.perf_counter()
+        self._workers = [
+            asyncio.create_task(self._worker(queue))
+            for _ in range(min(self.concurrency, queue.qsize()))
+        ]
+        if self._cancelled:
+            self._cancel_workers()
+        try:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        finally:
+            self.stats["elapsed"] = time.perf_counter() - started
+            self.stats["cancelled"] = self._cancelled
+        return self.stats
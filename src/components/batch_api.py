@@ -0,0 +1,251 @@
+# src/components/batch_api.py
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from components.captioning import CaptionResult, build_messages
+from components.preprocess import prepare_image
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+# Default job directory inside the dataset folder; hidden, so folder scans skip it.
+DEFAULT_JOB_DIR = ".caption_batch"
+STATE_FILE = "job.json"
+
+# Batch API input files may hold at most 50,000 requests and 200 MB; stay a little under the size cap.
+MAX_SHARD_REQUESTS = 50_000
+MAX_SHARD_BYTES = 190 * 1024 * 1024
+
+# Images are prepared in chunks so memory holds one chunk of encoded images, not the whole job.
+PREPARE_CHUNK_SIZE = 256
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def build_request_line(custom_id, prompt, image_url, model, max_tokens, params=None):
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": model, "messages": build_messages(prompt, image_url), "max_tokens": max_tokens, **(params or {})
+        },
+    }
+
+
+class BatchJob:
+    # An offline Batch API captioning job. The request shards and a JSON state file live in one
+    # directory, so preparing, submitting, polling and applying can happen in separate runs
+    # (results can take up to 24 hours). Images are referred to by custom_id in the requests;
+    # the state maps them back to paths relative to the dataset root.
+
+    def __init__(self, directory, root, config, custom_ids=None, shards=None):
+        self.directory = directory
+        self.root = root
+        self.config = config
+        self.custom_ids = custom_ids or {}  # custom_id -> image path relative to root
+        self.shards = shards or []
+
+    @classmethod
+    def exists(cls, directory):
+        return os.path.exists(os.path.join(directory, STATE_FILE))
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, STATE_FILE), encoding="utf-8") as f:
+            state = json.load(f)
+        return cls(directory, state["root"], state["config"], state["custom_ids"], state["shards"])
+
+    def save(self):
+        path = os.path.join(self.directory, STATE_FILE)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"root": self.root, "config": self.config, "custom_ids": self.custom_ids, "shards": self.shards}, f
+            )
+        os.replace(temp_path, path)
+
+    @property
+    def finished(self):
+        return bool(self.shards) and all(shard.get("applied") for shard in self.shards)
+
+    def image_path(self, custom_id):
+        rel_path = self.custom_ids.get(custom_id)
+        return os.path.join(self.root, rel_path) if rel_path is not None else None
+
+    def write_shards(self, image_paths, preprocess=None, workers=8, on_progress=None):
+        # Prepares every image (resize/re-encode as for live requests) and writes the request
+        # lines, starting a new shard whenever the request or byte limit would be exceeded.
+        # Images that can't be read are skipped and returned.
+        os.makedirs(self.directory, exist_ok=True)
+        prompt, model, max_tokens = self.config["prompt"], self.config["model"], self.config["max_tokens"]
+        params = self.config.get("params")
+        skipped = []
+        shard_file = None
+        shard = None
+
+        def prepare(image_path):
+            try:
+                return prepare_image(image_path, preprocess)
+            except Exception as e:
+                print(f"Error preparing {image_path}: {e}")
+                return None
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for start in range(0, len(image_paths), PREPARE_CHUNK_SIZE):
+                    chunk = image_paths[start:start + PREPARE_CHUNK_SIZE]
+                    for image_path, prepared in zip(chunk, executor.map(prepare, chunk)):
+                        if prepared is None:
+                            skipped.append(image_path)
+                            continue
+                        custom_id = f"img-{len(self.custom_ids)}"
+                        line = json.dumps(
+                            build_request_line(custom_id, prompt, prepared.data_url(), model, max_tokens, params)
+                        ).encode("utf-8") + b"\n"
+                        if shard is None or (
+                            shard["requests"] >= MAX_SHARD_REQUESTS or shard["bytes"] + len(line) > MAX_SHARD_BYTES
+                        ):
+                            if shard_file is not None:
+                                shard_file.close()
+                            shard = {"file": f"shard-{len(self.shards) + 1:04d}.jsonl", "requests": 0, "bytes": 0}
+                            self.shards.append(shard)
+                            shard_file = open(os.path.join(self.directory, shard["file"]), "wb")
+                        shard_file.write(line)
+                        shard["requests"] += 1
+                        shard["bytes"] += len(line)
+                        self.custom_ids[custom_id] = os.path.relpath(image_path, self.root)
+                    if on_progress is not None:
+                        on_progress(min(start + PREPARE_CHUNK_SIZE, len(image_paths)), len(image_paths))
+        finally:
+            if shard_file is not None:
+                shard_file.close()
+        self.save()
+        return skipped
+
+    def submit(self, client):
+        # Uploads and starts every shard that hasn't been submitted yet; the state is saved after
+        # each one, so a failed upload can be retried without creating duplicate batches.
+        submitted = 0
+        for shard in self.shards:
+            if shard.get("batch_id"):
+                continue
+            if not shard.get("input_file_id"):
+                with open(os.path.join(self.directory, shard["file"]), "rb") as f:
+                    shard["input_file_id"] = client.files.create(file=f, purpose="batch").id
+                self.save()
+            batch = client.batches.create(
+                input_file_id=shard["input_file_id"],
+                endpoint=BATCH_ENDPOINT,
+                completion_window=COMPLETION_WINDOW,
+                metadata={"shard": shard["file"]},
+            )
+            shard["batch_id"] = batch.id
+            shard["status"] = batch.status
+            self.save()
+            submitted += 1
+        return submitted
+
+    def refresh(self, client):
+        for shard in self.shards:
+            if not shard.get("batch_id") or shard.get("status") in TERMINAL_STATUSES:
+                continue
+            batch = client.batches.retrieve(shard["batch_id"])
+            shard["status"] = batch.status
+            shard["output_file_id"] = batch.output_file_id
+            shard["error_file_id"] = batch.error_file_id
+            if batch.request_counts is not None:
+                shard["completed"] = batch.request_counts.completed
+                shard["failed"] = batch.request_counts.failed
+        self.save()
+
+    def wait(self, client, poll_interval=60.0, on_status=None):
+        while True:
+            self.refresh(client)
+            if on_status is not None:
+                on_status(self)
+            if all(shard.get("status") in TERMINAL_STATUSES for shard in self.shards if shard.get("batch_id")):
+                return
+            time.sleep(poll_interval)
+
+    def shard_custom_ids(self, shard):
+        # custom_ids are numbered in write order across shards, so a shard holds the ids that
+        # follow every request in the shards before it.
+        first = 0
+        for other in self.shards:
+            if other is shard:
+                break
+            first += other["requests"]
+        return [f"img-{n}" for n in range(first, first + shard["requests"])]
+
+    def apply(self, client, save_fn, on_error=None, flush_fn=None):
+        # Downloads the results of every finished, not yet applied shard and hands each caption to
+        # save_fn(image_path, result). Failed requests, and requests with no result at all (an
+        # expired, cancelled or failed batch), go to on_error(image_path, error). If save_fn only
+        # queues the writes, flush_fn() is called before a shard is marked applied and should
+        # raise if any of them failed. Returns (applied, failed) counts.
+        applied = failed = 0
+        for shard in self.shards:
+            if shard.get("applied") or shard.get("status") not in TERMINAL_STATUSES:
+                continue
+            pending = set(self.shard_custom_ids(shard))
+            if shard.get("output_file_id"):
+                for record in self._read_results(client, shard["output_file_id"]):
+                    image_path = self._result_path(record, pending)
+                    if image_path is None:
+                        continue
+                    response = record.get("response") or {}
+                    body = response.get("body") or {}
+                    if record.get("error") or response.get("status_code") != 200 or not body.get("choices"):
+                        failed += 1
+                        if on_error is not None:
+                            on_error(image_path, record.get("error") or body.get("error"))
+                        continue
+                    usage = body.get("usage") or {}
+                    save_fn(image_path, CaptionResult(
+                        caption=body["choices"][0]["message"].get("content") or "",
+                        model=body.get("model", self.config["model"]),
+                        prompt=self.config["prompt"],
+                        prompt_tokens=usage.get("prompt_tokens", 0),
+                        completion_tokens=usage.get("completion_tokens", 0),
+                    ))
+                    applied += 1
+            if shard.get("error_file_id"):
+                for record in self._read_results(client, shard["error_file_id"]):
+                    image_path = self._result_path(record, pending)
+                    if image_path is not None:
+                        failed += 1
+                        if on_error is not None:
+                            on_error(image_path, record.get("error") or record.get("response"))
+            for custom_id in sorted(pending, key=lambda custom_id: int(custom_id.split("-")[1])):
+                failed += 1
+                if on_error is not None:
+                    on_error(self.image_path(custom_id), {"message": f"No result (batch {shard['status']})"})
+            if flush_fn is not None:
+                flush_fn()
+            shard["applied"] = True
+            self.save()
+        return applied, failed
+
+    def _result_path(self, record, pending):
+        # Maps a result line back to its image, once; unknown or repeated ids are reported and skipped.
+        custom_id = record.get("custom_id")
+        if custom_id not in pending:
+            print(f"Ignoring batch result for unknown or repeated custom_id {custom_id!r}")
+            return None
+        pending.discard(custom_id)
+        return self.image_path(custom_id)
+
+    @staticmethod
+    def _read_results(client, file_id):
+        for line in client.files.content(file_id).text.splitlines():
+            if line.strip():
+                yield json.loads(line)
+
+    def summary(self):
+        counts = {}
+        for shard in self.shards:
+            status = "applied" if shard.get("applied") else shard.get("status", "not submitted")
+            counts[status] = counts.get(status, 0) + 1
+        return counts
@@ -0,0 +1,131 @@
+# src/components/caption_cache.py
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+
+from components.preprocess import PreprocessOptions
+
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CaptionCache:
+    # Persistent caption cache keyed by image content, prompt and request settings.
+    # Entries are evicted least-recently-used first once either limit is exceeded.
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS captions ("
+            " key TEXT PRIMARY KEY,"
+            " caption TEXT NOT NULL,"
+            " prompt_tokens INTEGER NOT NULL,"
+            " completion_tokens INTEGER NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS captions_last_access ON captions (last_access)")
+        self._conn.commit()
+        self._entries, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM captions"
+        ).fetchone()
+
+    @staticmethod
+    def make_key(image_hash, prompt, model, max_tokens, preprocess=None, params=None):
+        # The uploaded bytes depend on the preprocessing settings, so they are part of the key too,
+        # as are extra request parameters. Without any, keys match those from before params existed.
+        fields = [image_hash, prompt, model, max_tokens, asdict(preprocess or PreprocessOptions())]
+        if params:
+            fields.append(params)
+        payload = json.dumps(fields, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT caption, prompt_tokens, completion_tokens FROM captions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE captions SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row
+
+    def put(self, key, caption, prompt_tokens=0, completion_tokens=0):
+        size = len(caption.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM captions WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO captions VALUES (?, ?, ?, ?, ?, ?)",
+                (key, caption, prompt_tokens, completion_tokens, size, time.time()),
+            )
+            if old is None:
+                self._entries += 1
+                self._bytes += size
+            else:
+                self._bytes += size - old[0]
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self._entries <= self.max_entries and self._bytes <= self.max_bytes:
+            return
+        # Evict down to 95% of both limits so a full cache doesn't run this on every put.
+        target_entries = self.max_entries * 95 // 100
+        target_bytes = self.max_bytes * 95 // 100
+        while self._entries > target_entries or self._bytes > target_bytes:
+            rows = self._conn.execute("SELECT key, size FROM captions ORDER BY last_access LIMIT 500").fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                if self._entries <= target_entries and self._bytes <= target_bytes:
+                    break
+                evicted.append((key,))
+                self._entries -= 1
+                self._bytes -= size
+            self._conn.executemany("DELETE FROM captions WHERE key = ?", evicted)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM captions")
+            self._conn.commit()
+            self._entries = 0
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._entries,
+            "bytes": self._bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,192 @@
+# src/components/caption_store.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from components.captioning import ERROR_PREFIX
+from components.sidecars import caption_path_for, write_caption
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16] if prompt else None
+
+
+def _prefix_range(folder):
+    # Paths under folder sort from "folder/" up to (not including) "folder0", the separator's
+    # successor, so prefix queries use the primary key. An upper bound like "folder/" + U+FFFF
+    # would miss names continuing with characters outside the BMP, such as emoji.
+    prefix = os.path.join(os.path.abspath(folder), "")
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class CaptionStore:
+    # SQLite index of captions keyed by absolute image path, kept alongside the .txt sidecars
+    # (which stay the source of truth). Every scanned image gets a row; caption is NULL when
+    # the image has no sidecar, so coverage queries never have to touch the filesystem.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS captions ("
+            " path TEXT PRIMARY KEY,"
+            " caption TEXT,"
+            " caption_mtime REAL,"
+            " model TEXT,"
+            " prompt_hash TEXT,"
+            " prompt_tokens INTEGER NOT NULL DEFAULT 0,"
+            " completion_tokens INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def put(self, image_path, caption, result=None):
+        image_path = os.path.abspath(image_path)
+        try:
+            caption_mtime = os.stat(caption_path_for(image_path)).st_mtime
+        except OSError:
+            caption_mtime = None
+        row = (
+            image_path,
+            caption,
+            caption_mtime,
+            result.model if result else None,
+            prompt_hash(result.prompt) if result else None,
+            result.prompt_tokens if result else 0,
+            result.completion_tokens if result else 0,
+            time.time(),
+        )
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO captions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+            self._conn.commit()
+
+    def get(self, image_path):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT caption FROM captions WHERE path = ?", (os.path.abspath(image_path),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def remove(self, image_paths):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM captions WHERE path = ?", [(os.path.abspath(p),) for p in image_paths]
+            )
+            self._conn.commit()
+
+    def import_sidecars(self, image_paths):
+        # Bulk-loads the sidecars of image_paths. Sidecars whose mtime matches the stored one are
+        # not re-read, so re-importing a folder costs one stat per image. Returns the number of rows
+        # added or updated.
+        image_paths = [os.path.abspath(p) for p in image_paths]
+        known = {}
+        with self._lock:
+            for start in range(0, len(image_paths), 500):
+                batch = image_paths[start:start + 500]
+                known.update(self._conn.execute(
+                    f"SELECT path, caption_mtime FROM captions WHERE path IN ({','.join('?' * len(batch))})",
+                    batch,
+                ))
+        rows = []
+        now = time.time()
+        for image_path in image_paths:
+            caption_file_path = caption_path_for(image_path)
+            try:
+                caption_mtime = os.stat(caption_file_path).st_mtime
+            except OSError:
+                caption_mtime = None
+            if image_path in known and known[image_path] == caption_mtime:
+                continue
+            caption = None
+            if caption_mtime is not None:
+                try:
+                    with open(caption_file_path) as f:
+                        caption = f.read()
+                except OSError as e:
+                    print(f"Error reading {caption_file_path}: {e}")
+                    continue
+            rows.append((image_path, caption, caption_mtime, now))
+        with self._lock:
+            # Keep model/prompt/token metadata for rows that already exist.
+            self._conn.executemany(
+                "INSERT INTO captions (path, caption, caption_mtime, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET caption = excluded.caption, "
+                "caption_mtime = excluded.caption_mtime, updated_at = excluded.updated_at",
+                rows,
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def prune(self, folder, image_paths):
+        # Drops rows under folder for images that no longer exist. Returns the number removed.
+        low, high = _prefix_range(folder)
+        existing = {os.path.abspath(p) for p in image_paths}
+        with self._lock:
+            stale = [
+                (row[0],) for row in self._conn.execute(
+                    "SELECT path FROM captions WHERE path >= ? AND path < ?", (low, high)
+                ) if row[0] not in existing
+            ]
+            self._conn.executemany("DELETE FROM captions WHERE path = ?", stale)
+            self._conn.commit()
+        return len(stale)
+
+    def export_sidecars(self, folder):
+        # Writes every stored caption under folder back to its sidecar. Returns the number written.
+        low, high = _prefix_range(folder)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, caption FROM captions WHERE path >= ? AND path < ? AND caption IS NOT NULL",
+                (low, high),
+            ).fetchall()
+        for image_path, caption in rows:
+            write_caption(image_path, caption)
+        return len(rows)
+
+    def coverage(self, folder):
+        low, high = _prefix_range(folder)
+        with self._lock:
+            images, captioned, errors = self._conn.execute(
+                "SELECT COUNT(*),"
+                " COALESCE(SUM(caption IS NOT NULL AND TRIM(caption) != ''), 0),"
+                " COALESCE(SUM(caption LIKE ? || '%'), 0)"
+                " FROM captions WHERE path >= ? AND path < ?",
+                (ERROR_PREFIX, low, high),
+            ).fetchone()
+        return {"images": images, "captioned": captioned, "uncaptioned": images - captioned, "errors": errors}
+
+    def uncaptioned(self, folder):
+        low, high = _prefix_range(folder)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM captions WHERE path >= ? AND path < ?"
+                " AND (caption IS NULL OR TRIM(caption) = '') ORDER BY path",
+                (low, high),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def captions(self, folder):
+        low, high = _prefix_range(folder)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, caption FROM captions WHERE path >= ? AND path < ?", (low, high)
+            ).fetchall()
+
+    def search(self, folder, text):
+        low, high = _prefix_range(folder)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, caption FROM captions WHERE path >= ? AND path < ?"
+                " AND caption LIKE ? ESCAPE '\\' ORDER BY path",
+                (low, high, "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"),
+            ).fetchall()
+        return rows
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,119 @@
+# src/components/caption_writer.py
+import os
+import threading
+import time
+
+from components.sidecars import fsync_directory, write_caption
+
+# How hard each caption write is pushed to disk. Every policy replaces sidecars atomically, so
+# an app crash never leaves a truncated caption; the fsync policies also cover power loss.
+FSYNC_NONE = "none"  # leave flushing to the OS
+FSYNC_FILE = "file"  # fsync each caption before it replaces the old one
+FSYNC_FULL = "full"  # also fsync the directories, once per batch, so the renames are durable
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_FILE, FSYNC_FULL)
+DEFAULT_FSYNC = FSYNC_FILE
+
+
+class CaptionWriter:
+    # Write-behind queue for caption sidecars. save() only records the caption and returns; a
+    # background thread writes everything queued since its last pass. Saving an image again before
+    # its caption was written replaces the queued caption, so only the latest one hits the disk.
+    # get() returns captions that are saved but not written yet, so readers see their own writes.
+    #
+    # on_written(image_path, caption, context) and on_error(image_path, error) are called from
+    # the writer thread; context is whatever was passed to save() with that caption (e.g. the
+    # CaptionResult to record once the sidecar exists). close() writes whatever is still queued.
+    # With a MetricsRegistry, the time to write each sidecar goes to caption_write_seconds.
+
+    def __init__(self, fsync=DEFAULT_FSYNC, on_written=None, on_error=None, metrics=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}; expected one of {', '.join(FSYNC_POLICIES)}")
+        self.fsync = fsync
+        self.on_written = on_written
+        self.on_error = on_error
+        self.metrics = metrics
+        self._pending = {}  # image_path -> (caption, context)
+        self._writing = {}  # the batch being written right now
+        self._cond = threading.Condition()
+        self._closed = False
+        self.stats = {"saved": 0, "coalesced": 0, "written": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="caption-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, image_path, caption, context=None):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Caption writer is closed")
+            self.stats["saved"] += 1
+            if image_path in self._pending:
+                self.stats["coalesced"] += 1
+            self._pending[image_path] = (caption, context)
+            self._cond.notify()
+
+    def get(self, image_path):
+        # The caption saved for image_path that isn't on disk yet, or None.
+        with self._cond:
+            entry = self._pending.get(image_path) or self._writing.get(image_path)
+        return entry[0] if entry is not None else None
+
+    def discard(self, image_path):
+        # Drops a queued caption, e.g. because its image was deleted.
+        with self._cond:
+            self._pending.pop(image_path, None)
+
+    def flush(self, timeout=None):
+        # Waits until everything saved so far is written. Returns False on timeout.
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _report_error(self, image_path, error):
+        if self.on_error is None:
+            print(f"Error writing caption for {image_path}: {error}")
+            return
+        try:
+            self.on_error(image_path, error)
+        except Exception as e:
+            print(f"Error reporting failed caption write for {image_path}: {e}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, {}
+                self._writing = batch
+                fsync = self.fsync
+            written = []
+            directories = set()
+            for image_path, (caption, context) in batch.items():
+                started = time.perf_counter()
+                try:
+                    write_caption(image_path, caption, fsync=fsync != FSYNC_NONE)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    self._report_error(image_path, e)
+                    continue
+                if self.metrics is not None:
+                    self.metrics.observe("caption_write_seconds", time.perf_counter() - started)
+                written.append((image_path, caption, context))
+                if fsync == FSYNC_FULL:
+                    directories.add(os.path.dirname(image_path))
+            for directory in directories:
+                fsync_directory(directory)
+            self.stats["written"] += len(written)
+            if self.on_written is not None:
+                for image_path, caption, context in written:
+                    try:
+                        self.on_written(image_path, caption, context)
+                    except Exception as e:
+                        print(f"Error after writing caption for {image_path}: {e}")
+            with self._cond:
+                self._writing = {}
+                self._cond.notify_all()
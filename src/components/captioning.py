@@ -0,0 +1,105 @@
+# src/components/captioning.py
+import asyncio
+import math
+from dataclasses import dataclass
+
+import openai
+
+from components.caption_cache import hash_file
+from components.preprocess import prepare_image
+
+DEFAULT_MODEL = "gpt-4o"
+DEFAULT_PROMPT = "Write a caption for this image as if it was going to be used to train a vision model."
+DEFAULT_MAX_TOKENS = 300
+
+ERROR_PREFIX = "Error generating caption"
+
+
+@dataclass
+class CaptionResult:
+    caption: str
+    model: str = ""
+    prompt: str = ""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    original_bytes: int = 0
+    upload_bytes: int = 0
+    cached: bool = False
+
+
+def error_caption(error):
+    # What the single-image path shows in place of a caption once a request has failed for good
+    # (after the scheduler's retries); the prefix lets search and the store count it as an error.
+    if isinstance(error, FileNotFoundError):
+        return f"{ERROR_PREFIX}: Image file not found."
+    if isinstance(error, openai.APIError):
+        return f"{ERROR_PREFIX}: API error: {error}"
+    return f"{ERROR_PREFIX}."
+
+
+def estimate_image_tokens(width, height):
+    # High-detail vision pricing: fit within 2048x2048, scale the shortest side down to 768,
+    # then 170 tokens per 512px tile plus a base of 85.
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def estimate_request_tokens(prompt, width, height, max_tokens):
+    # Rate limits count max_tokens against the budget up front, so include it in full.
+    return len(prompt) // 4 + estimate_image_tokens(width, height) + max_tokens
+
+
+def build_messages(prompt, image_url):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": image_url}},
+            ],
+        }
+    ]
+
+
+async def caption_image(client, image_path, prompt, model=DEFAULT_MODEL, max_tokens=DEFAULT_MAX_TOKENS,
+                        preprocess=None, cache=None, scheduler=None, params=None):
+    # params holds extra request arguments for the backend (e.g. temperature); clients come from
+    # components.providers.
+    if cache is not None:
+        image_hash = await asyncio.to_thread(hash_file, image_path)
+        cache_key = cache.make_key(image_hash, prompt, model, max_tokens, preprocess, params)
+        row = await asyncio.to_thread(cache.get, cache_key)
+        if row is not None:
+            return CaptionResult(caption=row[0], model=model, prompt=prompt, cached=True)
+
+    # Decoding, resizing and encoding a large file would stall the event loop, so do it in a worker thread.
+    prepared = await asyncio.to_thread(prepare_image, image_path, preprocess)
+    messages = build_messages(prompt, prepared.data_url())
+
+    async def request():
+        return await client.chat.completions.create(
+            model=model, messages=messages, max_tokens=max_tokens, **(params or {})
+        )
+
+    if scheduler is None:
+        response = await request()
+    else:
+        estimated_tokens = estimate_request_tokens(prompt, prepared.width, prepared.height, max_tokens)
+        response = await scheduler.run(request, estimated_tokens=estimated_tokens)
+        scheduler.record_tokens(estimated_tokens, response.usage.total_tokens if response.usage else 0)
+    usage = response.usage
+    result = CaptionResult(
+        caption=response.choices[0].message.content or "",
+        model=model,
+        prompt=prompt,
+        prompt_tokens=usage.prompt_tokens if usage else 0,
+        completion_tokens=usage.completion_tokens if usage else 0,
+        original_bytes=prepared.original_bytes,
+        upload_bytes=prepared.upload_bytes,
+    )
+    if cache is not None and result.caption:
+        await asyncio.to_thread(cache.put, cache_key, result.caption, result.prompt_tokens, result.completion_tokens)
+    return result
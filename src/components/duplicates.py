@@ -0,0 +1,216 @@
+# src/components/duplicates.py
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image, ImageOps
+
+HASH_SIZE = 8  # 64-bit hashes
+# Resizes and recompressions of the same image usually land within a few bits; burst shots a
+# few more. Above ~10 of 64 bits unrelated images start to match.
+DEFAULT_MAX_DISTANCE = 6
+HASH_CHUNK_SIZE = 64
+HASH_CACHE_FILE = "phash.json"
+
+
+def dhash(image_path, hash_size=HASH_SIZE):
+    # Difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale copy,
+    # set where brightness drops left to right. Robust to scaling, recompression and small
+    # colour changes.
+    with Image.open(image_path) as img:
+        img.draft("L", (hash_size * 4, hash_size * 4))
+        small = ImageOps.exif_transpose(img).convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hash_chunk(image_paths):
+    # Runs in a worker process; hashing a chunk per task keeps the IPC overhead small.
+    results = []
+    for image_path in image_paths:
+        try:
+            results.append((image_path, dhash(image_path)))
+        except Exception as e:
+            print(f"Error hashing {image_path}: {e}")
+            results.append((image_path, None))
+    return results
+
+
+if hasattr(int, "bit_count"):  # Python 3.10+
+    def hamming(a, b):
+        return (a ^ b).bit_count()
+else:
+    def hamming(a, b):
+        return bin(a ^ b).count("1")
+
+
+class HashIndex:
+    # Hamming-distance lookup by multi-index hashing. Hashes are split into max_distance + 1
+    # bands; two hashes within max_distance bits must agree exactly on at least one band
+    # (pigeonhole), so a lookup only compares against hashes sharing a band value instead of
+    # every hash in the folder. (A BK-tree degrades to a near-linear scan here: at these
+    # radii most of its branches stay within reach of a 64-bit query.)
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, bits=HASH_SIZE * HASH_SIZE):
+        self.max_distance = max_distance
+        band_count = min(max_distance + 1, bits)
+        self._bands = []  # (shift, mask)
+        shift = 0
+        for band in range(band_count):
+            width = bits // band_count + (1 if band < bits % band_count else 0)
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+        self._tables = [{} for _ in self._bands]
+        self._values = []  # (hash, item)
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, value, item):
+        index = len(self._values)
+        self._values.append((value, item))
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            table.setdefault((value >> shift) & mask, []).append(index)
+
+    def search(self, value):
+        # Returns [(distance, item)] for every item within max_distance of value.
+        candidates = set()
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            candidates.update(table.get((value >> shift) & mask, ()))
+        matches = []
+        for index in candidates:
+            other, item = self._values[index]
+            distance = hamming(value, other)
+            if distance <= self.max_distance:
+                matches.append((distance, item))
+        return matches
+
+
+class HashCache:
+    # Perceptual hashes persisted as JSON next to the thumbnails, keyed by path, mtime and size,
+    # so re-checking a folder only hashes new or changed images.
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, HASH_CACHE_FILE)
+        self._hashes = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._hashes = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def key(image_path):
+        stat = os.stat(image_path)
+        return f"{os.path.abspath(image_path)}|{stat.st_mtime_ns}|{stat.st_size}"
+
+    def get(self, key):
+        return self._hashes.get(key)
+
+    def put(self, key, value):
+        self._hashes[key] = value
+
+    def prune(self, keys, directories):
+        # Drops entries for images in the scanned directories that aren't among the current keys:
+        # deleted files, and files whose mtime or size has changed since they were hashed. Other
+        # folders' entries are kept, as the cache is shared by every dataset. Returns the number dropped.
+        stale = [
+            key for key in self._hashes
+            if key not in keys and os.path.dirname(key.rsplit("|", 2)[0]) in directories
+        ]
+        for key in stale:
+            del self._hashes[key]
+        return len(stale)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._hashes, f)
+        os.replace(tmp_path, self.path)
+
+
+def compute_hashes(image_paths, cache=None, max_workers=None, should_stop=None, on_progress=None):
+    # Returns {image_path: hash}, hashing uncached images in a process pool. Images that can't
+    # be read are left out. on_progress(done, total) is called as chunks finish.
+    hashes = {}
+    missing = {}
+    keys = set()
+    for image_path in image_paths:
+        try:
+            key = HashCache.key(image_path) if cache is not None else None
+        except OSError:
+            continue
+        keys.add(key)
+        value = cache.get(key) if cache is not None else None
+        if value is None:
+            missing[image_path] = key
+        else:
+            hashes[image_path] = value
+    pruned = 0
+    if cache is not None:
+        pruned = cache.prune(keys, {os.path.dirname(os.path.abspath(image_path)) for image_path in image_paths})
+    total = len(image_paths)
+    if on_progress is not None:
+        on_progress(len(hashes), total)
+    if missing:
+        paths = list(missing)
+        chunks = [paths[start:start + HASH_CHUNK_SIZE] for start in range(0, len(paths), HASH_CHUNK_SIZE)]
+        # spawn rather than fork: the UI process is multi-threaded.
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(hash_chunk, chunk) for chunk in chunks]
+            try:
+                for future in as_completed(futures):
+                    for image_path, value in future.result():
+                        if value is not None:
+                            hashes[image_path] = value
+                            if cache is not None:
+                                cache.put(missing[image_path], value)
+                    if on_progress is not None:
+                        on_progress(len(hashes), total)
+                    if should_stop is not None and should_stop():
+                        break
+            finally:
+                for future in futures:
+                    future.cancel()
+    if cache is not None and (missing or pruned):
+        cache.save()
+    return hashes
+
+
+def group_duplicates(image_paths, hashes, max_distance=DEFAULT_MAX_DISTANCE):
+    # Groups images whose hashes are within max_distance bits of each other (transitively).
+    # Returns groups of two or more paths, each in image_paths order, ordered by their first image.
+    order = {image_path: index for index, image_path in enumerate(image_paths)}
+    index = HashIndex(max_distance)
+    parent = {}
+
+    def find(image_path):
+        while parent[image_path] != image_path:
+            parent[image_path] = parent[parent[image_path]]
+            image_path = parent[image_path]
+        return image_path
+
+    for image_path in image_paths:
+        value = hashes.get(image_path)
+        if value is None:
+            continue
+        parent[image_path] = image_path
+        for _, other in index.search(value):
+            root, other_root = find(image_path), find(other)
+            if root != other_root:
+                parent[max(root, other_root, key=order.get)] = min(root, other_root, key=order.get)
+        index.add(value, image_path)
+
+    groups = {}
+    for image_path in parent:
+        groups.setdefault(find(image_path), []).append(image_path)
+    result = [sorted(group, key=order.get) for group in groups.values() if len(group) > 1]
+    result.sort(key=lambda group: order[group[0]])
+    return result
@@ -0,0 +1,353 @@
+# src/components/export.py
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from components.captioning import ERROR_PREFIX
+from components.preprocess import prepare_image
+from components.sidecars import read_caption
+
+# "webdataset": tar shards where every sample is <key>.<ext> + <key>.txt + <key>.json, readable
+# with webdataset / torchdata as shard-{000000..000099}.tar. "jsonl": one JSONL file per shard
+# plus a folder holding that shard's images, for loaders that want plain files.
+EXPORT_FORMATS = ("webdataset", "jsonl")
+DEFAULT_EXPORT_FORMAT = "webdataset"
+DEFAULT_SHARD_SIZE = 10_000  # samples per shard
+DEFAULT_MAX_SHARD_BYTES = 1024 * 1024 * 1024  # 0 = no byte limit
+EXPORT_MANIFEST_FILE = "manifest.json"
+# Samples are prepared in worker processes a chunk per task, and only a few chunks per worker
+# are in flight at once, so memory holds a bounded window of images rather than the dataset.
+EXPORT_CHUNK_SIZE = 16
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+TAR_BLOCK = 512
+
+IMAGE_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif"}
+
+
+class ExportError(Exception):
+    pass
+
+
+def _prepare_sample(image_path, preprocess):
+    caption = read_caption(image_path).strip()
+    if not caption:
+        return "uncaptioned", None
+    if caption.startswith(ERROR_PREFIX):
+        return "error_caption", None
+    if preprocess is None:
+        # Exported as-is; only the header is decoded, for the size.
+        with open(image_path, "rb") as f:
+            data = f.read()
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+        ext = os.path.splitext(image_path)[1].lstrip(".").lower()
+    else:
+        prepared = prepare_image(image_path, preprocess)
+        data, width, height = prepared.data, prepared.width, prepared.height
+        ext = IMAGE_EXTENSIONS[prepared.mime_type]
+    return "ok", {
+        "image": data,
+        "ext": ext,
+        "caption": caption,
+        "width": width,
+        "height": height,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "mtime": int(os.path.getmtime(image_path)),
+    }
+
+
+def prepare_chunk(image_paths, preprocess=None):
+    # Runs in a worker process: reads each image's caption sidecar and image (resized and
+    # re-encoded when preprocess is given). Returns (image_path, status, sample) per image.
+    results = []
+    for image_path in image_paths:
+        try:
+            status, sample = _prepare_sample(image_path, preprocess)
+        except Exception as e:
+            print(f"Error exporting {image_path}: {e}")
+            status, sample = "failed", None
+        results.append((image_path, status, sample))
+    return results
+
+
+class _HashingWriter:
+    # File wrapper that checksums a shard as it is written, so it never has to be read back.
+
+    def __init__(self, f):
+        self._file = f
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self._file.write(data)
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.bytes
+
+
+def _tar_size(*sizes):
+    # Bytes a tar member of each size takes: a header block plus the data padded to whole blocks.
+    return sum(TAR_BLOCK + (size + TAR_BLOCK - 1) // TAR_BLOCK * TAR_BLOCK for size in sizes)
+
+
+class _ShardWriter:
+    # One output shard, written under a temp name and renamed into place when complete, so an
+    # interrupted export never leaves a truncated shard behind a valid name.
+
+    def __init__(self, output_dir, index, export_format):
+        self.output_dir = output_dir
+        self.export_format = export_format
+        self.name = f"shard-{index:06d}"
+        self.file = f"{self.name}.tar" if export_format == "webdataset" else f"{self.name}.jsonl"
+        self.samples = 0
+        self.bytes = 0
+        self._temp_path = os.path.join(output_dir, self.file + ".tmp")
+        self._raw = open(self._temp_path, "wb")
+        self._writer = _HashingWriter(self._raw)
+        self._tar = None
+        if export_format == "webdataset":
+            self._tar = tarfile.open(fileobj=self._writer, mode="w", format=tarfile.USTAR_FORMAT)
+        else:
+            os.makedirs(os.path.join(output_dir, self.name), exist_ok=True)
+
+    def _add_member(self, name, data, mtime):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = mtime
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def sample_size(self, sample, meta):
+        if self.export_format == "webdataset":
+            return _tar_size(len(sample["image"]), len(sample["caption"].encode("utf-8")), len(json.dumps(meta)))
+        return len(sample["image"]) + len(json.dumps(meta)) + len(sample["caption"].encode("utf-8")) + 64
+
+    def add(self, key, sample, meta):
+        image_name = f"{key}.{sample['ext']}"
+        if self._tar is not None:
+            self._add_member(image_name, sample["image"], sample["mtime"])
+            self._add_member(f"{key}.txt", sample["caption"].encode("utf-8"), sample["mtime"])
+            self._add_member(f"{key}.json", json.dumps(meta).encode("utf-8"), sample["mtime"])
+            self.bytes = self._writer.bytes
+        else:
+            image_path = os.path.join(self.name, image_name)
+            with open(os.path.join(self.output_dir, image_path), "wb") as f:
+                f.write(sample["image"])
+            line = json.dumps({"key": key, "image": image_path.replace(os.sep, "/"), "caption": sample["caption"], **meta})
+            self._writer.write((line + "\n").encode("utf-8"))
+            self.bytes += len(sample["image"]) + len(line) + 1
+        self.samples += 1
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+        self._raw.close()
+        os.replace(self._temp_path, os.path.join(self.output_dir, self.file))
+        entry = {"file": self.file, "samples": self.samples, "bytes": self._writer.bytes,
+                 "sha256": self._writer.sha256.hexdigest()}
+        if self._tar is None:
+            entry["images"] = self.name
+            entry["bytes"] = self.bytes
+        return entry
+
+    def discard(self):
+        if self._tar is not None:
+            self._tar.close()
+        self._raw.close()
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+        if self._tar is None:
+            _remove_images(os.path.join(self.output_dir, self.name))
+
+
+def _remove_images(images_dir):
+    # Deletes a JSONL shard's image folder.
+    for name in os.listdir(images_dir) if os.path.isdir(images_dir) else ():
+        os.remove(os.path.join(images_dir, name))
+    try:
+        os.rmdir(images_dir)
+    except OSError:
+        pass
+
+
+def read_export_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, EXPORT_MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def remove_export(output_dir):
+    # Deletes the shards of a previous export listed in its manifest, and the manifest itself.
+    manifest = read_export_manifest(output_dir)
+    if manifest is None:
+        return
+    for shard in manifest.get("shards", []):
+        try:
+            os.remove(os.path.join(output_dir, shard["file"]))
+        except OSError:
+            pass
+        if shard.get("images"):
+            _remove_images(os.path.join(output_dir, shard["images"]))
+    os.remove(os.path.join(output_dir, EXPORT_MANIFEST_FILE))
+
+
+def export_dataset(image_paths, root, output_dir, export_format=DEFAULT_EXPORT_FORMAT,
+                   shard_size=DEFAULT_SHARD_SIZE, max_shard_bytes=DEFAULT_MAX_SHARD_BYTES, preprocess=None,
+                   max_workers=None, should_stop=None, on_progress=None):
+    # Streams every captioned image and its caption into shards in output_dir and writes
+    # manifest.json with the counts and a sha256 per shard (and per image, in the sample
+    # metadata). Images without a caption, or with an error caption, are skipped. A new shard
+    # starts when shard_size samples or max_shard_bytes would be exceeded. preprocess resizes and
+    # re-encodes images as for uploads; without it the original files are exported byte for byte.
+    # Samples are prepared in a process pool but written in input order, so the same folder
+    # always gives the same shards. Returns the manifest. on_progress(done, total) is called as
+    # chunks finish; should_stop() cancels, keeping the shards finished so far.
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown export format {export_format!r}; expected one of {', '.join(EXPORT_FORMATS)}")
+    if shard_size <= 0:
+        raise ExportError("The shard size must be at least 1")
+    os.makedirs(output_dir, exist_ok=True)
+    if read_export_manifest(output_dir) is not None:
+        raise ExportError(f"{output_dir} already holds an export ({EXPORT_MANIFEST_FILE})")
+
+    started = time.perf_counter()
+    total = len(image_paths)
+    shards = []
+    skipped = {"uncaptioned": 0, "error_caption": 0}
+    failed = []
+    exported = 0
+    image_bytes = 0
+    shard = None
+    cancelled = False
+    workers = max_workers or os.cpu_count() or 1
+    chunks = [image_paths[start:start + EXPORT_CHUNK_SIZE] for start in range(0, total, EXPORT_CHUNK_SIZE)]
+    # spawn rather than fork: the UI process is multi-threaded.
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    pending = []
+    next_chunk = 0
+    done = 0
+    try:
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                pending.append(executor.submit(prepare_chunk, chunks[next_chunk], preprocess))
+                next_chunk += 1
+            results = pending.pop(0).result()
+            for image_path, status, sample in results:
+                if status == "failed":
+                    failed.append(os.path.relpath(image_path, root))
+                    continue
+                if sample is None:
+                    skipped[status] += 1
+                    continue
+                key = f"{exported:08d}"
+                meta = {"path": os.path.relpath(image_path, root).replace(os.sep, "/"),
+                        "width": sample["width"], "height": sample["height"], "sha256": sample["sha256"]}
+                if shard is not None and shard.samples and (
+                    shard.samples >= shard_size
+                    or (max_shard_bytes and shard.bytes + shard.sample_size(sample, meta) > max_shard_bytes)
+                ):
+                    shards.append(shard.close())
+                    shard = None
+                if shard is None:
+                    shard = _ShardWriter(output_dir, len(shards), export_format)
+                shard.add(key, sample, meta)
+                exported += 1
+                image_bytes += len(sample["image"])
+            done += len(results)
+            if on_progress is not None:
+                on_progress(done, total)
+            if should_stop is not None and should_stop():
+                cancelled = True
+                break
+        if shard is not None:
+            shards.append(shard.close())
+            shard = None
+    finally:
+        if shard is not None:
+            shard.discard()
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    last = len(shards) - 1
+    manifest = {
+        "format": export_format,
+        "root": os.path.abspath(root),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "pattern": (
+            f"shard-{{000000..{last:06d}}}.{'tar' if export_format == 'webdataset' else 'jsonl'}" if shards else None
+        ),
+        "settings": {
+            "shard_size": shard_size,
+            "max_shard_bytes": max_shard_bytes,
+            "resize": None if preprocess is None else {
+                "max_side": preprocess.max_side, "format": preprocess.output_format, "quality": preprocess.quality,
+            },
+        },
+        "images": total,
+        "samples": exported,
+        "image_bytes": image_bytes,
+        "skipped": skipped,
+        "failed": failed,
+        "cancelled": cancelled,
+        "elapsed": round(time.perf_counter() - started, 3),
+        "shards": shards,
+    }
+    # Written last and atomically: a folder without it holds an incomplete export.
+    manifest_path = os.path.join(output_dir, EXPORT_MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest
+
+
+def _verify_images(output_dir, shard_file):
+    # The images of a JSONL shard whose files are missing or don't match their sha256.
+    bad = []
+    with open(os.path.join(output_dir, shard_file), encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            try:
+                with open(os.path.join(output_dir, entry["image"]), "rb") as image_file:
+                    digest = hashlib.sha256(image_file.read()).hexdigest()
+            except OSError:
+                digest = None
+            if digest != entry["sha256"]:
+                bad.append(entry["image"])
+    return bad
+
+
+def verify_export(output_dir):
+    # Re-checksums every shard listed in the manifest, and the images of JSONL shards; returns
+    # the files that are missing or differ.
+    manifest = read_export_manifest(output_dir)
+    if manifest is None:
+        raise ExportError(f"No {EXPORT_MANIFEST_FILE} in {output_dir}")
+    bad = []
+    for shard in manifest["shards"]:
+        sha256 = hashlib.sha256()
+        try:
+            with open(os.path.join(output_dir, shard["file"]), "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    sha256.update(block)
+        except OSError:
+            bad.append(shard["file"])
+            continue
+        if sha256.hexdigest() != shard["sha256"]:
+            bad.append(shard["file"])
+        elif shard.get("images"):
+            bad.extend(_verify_images(output_dir, shard["file"]))
+    return bad
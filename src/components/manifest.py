@@ -0,0 +1,97 @@
+# src/components/manifest.py
+import json
+import os
+import time
+
+
+class ManifestMismatchError(Exception):
+    pass
+
+
+class Manifest:
+    # Append-only JSONL checkpoint for batch runs. The first line records the run settings;
+    # every following line records one image, so an interrupted run can skip what's done.
+    # Paths are stored relative to the dataset root so the folder can be moved.
+
+    def __init__(self, path, root, config, restart=False):
+        self.path = path
+        self.root = root
+        self.config = config
+        self.done = set()
+        self.failed = set()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            keep, needs_newline = self._load()
+            if keep is not None:
+                # Drop the half-written last line a crash left, so the next record doesn't join it.
+                with open(path, "r+b") as f:
+                    f.truncate(keep)
+            self._file = open(path, "a", encoding="utf-8")
+            if needs_newline:
+                self._file.write("\n")
+            if keep == 0:
+                self._write({"config": config})
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+            self._write({"config": config})
+
+    def _load(self):
+        # Returns (offset to truncate a torn last line at or None, whether the last line is
+        # complete but lacks its newline).
+        offset = 0
+        keep = None
+        needs_newline = False
+        with open(self.path, "rb") as f:
+            for line_number, line in enumerate(f):
+                start, offset = offset, offset + len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash can leave a half-written last line; everything before it is still valid.
+                    if not line.endswith(b"\n"):
+                        keep = start
+                    continue
+                needs_newline = not line.endswith(b"\n")
+                if line_number == 0:
+                    if record.get("config") != self.config:
+                        raise ManifestMismatchError(
+                            f"{self.path} was written with different settings: {record.get('config')}"
+                        )
+                    continue
+                if record.get("status") == "done":
+                    self.done.add(record["path"])
+                    self.failed.discard(record["path"])
+                else:
+                    self.failed.add(record["path"])
+        return keep, needs_newline
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def relative(self, image_path):
+        return os.path.relpath(image_path, self.root)
+
+    def is_done(self, image_path):
+        return self.relative(image_path) in self.done
+
+    def record(self, image_path, result=None, error=None):
+        rel_path = self.relative(image_path)
+        record = {"path": rel_path, "time": time.time()}
+        if error is None:
+            record.update(
+                status="done",
+                prompt_tokens=result.prompt_tokens,
+                completion_tokens=result.completion_tokens,
+                cached=result.cached,
+            )
+            self.done.add(rel_path)
+            self.failed.discard(rel_path)
+        else:
+            record.update(status="failed", error=str(error))
+            self.failed.add(rel_path)
+        self._write(record)
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,324 @@
+# src/components/metrics.py
+import contextlib
+import csv
+import io
+import os
+import threading
+import time
+
+NAMESPACE = "image_captioning"
+# Upper bounds (seconds) of the latency buckets: from sidecar reads to slow API calls.
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Registered up front so exports and the stats panel list them even before they are used.
+STANDARD_TIMERS = (
+    ("scan_seconds", "Time to list a folder"),
+    ("thumbnail_build_seconds", "Time to build one thumbnail in a worker process"),
+    ("caption_load_seconds", "Time to read a caption sidecar"),
+    ("caption_save_seconds", "Time the caller spends saving a caption"),
+    ("caption_write_seconds", "Time to write a caption sidecar to disk"),
+    ("api_request_seconds", "Latency of one chat completion request, per attempt"),
+    ("caption_seconds", "End-to-end time to caption one image, including preprocessing and waits"),
+)
+STANDARD_COUNTERS = (
+    ("scanned_images_total", "Images found by folder scans"),
+    ("api_errors_total", "Chat completion attempts that raised"),
+    ("original_bytes_total", "Size of the original images that were captioned"),
+    ("upload_bytes_total", "Bytes of image data uploaded to the API"),
+    ("prompt_tokens_total", "Prompt tokens billed"),
+    ("completion_tokens_total", "Completion tokens billed"),
+    ("cache_hits_total", "Captions served from the caption cache"),
+    ("cache_misses_total", "Caption cache lookups that went to the API"),
+    ("captions_total", "Images captioned, including cache hits"),
+    ("caption_wall_seconds_total", "Wall-clock seconds spent captioning, for images per second"),
+)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, lock, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.value = 0
+        self._lock = lock
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Timer:
+    # Latency histogram with fixed buckets, so recording is O(buckets) and memory stays constant
+    # however many observations there are. Quantiles are interpolated within a bucket.
+
+    def __init__(self, name, help_text, lock, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self._lock = lock
+
+    def observe(self, seconds):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            self.min = seconds if self.min is None else min(self.min, seconds)
+            self.max = seconds if self.max is None else max(self.max, seconds)
+
+    @contextlib.contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if bucket_count and seen + bucket_count >= rank:
+                fraction = (rank - seen) / bucket_count
+                # Clamp to what was actually observed, e.g. a single 3ms call reads as 3ms.
+                return min(max(lower + (upper - lower) * fraction, self.min), self.max)
+            seen += bucket_count
+            lower = upper
+        return self.max
+
+
+class MetricsRegistry:
+    # Named counters and latency timers, shared by the app (or a CLI run) and the components it
+    # hands the registry to. Everything can be exported as Prometheus text or CSV. Safe to use
+    # from any thread.
+    #
+    # Metrics can carry labels, e.g. observe("api_request_seconds", 0.8, provider="local"); each
+    # label set is its own series. labeled(provider="local") returns a view that adds the labels
+    # to everything recorded through it, so components don't need to know about them.
+
+    def __init__(self, namespace=NAMESPACE):
+        self.namespace = namespace
+        self.started = time.time()
+        self._metrics = {}  # (name, label key) -> Counter / Timer
+        self._help = {}
+        self._lock = threading.Lock()
+        for name, help_text in STANDARD_TIMERS:
+            self.timer(name, help_text)
+        for name, help_text in STANDARD_COUNTERS:
+            self.counter(name, help_text)
+
+    def _get_or_create(self, kind, name, help_text, labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                if help_text:
+                    self._help[name] = help_text
+                metric = kind(name, self._help.get(name, ""), threading.Lock(), key[1])
+                self._metrics[key] = metric
+        return metric
+
+    def counter(self, name, help_text="", **labels):
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def timer(self, name, help_text="", **labels):
+        return self._get_or_create(Timer, name, help_text, labels)
+
+    def get(self, name, **labels):
+        # The metric if anything created it, without creating it.
+        return self._metrics.get((name, _label_key(labels)))
+
+    def inc(self, name, amount=1, **labels):
+        self.counter(name, **labels).inc(amount)
+
+    def observe(self, name, seconds, **labels):
+        self.timer(name, **labels).observe(seconds)
+
+    def time(self, name, **labels):
+        return self.timer(name, **labels).time()
+
+    def labeled(self, **labels):
+        return LabeledMetrics(self, labels)
+
+    def value(self, name, **labels):
+        # A counter's value or a timer's count, for one label set.
+        metric = self.get(name, **labels)
+        if isinstance(metric, Timer):
+            return metric.count
+        return metric.value if metric is not None else 0
+
+    def total(self, name):
+        # value() summed over every label set.
+        return sum(
+            metric.count if isinstance(metric, Timer) else metric.value
+            for metric in self.metrics() if metric.name == name
+        )
+
+    def label_values(self, label):
+        # The values a label has taken so far, in order of first use.
+        values = {}
+        for metric in self.metrics():
+            for key, value in metric.labels:
+                if key == label:
+                    values[value] = None
+        return list(values)
+
+    def reset(self):
+        # Zeroes everything; labeled series are dropped and come back when next recorded.
+        with self._lock:
+            self._metrics = {}
+        for name, help_text in STANDARD_TIMERS:
+            self.timer(name, help_text)
+        for name, help_text in STANDARD_COUNTERS:
+            self.counter(name, help_text)
+        self.started = time.time()
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def cache_hit_rate(self):
+        hits, misses = self.total("cache_hits_total"), self.total("cache_misses_total")
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def describe(self):
+        # One line per metric that has data, for the stats panel and end-of-run summaries.
+        lines = []
+        for metric in self.metrics():
+            name = metric.name + _format_labels(metric.labels)
+            if isinstance(metric, Timer):
+                if metric.count:
+                    lines.append(
+                        f"{name}: {metric.count} x, mean {metric.mean * 1000:.1f} ms, "
+                        f"p50 {metric.quantile(0.5) * 1000:.1f} ms, p95 {metric.quantile(0.95) * 1000:.1f} ms, "
+                        f"max {metric.max * 1000:.1f} ms"
+                    )
+            elif metric.value:
+                value = f"{metric.value:,.1f}" if isinstance(metric.value, float) else f"{metric.value:,}"
+                lines.append(f"{name}: {value}")
+        if self.total("cache_hits_total") or self.total("cache_misses_total"):
+            lines.append(f"cache hit rate: {self.cache_hit_rate():.0%}")
+        return lines
+
+    def to_prometheus(self):
+        # Prometheus text exposition format, e.g. for node_exporter's textfile collector.
+        # Every series of a metric has to follow its HELP and TYPE lines.
+        families = {}
+        for metric in self.metrics():
+            families.setdefault(metric.name, []).append(metric)
+        out = []
+        for metric_name, series in families.items():
+            name = f"{self.namespace}_{metric_name}"
+            if series[0].help_text:
+                out.append(f"# HELP {name} {series[0].help_text}")
+            if isinstance(series[0], Timer):
+                out.append(f"# TYPE {name} histogram")
+                for metric in series:
+                    cumulative = 0
+                    for bound, bucket_count in zip((*metric.buckets, "+Inf"), metric.bucket_counts):
+                        cumulative += bucket_count
+                        out.append(f"{name}_bucket{_format_labels(metric.labels, (('le', str(bound)),))} {cumulative}")
+                    out.append(f"{name}_sum{_format_labels(metric.labels)} {metric.sum}")
+                    out.append(f"{name}_count{_format_labels(metric.labels)} {metric.count}")
+            else:
+                out.append(f"# TYPE {name} counter")
+                for metric in series:
+                    out.append(f"{name}{_format_labels(metric.labels)} {metric.value}")
+        return "\n".join(out) + "\n"
+
+    def to_csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["timestamp", "name", "labels", "type", "value", "count", "sum", "mean", "min", "max", "p50", "p95", "p99"])
+        now = round(time.time(), 3)
+        for metric in self.metrics():
+            labels = ";".join(f"{key}={value}" for key, value in metric.labels)
+            if isinstance(metric, Timer):
+                writer.writerow([
+                    now, metric.name, labels, "timer", "", metric.count, f"{metric.sum:.6f}", f"{metric.mean:.6f}",
+                    f"{metric.min or 0:.6f}", f"{metric.max or 0:.6f}", f"{metric.quantile(0.5):.6f}",
+                    f"{metric.quantile(0.95):.6f}", f"{metric.quantile(0.99):.6f}",
+                ])
+            else:
+                writer.writerow([now, metric.name, labels, "counter", metric.value, "", "", "", "", "", "", "", ""])
+        return buffer.getvalue()
+
+    def export(self, path):
+        # The format follows the extension: .csv for CSV, anything else (.prom) for Prometheus.
+        text = self.to_csv() if path.lower().endswith(".csv") else self.to_prometheus()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+class LabeledMetrics:
+    # What MetricsRegistry.labeled() returns: the same recording API, with fixed labels added.
+
+    def __init__(self, registry, labels):
+        self.registry = registry
+        self.labels = labels
+
+    def counter(self, name, help_text=""):
+        return self.registry.counter(name, help_text, **self.labels)
+
+    def timer(self, name, help_text=""):
+        return self.registry.timer(name, help_text, **self.labels)
+
+    def inc(self, name, amount=1):
+        self.registry.inc(name, amount, **self.labels)
+
+    def observe(self, name, seconds):
+        self.registry.observe(name, seconds, **self.labels)
+
+    def time(self, name):
+        return self.registry.time(name, **self.labels)
+
+    def value(self, name):
+        return self.registry.value(name, **self.labels)
+
+
+def record_caption_result(metrics, result, cache_enabled=False):
+    # Upload size, token usage and cache outcome of one captioned image.
+    if metrics is None:
+        return
+    metrics.inc("captions_total")
+    if result.cached:
+        metrics.inc("cache_hits_total")
+        return
+    if cache_enabled:
+        metrics.inc("cache_misses_total")
+    metrics.inc("original_bytes_total", result.original_bytes)
+    metrics.inc("upload_bytes_total", result.upload_bytes)
+    metrics.inc("prompt_tokens_total", result.prompt_tokens)
+    metrics.inc("completion_tokens_total", result.completion_tokens)
@@ -0,0 +1,250 @@
+# src/components/packing.py
+import asyncio
+import json
+
+import openai
+
+from components.caption_cache import hash_file
+from components.captioning import (
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_MODEL,
+    CaptionResult,
+    caption_image,
+    estimate_request_tokens,
+)
+from components.preprocess import prepare_image
+
+DEFAULT_PACK_SIZE = 4
+# How long a partial pack waits for more images before it is sent anyway.
+MAX_PACK_WAIT = 0.05
+
+PACK_INSTRUCTIONS = (
+    "You are given {count} images, each preceded by its number. Follow the instructions above for each "
+    "image separately. Respond with only a JSON object of the form "
+    '{{"captions": {{"1": "...", "2": "..."}}}} containing exactly one caption per image number.'
+)
+
+
+class PackedResponseError(ValueError):
+    pass
+
+
+def build_packed_messages(prompt, image_urls):
+    content = [{"type": "text", "text": prompt + "\n\n" + PACK_INSTRUCTIONS.format(count=len(image_urls))}]
+    for number, image_url in enumerate(image_urls, start=1):
+        content.append({"type": "text", "text": f"Image {number}:"})
+        content.append({"type": "image_url", "image_url": {"url": image_url}})
+    return [{"role": "user", "content": content}]
+
+
+def parse_packed_captions(content, count):
+    # Returns one caption per image, in order, or raises PackedResponseError if the reply isn't
+    # exactly the JSON object that was asked for.
+    try:
+        data = json.loads(content or "")
+    except json.JSONDecodeError as e:
+        raise PackedResponseError(f"Response is not JSON: {e}") from e
+    captions = data.get("captions", data) if isinstance(data, dict) else None
+    if not isinstance(captions, dict):
+        raise PackedResponseError("Response has no captions object")
+    expected = {str(number) for number in range(1, count + 1)}
+    if set(captions) != expected:
+        raise PackedResponseError(f"Expected captions for images 1-{count}, got {sorted(captions)}")
+    results = [captions[str(number)] for number in range(1, count + 1)]
+    if not all(isinstance(caption, str) and caption.strip() for caption in results):
+        raise PackedResponseError("Response contains empty or non-text captions")
+    return results
+
+
+def split_evenly(total, parts):
+    share, remainder = divmod(total, parts)
+    return [share + (1 if index < remainder else 0) for index in range(parts)]
+
+
+class PackedCaptioner:
+    # Captions several images per chat completion. Concurrent caption() calls (e.g. from the
+    # BatchCaptioner workers) are collected into packs of pack_size images, so the prompt and
+    # per-request overhead are paid once per pack. A pack whose reply can't be parsed is
+    # retried one image at a time.
+    #
+    # The first image of a run is always sent on its own, so stats has a measured single-image
+    # cost to compare the packed cost against.
+
+    def __init__(self, client, prompt, pack_size=DEFAULT_PACK_SIZE, model=DEFAULT_MODEL,
+                 max_tokens=DEFAULT_MAX_TOKENS, preprocess=None, cache=None, scheduler=None, params=None):
+        self.client = client
+        self.prompt = prompt
+        self.pack_size = pack_size
+        self.model = model
+        self.max_tokens = max_tokens
+        self.preprocess = preprocess
+        self.cache = cache
+        self.scheduler = scheduler
+        self.params = params or {}
+        self._pending = []  # (image_path, cache_key, future)
+        self._flush_handle = None
+        self._tasks = set()
+        self._calibrated = False
+        self.stats = {
+            "packed_requests": 0, "packed_images": 0, "packed_tokens": 0,
+            "single_images": 0, "single_tokens": 0, "fallbacks": 0,
+        }
+
+    async def caption(self, image_path):
+        cache_key = None
+        if self.cache is not None:
+            image_hash = await asyncio.to_thread(hash_file, image_path)
+            cache_key = self.cache.make_key(
+                image_hash, self.prompt, self.model, self.max_tokens, self.preprocess, self.params
+            )
+            row = await asyncio.to_thread(self.cache.get, cache_key)
+            if row is not None:
+                return CaptionResult(caption=row[0], model=self.model, prompt=self.prompt, cached=True)
+
+        if not self._calibrated or self.pack_size <= 1:
+            self._calibrated = True
+            result = await self._caption_single(image_path)
+            await self._store(cache_key, result)
+            return result
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((image_path, cache_key, future))
+        if len(self._pending) >= self.pack_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(MAX_PACK_WAIT, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pack, self._pending = self._pending, []
+        if pack:
+            task = asyncio.create_task(self._run_pack(pack))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _caption_single(self, image_path):
+        # The cache was already checked by caption(), so only write to it here.
+        result = await caption_image(
+            self.client, image_path, self.prompt, self.model, self.max_tokens,
+            preprocess=self.preprocess, scheduler=self.scheduler, params=self.params,
+        )
+        self.stats["single_images"] += 1
+        self.stats["single_tokens"] += result.prompt_tokens + result.completion_tokens
+        return result
+
+    async def _run_pack(self, pack):
+        # Callers that were cancelled while waiting (e.g. a cancelled batch) are dropped.
+        pack = [entry for entry in pack if not entry[2].done()]
+        if not pack:
+            return
+        results = None
+        if len(pack) > 1:
+            try:
+                results = await self._caption_pack([image_path for image_path, _, _ in pack])
+            except (openai.APIConnectionError, openai.InternalServerError, openai.RateLimitError) as e:
+                # Already retried by the scheduler; sending each image separately wouldn't help.
+                for _, _, future in pack:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            except Exception as e:
+                # An unparseable reply, a rejected request or an unreadable image: fall back to
+                # single requests, which report errors per image.
+                print(f"Packed request failed ({e}), captioning {len(pack)} images individually")
+                self.stats["fallbacks"] += 1
+        if results is None:
+            results = await asyncio.gather(
+                *(self._fallback_single(image_path, future) for image_path, _, future in pack),
+                return_exceptions=True,
+            )
+        for (image_path, cache_key, future), result in zip(pack, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+                continue
+            await self._store(cache_key, result)
+            future.set_result(result)
+
+    async def _fallback_single(self, image_path, future):
+        # Skipped if the caller gave up while the pack was in flight, and cancelled if it gives
+        # up while this request is waiting or running.
+        if future.done():
+            return None
+        task = asyncio.ensure_future(self._caption_single(image_path))
+        future.add_done_callback(lambda _: task.cancel())
+        return await task
+
+    async def _store(self, cache_key, result):
+        if self.cache is not None and result.caption:
+            await asyncio.to_thread(
+                self.cache.put, cache_key, result.caption, result.prompt_tokens, result.completion_tokens
+            )
+
+    async def _caption_pack(self, image_paths):
+        prepared = await asyncio.gather(
+            *(asyncio.to_thread(prepare_image, image_path, self.preprocess) for image_path in image_paths)
+        )
+        messages = build_packed_messages(self.prompt, [image.data_url() for image in prepared])
+        max_tokens = self.max_tokens * len(image_paths)
+
+        async def request():
+            return await self.client.chat.completions.create(
+                model=self.model, messages=messages, max_tokens=max_tokens,
+                **{**self.params, "response_format": {"type": "json_object"}},
+            )
+
+        if self.scheduler is None:
+            response = await request()
+        else:
+            estimated_tokens = sum(
+                estimate_request_tokens("", image.width, image.height, self.max_tokens) for image in prepared
+            ) + len(self.prompt) // 4
+            response = await self.scheduler.run(request, estimated_tokens=estimated_tokens)
+            self.scheduler.record_tokens(estimated_tokens, response.usage.total_tokens if response.usage else 0)
+        captions = parse_packed_captions(response.choices[0].message.content, len(image_paths))
+
+        usage = response.usage
+        prompt_tokens = split_evenly(usage.prompt_tokens if usage else 0, len(image_paths))
+        completion_tokens = split_evenly(usage.completion_tokens if usage else 0, len(image_paths))
+        self.stats["packed_requests"] += 1
+        self.stats["packed_images"] += len(image_paths)
+        self.stats["packed_tokens"] += usage.total_tokens if usage else 0
+        return [
+            CaptionResult(
+                caption=caption,
+                model=self.model,
+                prompt=self.prompt,
+                prompt_tokens=prompt_tokens[index],
+                completion_tokens=completion_tokens[index],
+                original_bytes=image.original_bytes,
+                upload_bytes=image.upload_bytes,
+            )
+            for index, (caption, image) in enumerate(zip(captions, prepared))
+        ]
+
+    def token_savings(self):
+        # (tokens per image sent alone, tokens per image in a pack), or None until both were measured.
+        if not self.stats["single_images"] or not self.stats["packed_images"]:
+            return None
+        return (
+            self.stats["single_tokens"] / self.stats["single_images"],
+            self.stats["packed_tokens"] / self.stats["packed_images"],
+        )
+
+    def describe_savings(self):
+        savings = self.token_savings()
+        if savings is None:
+            return f"{self.stats['packed_images']} images packed into {self.stats['packed_requests']} requests"
+        single, packed = savings
+        saved = single - packed
+        percent = saved / single if single else 0.0
+        return (
+            f"{self.stats['packed_images']} images packed into {self.stats['packed_requests']} requests: "
+            f"{packed:.0f} tokens/image vs {single:.0f} single ({saved:.0f} saved per image, {percent:.0%}), "
+            f"{self.stats['fallbacks']} fallbacks"
+        )
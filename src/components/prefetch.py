@@ -0,0 +1,144 @@
+# src/components/prefetch.py
+import base64
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from components.preprocess import flatten_to_rgb
+from components.sidecars import read_caption
+
+# Matches the 1000x1000 preview area in main.py.
+PREVIEW_SIZE = 1000
+PREVIEW_QUALITY = 85
+DEFAULT_PREFETCH_DISTANCE = 3
+# ~30 previews of ~200 KB each.
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def build_preview(image_path, size=PREVIEW_SIZE):
+    # Decodes and downsizes the image once so the UI only ships a display-sized JPEG.
+    with Image.open(image_path) as img:
+        # draft() needs the fitted size: with a square box it would keep a landscape image's
+        # height at `size`, decoding at twice the scale needed.
+        scale = min(size / img.width, size / img.height, 1.0)
+        img.draft("RGB", (int(img.width * scale), int(img.height * scale)))
+        preview = ImageOps.exif_transpose(img)
+        preview.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    flatten_to_rgb(preview).save(buffer, format="JPEG", quality=PREVIEW_QUALITY)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+class Preview:
+    __slots__ = ("image_base64", "caption")
+
+    def __init__(self, image_base64, caption):
+        self.image_base64 = image_base64
+        self.caption = caption
+
+
+class PreviewCache:
+    # Bounded LRU of display-sized previews and captions, filled ahead of time by a small thread
+    # pool so stepping through images doesn't wait on decoding or reading sidecars. Only the
+    # app writes captions, so save paths call update_caption() to keep cached captions current.
+    # read_caption_fn replaces reading the sidecar, e.g. to see captions that are still queued.
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, size=PREVIEW_SIZE, max_workers=2, read_caption_fn=read_caption):
+        self.max_bytes = max_bytes
+        self.size = size
+        self.read_caption_fn = read_caption_fn
+        self._entries = OrderedDict()  # image_path -> Preview
+        self._bytes = 0
+        self._pending = {}  # image_path -> future
+        self._stale = set()  # pending loads whose caption changed while they were reading it
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="preview")
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image_path):
+        with self._lock:
+            entry = self._entries.get(image_path)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(image_path)
+            self.hits += 1
+            return entry
+
+    def load(self, image_path):
+        # Loads synchronously (on a cache miss) and caches the result.
+        entry = self._build(image_path)
+        self._put(image_path, entry)
+        return entry
+
+    def update_caption(self, image_path, caption):
+        with self._lock:
+            entry = self._entries.get(image_path)
+            if entry is not None:
+                entry.caption = caption
+            elif image_path in self._pending:
+                self._stale.add(image_path)
+
+    def invalidate(self, image_path):
+        with self._lock:
+            entry = self._entries.pop(image_path, None)
+            if entry is not None:
+                self._bytes -= len(entry.image_base64)
+
+    def prefetch(self, image_paths):
+        # Queues loads for image_paths (nearest first) and drops queued loads for anything else,
+        # so fast scrolling doesn't leave a backlog of previews nobody will look at.
+        wanted = set(image_paths)
+        with self._lock:
+            for image_path, future in list(self._pending.items()):
+                if image_path not in wanted and future.cancel():
+                    del self._pending[image_path]
+            for image_path in image_paths:
+                if image_path in self._entries or image_path in self._pending:
+                    continue
+                future = self._executor.submit(self._prefetch_one, image_path)
+                self._pending[image_path] = future
+
+    def _prefetch_one(self, image_path):
+        try:
+            entry = self._build(image_path)
+        except Exception as e:
+            print(f"Error prefetching {image_path}: {e}")
+            entry = None
+        with self._lock:
+            self._pending.pop(image_path, None)
+            if image_path in self._stale:
+                self._stale.discard(image_path)
+                entry = None
+        if entry is not None:
+            self._put(image_path, entry)
+
+    def _build(self, image_path):
+        return Preview(build_preview(image_path, self.size), self.read_caption_fn(image_path))
+
+    def _put(self, image_path, entry):
+        with self._lock:
+            previous = self._entries.pop(image_path, None)
+            if previous is not None:
+                self._bytes -= len(previous.image_base64)
+            self._entries[image_path] = entry
+            self._bytes += len(entry.image_base64)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.image_base64)
+
+    def clear(self):
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._entries.clear()
+            self._bytes = 0
+
+    def shutdown(self):
+        self.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,96 @@
+# src/components/preprocess.py
+import base64
+import io
+import os
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps
+
+# GPT-4o scales high-detail images to fit 2048x2048 and then to a 768px shortest side before
+# cutting 512px tiles, so anything much larger than this is uploaded only to be thrown away.
+DEFAULT_MAX_SIDE = 1024
+DEFAULT_FORMAT = "JPEG"
+DEFAULT_QUALITY = 85
+
+OUTPUT_FORMATS = ("JPEG", "WEBP", "original")
+
+# Formats the vision API accepts as-is; anything else (BMP, TIFF, ...) is always re-encoded.
+UPLOAD_FORMATS = {"JPEG", "PNG", "WEBP", "GIF"}
+
+
+@dataclass
+class PreprocessOptions:
+    max_side: int = DEFAULT_MAX_SIDE  # 0 disables resizing
+    output_format: str = DEFAULT_FORMAT  # "JPEG", "WEBP" or "original" to keep the source format
+    quality: int = DEFAULT_QUALITY
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    original_bytes: int
+    width: int
+    height: int
+
+    @property
+    def upload_bytes(self):
+        return len(self.data)
+
+    def data_url(self):
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
+
+def format_bytes(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+
+def flatten_to_rgb(img):
+    # JPEG has no alpha channel; composite transparent images onto white rather than black.
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def prepare_image(image_path, options=None):
+    options = options or PreprocessOptions()
+    original_bytes = os.path.getsize(image_path)
+    max_side = options.max_side
+
+    with Image.open(image_path) as img:
+        source_format = img.format
+        fits = max_side <= 0 or max(img.size) <= max_side
+        if options.output_format == "original" and source_format in UPLOAD_FORMATS and fits:
+            with open(image_path, "rb") as f:
+                data = f.read()
+            return PreparedImage(data, Image.MIME[source_format], original_bytes, *img.size)
+
+        if max_side > 0:
+            # Lets the JPEG decoder downscale by 1/2..1/8 while decoding instead of decoding full size.
+            img.draft("RGB", (max_side, max_side))
+        resized = ImageOps.exif_transpose(img)
+        if max_side > 0:
+            resized.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    if options.output_format == "original":
+        target_format = source_format if source_format in UPLOAD_FORMATS else "JPEG"
+    else:
+        target_format = options.output_format
+
+    if target_format in ("JPEG", "WEBP"):
+        resized = flatten_to_rgb(resized)
+        save_kwargs = {"quality": options.quality}
+    else:
+        save_kwargs = {}
+
+    buffer = io.BytesIO()
+    resized.save(buffer, format=target_format, **save_kwargs)
+    return PreparedImage(buffer.getvalue(), Image.MIME[target_format], original_bytes, *resized.size)
@@ -0,0 +1,151 @@
+# src/components/providers.py
+import json
+import os
+import threading
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+import httpx
+import openai
+
+from components.captioning import DEFAULT_MAX_TOKENS, DEFAULT_MODEL
+
+PROVIDERS_FILE = "providers.json"
+DEFAULT_PROVIDER = "openai"
+DEFAULT_API_KEY_ENV = "OPENAI_API_KEY"
+# Connections per client. Requests beyond this wait for a free connection instead of opening more.
+DEFAULT_MAX_CONNECTIONS = 64
+DEFAULT_TIMEOUT = 120.0
+# Sent to servers that don't check keys; the client refuses to run without one.
+NO_API_KEY = "none"
+
+
+@dataclass
+class Provider:
+    # An OpenAI-compatible chat completions endpoint and the request settings used with it: the
+    # hosted API, or e.g. a vLLM / llama.cpp / Ollama server on the LAN.
+    name: str = DEFAULT_PROVIDER
+    base_url: Optional[str] = None  # None: OPENAI_BASE_URL, or the hosted API
+    model: str = DEFAULT_MODEL
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    params: dict = field(default_factory=dict)  # Extra request arguments, e.g. {"temperature": 0.2}
+    api_key_env: Optional[str] = DEFAULT_API_KEY_ENV
+    requires_api_key: bool = True
+    max_connections: int = DEFAULT_MAX_CONNECTIONS
+    timeout: float = DEFAULT_TIMEOUT
+
+    def resolve_api_key(self, override=None):
+        # An explicitly entered key wins over the provider's environment variable. Providers that
+        # don't need a key get a placeholder; None means a required key is missing.
+        api_key = (override or "").strip()
+        if not api_key and self.api_key_env:
+            api_key = os.getenv(self.api_key_env, "").strip()
+        if api_key:
+            return api_key
+        return None if self.requires_api_key else NO_API_KEY
+
+
+def load_providers(path=PROVIDERS_FILE):
+    # Reads providers from a JSON file like
+    #
+    #   {"providers": [
+    #       {"name": "lan", "base_url": "http://10.0.0.5:8000/v1", "model": "Qwen2-VL-7B-Instruct",
+    #        "requires_api_key": false, "params": {"temperature": 0.2}}
+    #   ]}
+    #
+    # The hosted API is always available as "openai" unless the file redefines it. A missing file
+    # gives just that one; an unreadable or invalid file raises ValueError.
+    providers = {DEFAULT_PROVIDER: Provider()}
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return providers
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Could not read {path}: {e}") from e
+    entries = data.get("providers") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        raise ValueError(f'{path} should hold {{"providers": [...]}}')
+    known = {f.name for f in fields(Provider)}
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("name"):
+            raise ValueError(f"Every provider in {path} needs a name")
+        unknown = set(entry) - known
+        if unknown:
+            raise ValueError(f"Unknown settings for provider {entry['name']!r} in {path}: {', '.join(sorted(unknown))}")
+        providers[entry["name"]] = Provider(**entry)
+    return providers
+
+
+def parse_params(items):
+    # KEY=VALUE strings (e.g. from --param) as request arguments. Values are parsed as JSON when
+    # they can be, so temperature=0.2 is a number and stop=["\n"] a list; anything else stays text.
+    params = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep or not key.strip():
+            raise ValueError(f"Expected KEY=VALUE, got {item!r}")
+        try:
+            params[key.strip()] = json.loads(value)
+        except ValueError:
+            params[key.strip()] = value
+    return params
+
+
+# One async client per endpoint, key and pool settings, so every request to a backend shares
+# its HTTP connection pool.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def create_async_client(provider, api_key):
+    # A new client with its own connection pool; close it when done (see get_async_client).
+    limits = httpx.Limits(max_connections=provider.max_connections, max_keepalive_connections=provider.max_connections)
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        base_url=provider.base_url,
+        timeout=provider.timeout,
+        # Retries are handled by RequestScheduler, which also honours rate-limit pauses.
+        max_retries=0,
+        http_client=openai.DefaultAsyncHttpxClient(limits=limits, timeout=provider.timeout),
+    )
+
+
+def get_async_client(provider, api_key):
+    key = (provider.base_url, api_key, provider.max_connections, provider.timeout)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = create_async_client(provider, api_key)
+    return client
+
+
+def create_sync_client(provider, api_key):
+    # For the Batch API's file uploads and polling, which run in worker threads.
+    return openai.OpenAI(api_key=api_key, base_url=provider.base_url, timeout=provider.timeout)
+
+
+def describe_providers(metrics):
+    # Latency and throughput of every provider that has captioned something, from the metrics
+    # recorded under its provider label, so backends can be compared on the same dataset.
+    lines = []
+    for name in metrics.label_values("provider"):
+        captions = metrics.value("captions_total", provider=name)
+        api = metrics.get("api_request_seconds", provider=name)
+        if not captions and (api is None or not api.count):
+            continue
+        line = f"{name}: {captions} captions"
+        wall = metrics.value("caption_wall_seconds_total", provider=name)
+        if wall:
+            line += f", {captions / wall:.2f} images/s"
+        if api is not None and api.count:
+            errors = metrics.value("api_errors_total", provider=name)
+            line += (
+                f", API p50 {api.quantile(0.5) * 1000:.0f} ms / p95 {api.quantile(0.95) * 1000:.0f} ms"
+                f" over {api.count} requests ({errors} failed)"
+            )
+        tokens = metrics.value("completion_tokens_total", provider=name)
+        if tokens and wall:
+            line += f", {tokens / wall:.0f} completion tokens/s"
+        lines.append(line)
+    return lines
@@ -0,0 +1,160 @@
+# src/components/ratelimit.py
+import asyncio
+import email.utils
+import random
+import time
+
+import openai
+
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+DEFAULT_RATE_WINDOW = 60.0  # rpm and tpm are per minute
+
+# Timeouts, conflicts and server-side failures are worth retrying; other 4xx errors are not.
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class RateLimiter:
+    # Async token bucket: `rate` units per `per` seconds, with bursts of up to one second's
+    # worth (at least 1). An acquisition larger than the bucket waits for a full bucket and
+    # then leaves it in debt, so big token estimates still average out to `rate`.
+
+    def __init__(self, rate, per=60.0):
+        self.fill_rate = rate / per
+        self.capacity = max(1.0, self.fill_rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.fill_rate)
+        self._updated = now
+
+    async def acquire(self, amount=1.0):
+        # Waiters queue on the lock so they are served in arrival order.
+        async with self._lock:
+            self._refill()
+            needed = min(amount, self.capacity)
+            while self._tokens < needed:
+                await asyncio.sleep((needed - self._tokens) / self.fill_rate)
+                self._refill()
+            self._tokens -= amount
+
+    def adjust(self, amount):
+        # Corrects an earlier estimate once the real cost is known (negative amounts refund).
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - amount)
+
+
+def is_retryable(error):
+    if isinstance(error, openai.APIConnectionError):  # Includes APITimeoutError
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def retry_after(error):
+    # Seconds the server asked us to wait, from Retry-After / retry-after-ms, or None.
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(retry_at.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    # Runs API requests under a concurrency cap and request/token rate limits, retrying
+    # transient failures with exponential backoff and full jitter. A 429 pauses every
+    # request (not just the one that failed) until the server's Retry-After has passed, so
+    # workers don't stampede back into the limit together. With a MetricsRegistry, every attempt's
+    # latency (excluding rate-limit waits) goes to api_request_seconds. rpm and tpm are counted
+    # per rate_window seconds.
+
+    def __init__(self, max_concurrency=None, rpm=None, tpm=None, max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY, metrics=None,
+                 rate_window=DEFAULT_RATE_WINDOW):
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._request_limiter = RateLimiter(rpm, rate_window) if rpm else None
+        self._token_limiter = RateLimiter(tpm, rate_window) if tpm else None
+        self._paused_until = 0.0
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "server_errors": 0, "paused_seconds": 0.0}
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _wait_for_pause(self):
+        while True:
+            remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            self.stats["paused_seconds"] += remaining
+            await asyncio.sleep(remaining)
+
+    def record_tokens(self, estimated_tokens, actual_tokens):
+        if self._token_limiter is not None and actual_tokens:
+            self._token_limiter.adjust(actual_tokens - estimated_tokens)
+
+    async def _attempt(self, request_fn, estimated_tokens):
+        await self._wait_for_pause()
+        if self._request_limiter is not None:
+            await self._request_limiter.acquire()
+        if self._token_limiter is not None and estimated_tokens:
+            await self._token_limiter.acquire(estimated_tokens)
+        self.stats["requests"] += 1
+        if self.metrics is None:
+            return await request_fn()
+        started = time.perf_counter()
+        try:
+            return await request_fn()
+        except Exception:
+            self.metrics.inc("api_errors_total")
+            raise
+        finally:
+            self.metrics.observe("api_request_seconds", time.perf_counter() - started)
+
+    async def run(self, request_fn, estimated_tokens=0):
+        attempt = 0
+        while True:
+            try:
+                if self._semaphore is None:
+                    return await self._attempt(request_fn, estimated_tokens)
+                async with self._semaphore:
+                    return await self._attempt(request_fn, estimated_tokens)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt)
+                server_delay = retry_after(e)
+                if getattr(e, "status_code", None) == 429:
+                    self.stats["rate_limited"] += 1
+                    if server_delay is not None:
+                        delay = server_delay + random.uniform(0, self.base_delay)
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                else:
+                    if getattr(e, "status_code", 0) >= 500:
+                        self.stats["server_errors"] += 1
+                    if server_delay is not None:
+                        delay = max(delay, server_delay)
+            # Sleep outside the semaphore so a backing-off request doesn't hold a slot.
+            attempt += 1
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
@@ -0,0 +1,62 @@
+# src/components/scanner.py
+import os
+import time
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tif", ".tiff")
+DEFAULT_CHUNK_SIZE = 500
+# On slow (network) mounts a partial chunk is still handed over after this long.
+MAX_CHUNK_DELAY = 0.25
+
+
+def parse_extensions(text):
+    extensions = []
+    for ext in text.replace(";", ",").split(","):
+        ext = ext.strip().lower()
+        if ext:
+            extensions.append(ext if ext.startswith(".") else "." + ext)
+    return tuple(extensions) or IMAGE_EXTENSIONS
+
+
+def scan_images(root, extensions=IMAGE_EXTENSIONS, recursive=True, chunk_size=DEFAULT_CHUNK_SIZE,
+                should_stop=None):
+    # Walks root with os.scandir and yields lists of image paths as they are found, so callers
+    # can show the first images while the rest of a large tree is still being listed.
+    # Each directory is listed in name order; hidden directories (e.g. .thumbnails) and
+    # directory symlinks are skipped.
+    extensions = tuple(ext.lower() for ext in extensions)
+    pending_dirs = [root]
+    chunk = []
+    last_yield = time.perf_counter()
+    while pending_dirs:
+        if should_stop is not None and should_stop():
+            return
+        directory = pending_dirs.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"Error scanning {directory}: {e}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    if entry.name.lower().endswith(extensions):
+                        chunk.append(entry.path)
+                elif recursive and entry.is_dir(follow_symlinks=False) and not entry.name.startswith("."):
+                    subdirs.append(entry.path)
+            except OSError:
+                continue
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+                last_yield = time.perf_counter()
+        pending_dirs.extend(reversed(subdirs))
+
+        if chunk and time.perf_counter() - last_yield >= MAX_CHUNK_DELAY:
+            yield chunk
+            chunk = []
+            last_yield = time.perf_counter()
+    if chunk:
+        yield chunk
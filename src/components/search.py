@@ -0,0 +1,121 @@
+# src/components/search.py
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+from components.captioning import ERROR_PREFIX
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Filters that match on caption state rather than words.
+STATUS_FILTERS = ("is:empty", "is:error", "is:captioned")
+
+
+def tokenize(text):
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+class CaptionIndex:
+    # In-memory inverted index from caption words to image paths, updated one caption at a time.
+    #
+    # Queries are whitespace-separated terms that must all match: plain words, "-word" to
+    # exclude, and is:empty / is:error / is:captioned. The last word also matches as a prefix
+    # so results narrow while typing.
+
+    def __init__(self):
+        self._postings = defaultdict(set)  # token -> paths
+        self._tokens = {}  # path -> tokens of its caption
+        self._empty = set()
+        self._errors = set()
+        self._vocabulary = []  # sorted tokens, for prefix lookups
+        self._vocabulary_dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __contains__(self, path):
+        return path in self._tokens
+
+    def update(self, path, caption):
+        tokens = tokenize(caption or "")
+        with self._lock:
+            self._remove(path)
+            self._tokens[path] = tokens
+            for token in tokens:
+                postings = self._postings[token]
+                if not postings:
+                    self._vocabulary_dirty = True
+                postings.add(path)
+            if not tokens:
+                self._empty.add(path)
+            if caption and caption.lstrip().startswith(ERROR_PREFIX):
+                self._errors.add(path)
+
+    def remove(self, path):
+        with self._lock:
+            self._remove(path)
+
+    def _remove(self, path):
+        for token in self._tokens.pop(path, ()):
+            postings = self._postings[token]
+            postings.discard(path)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+        self._empty.discard(path)
+        self._errors.discard(path)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._tokens.clear()
+            self._empty.clear()
+            self._errors.clear()
+            self._vocabulary = []
+            self._vocabulary_dirty = False
+
+    def _prefix_matches(self, prefix):
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        matches = set()
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            matches |= self._postings[token]
+        return matches
+
+    def search(self, query):
+        # Returns the set of matching paths, or None if the query has no terms (no filtering).
+        terms = query.lower().split()
+        if not terms:
+            return None
+        include = []
+        exclude = set()
+        with self._lock:
+            for position, term in enumerate(terms):
+                # Posting sets are only read here; intersection() below builds a new set.
+                if term == "is:empty":
+                    include.append(self._empty)
+                elif term == "is:error":
+                    include.append(self._errors)
+                elif term == "is:captioned":
+                    include.append(self._tokens.keys() - self._empty)
+                elif term.startswith("-") and len(term) > 1:
+                    for token in tokenize(term[1:]):
+                        exclude |= self._postings.get(token, set())
+                else:
+                    for token in sorted(tokenize(term)):
+                        if position == len(terms) - 1:
+                            include.append(self._prefix_matches(token))
+                        else:
+                            include.append(self._postings.get(token, set()))
+            if include:
+                include.sort(key=len)
+                results = include[0].intersection(*include[1:])
+            else:
+                results = set(self._tokens)
+        return results - exclude
@@ -0,0 +1,58 @@
+# src/components/sidecars.py
+import os
+import threading
+
+
+def caption_path_for(image_path):
+    return os.path.splitext(image_path)[0] + ".txt"
+
+
+def read_caption(image_path):
+    caption_file_path = caption_path_for(image_path)
+    if os.path.exists(caption_file_path):
+        with open(caption_file_path) as f:
+            return f.read()
+    return ""
+
+
+def write_caption(image_path, caption_text, fsync=False):
+    # Written to a temp file and renamed over the sidecar, so a crash mid-write leaves either the
+    # old caption or the new one, never a truncated file. fsync=True also flushes the new caption
+    # to disk before the rename.
+    caption_file_path = caption_path_for(image_path)
+    tmp_path = f"{caption_file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(caption_text)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, caption_file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def fsync_directory(directory):
+    # Makes renames inside directory durable. Not supported on Windows, where it is skipped.
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def has_caption(image_path):
+    # A sidecar that exists but only holds whitespace still counts as uncaptioned.
+    try:
+        return bool(read_caption(image_path).strip())
+    except OSError:
+        return False
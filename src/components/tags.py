@@ -0,0 +1,95 @@
+# src/components/tags.py
+import os
+
+DEFAULT_TAGS = ("cat", "dog", "house", "car")
+
+
+class TagStore:
+    # Tag vocabulary backed by a text file with one tag per line. Tags keep their order in a
+    # dict (used as an ordered set) so lookups don't scan the list. Adding a tag appends one
+    # line; renames and deletes rewrite the file through a temp file and os.replace, so a crash
+    # never leaves it half written. A missing or empty file starts from DEFAULT_TAGS.
+
+    def __init__(self, path, defaults=DEFAULT_TAGS):
+        self.path = path
+        self._tags = {}
+        self._on_disk = False  # False while the defaults haven't been written yet
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    tag = line.strip()
+                    if tag:
+                        self._tags[tag] = None
+            self._on_disk = bool(self._tags)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading tags: {e}")
+        if not self._tags:
+            self._tags = dict.fromkeys(defaults)
+
+    def __contains__(self, tag):
+        return tag in self._tags
+
+    def __iter__(self):
+        return iter(self._tags)
+
+    def __len__(self):
+        return len(self._tags)
+
+    def add(self, tag):
+        # Returns False if the tag is empty or already present.
+        tag = tag.strip()
+        if not tag or tag in self._tags:
+            return False
+        self._tags[tag] = None
+        if not self._on_disk:
+            self._rewrite()
+            return True
+        try:
+            with open(self.path, "ab+") as f:
+                # A hand-edited file may not end with a newline; don't glue the tag onto its last line.
+                size = f.seek(0, os.SEEK_END)
+                if size:
+                    f.seek(size - 1)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+                f.write((tag + "\n").encode("utf-8"))
+        except OSError as e:
+            print(f"Error saving tags: {e}")
+        return True
+
+    def rename(self, old_tag, new_tag):
+        # Keeps the tag's position. Raises KeyError if old_tag is unknown and ValueError if
+        # new_tag is empty or already taken.
+        new_tag = new_tag.strip()
+        if old_tag not in self._tags:
+            raise KeyError(old_tag)
+        if not new_tag:
+            raise ValueError("Tag name cannot be empty.")
+        if new_tag in self._tags:
+            raise ValueError(f"Tag '{new_tag}' already exists.")
+        self._tags = {new_tag if tag == old_tag else tag: None for tag in self._tags}
+        self._rewrite()
+
+    def remove(self, tag):
+        del self._tags[tag]
+        self._rewrite()
+
+    def search(self, prefix):
+        # Tags starting with prefix (case-insensitive), in list order.
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return list(self._tags)
+        return [tag for tag in self._tags if tag.lower().startswith(prefix)]
+
+    def _rewrite(self):
+        # Write errors are reported but keep the in-memory change, like any unsaved edit.
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(tag + "\n" for tag in self._tags)
+            os.replace(tmp_path, self.path)
+            self._on_disk = True
+        except OSError as e:
+            print(f"Error saving tags: {e}")
@@ -0,0 +1,117 @@
+# src/components/thumbnails.py
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+from components.preprocess import flatten_to_rgb
+
+DEFAULT_CACHE_DIR = ".thumbnails"
+# Thumbnails are shown at 100px; build them at twice that so they stay sharp on HiDPI screens.
+THUMBNAIL_SIZE = 200
+THUMBNAIL_QUALITY = 80
+
+
+def build_thumbnail(image_path, thumb_path, size=THUMBNAIL_SIZE):
+    # Runs in a worker process. Written to a temp file first so a half-written
+    # thumbnail is never picked up from the cache. Returns the path and the build time.
+    started = time.perf_counter()
+    with Image.open(image_path) as img:
+        img.draft("RGB", (size, size))
+        thumb = ImageOps.exif_transpose(img)
+    thumb.thumbnail((size, size), Image.LANCZOS)
+    thumb = flatten_to_rgb(thumb)
+    tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+    thumb.save(tmp_path, format="JPEG", quality=THUMBNAIL_QUALITY)
+    os.replace(tmp_path, thumb_path)
+    return thumb_path, time.perf_counter() - started
+
+
+class ThumbnailCache:
+    # On-disk thumbnail cache keyed by path, mtime and size, filled by a process pool.
+    # on_ready(image_path, thumb_path) is called from a pool management thread;
+    # thumb_path is None if the thumbnail could not be built. Build times go to the optional
+    # MetricsRegistry as thumbnail_build_seconds.
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, size=THUMBNAIL_SIZE, max_workers=None, metrics=None):
+        self.cache_dir = cache_dir
+        self.metrics = metrics
+        self.size = size
+        self.max_workers = max_workers
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn rather than fork: the UI process is multi-threaded.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def thumbnail_path(self, image_path, stat=None):
+        stat = stat or os.stat(image_path)
+        key = f"{os.path.abspath(image_path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".jpg")
+
+    def get(self, image_path):
+        try:
+            thumb_path = self.thumbnail_path(image_path)
+        except OSError:
+            return None
+        return thumb_path if os.path.exists(thumb_path) else None
+
+    def request(self, image_path, on_ready):
+        # Returns the cached thumbnail path right away if there is one, otherwise
+        # schedules a build and returns None.
+        try:
+            thumb_path = self.thumbnail_path(image_path)
+        except OSError:
+            return None
+        if os.path.exists(thumb_path):
+            return thumb_path
+
+        with self._lock:
+            future = self._pending.get(thumb_path)
+            if future is None:
+                os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+                future = self._get_executor().submit(build_thumbnail, image_path, thumb_path, self.size)
+                self._pending[thumb_path] = future
+
+        def done(f):
+            with self._lock:
+                self._pending.pop(thumb_path, None)
+            if f.cancelled():
+                return
+            try:
+                result, elapsed = f.result()
+            except Exception as e:
+                print(f"Error building thumbnail for {image_path}: {e}")
+                result = None
+            else:
+                if self.metrics is not None:
+                    self.metrics.observe("thumbnail_build_seconds", elapsed)
+            on_ready(image_path, result)
+
+        future.add_done_callback(done)
+        return None
+
+    def cancel_pending(self):
+        # Drops queued builds (e.g. when another folder is opened); running ones finish.
+        with self._lock:
+            pending = list(self._pending.values())
+        for future in pending:
+            future.cancel()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
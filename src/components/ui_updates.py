@@ -0,0 +1,90 @@
+# src/components/ui_updates.py
+import threading
+
+# One flush per frame at 60 Hz.
+FRAME_INTERVAL = 1 / 60
+
+
+class UpdateScheduler:
+    # Coalesces Flet updates. update(*controls) marks controls dirty and at most one
+    # page.update(...) per frame sends everything marked since the last flush, so a handler
+    # (or a batch reporting progress per image) can call it as often as it likes.
+    # update() with no controls, or with the page itself, schedules a full page update.
+    # Safe to call from any thread; flushes run on the page's event loop.
+
+    def __init__(self, page, interval=FRAME_INTERVAL):
+        self.page = page
+        self.interval = interval
+        self._dirty = {}  # id(control) -> control
+        self._full = False
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.flushes = 0
+
+    def update(self, *controls):
+        with self._lock:
+            self.requests += 1
+            if not controls:
+                self._full = True
+            for control in controls:
+                if control is self.page:
+                    self._full = True
+                else:
+                    self._dirty[id(control)] = control
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.page.loop.call_soon_threadsafe(self.page.loop.call_later, self.interval, self.flush)
+
+    def flush(self):
+        with self._lock:
+            full, self._full = self._full, False
+            dirty, self._dirty = self._dirty, {}
+            self._scheduled = False
+        if full:
+            self.page.update()
+        else:
+            # Controls that were removed from the page since being marked have nothing to send.
+            controls = [control for control in dirty.values() if control.page]
+            if not controls:
+                return
+            self.page.update(*controls)
+        self.flushes += 1
+
+
+class Debouncer:
+    # Runs fn(*args) once calls have stopped for `delay` seconds, with the arguments of the
+    # last call. flush() runs a pending call right away (e.g. before switching images).
+
+    def __init__(self, delay, fn):
+        self.delay = delay
+        self.fn = fn
+        self._timer = None
+        self._args = None
+        self._lock = threading.Lock()
+
+    def call(self, *args):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._args = args
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            args, self._args = self._args, None
+        if args is not None:
+            self.fn(*args)
+
+    def cancel(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._args = None
@@ -0,0 +1,147 @@
+# src/components/virtual_list.py
+import math
+import threading
+
+import flet as ft
+
+DEFAULT_OVERSCAN = 10
+# Used until the first scroll event reports the real viewport height.
+DEFAULT_VIEWPORT_EXTENT = 1200
+
+
+class VirtualList:
+    # A scrollable column that only materializes controls for the rows in view plus an
+    # overscan margin; two spacers stand in for every other row so the scroll extent
+    # stays correct. All rows must be item_extent pixels tall.
+    #
+    # build_item(item) -> Control builds a row the first time it scrolls into view.
+    # on_window_changed(items) is called with the materialized items after every render.
+    # With an UpdateScheduler as ui, renders are sent at most once per frame however fast the
+    # scroll events come; without one the column is updated on every render.
+
+    def __init__(self, build_item, item_extent, overscan=DEFAULT_OVERSCAN, on_window_changed=None, ui=None,
+                 **column_kwargs):
+        self.build_item = build_item
+        self.item_extent = item_extent
+        self.overscan = overscan
+        self.on_window_changed = on_window_changed
+        self.ui = ui
+        self.items = []
+        self._positions = {}  # item -> index in self.items
+        self._controls = {}  # item -> control, for materialized rows only
+        self._window = (0, 0)
+        self._pixels = 0.0
+        self._viewport = DEFAULT_VIEWPORT_EXTENT
+        self._lock = threading.RLock()
+        self._top_spacer = ft.Container(height=0)
+        self._bottom_spacer = ft.Container(height=0)
+        self.control = ft.Column(
+            controls=[self._top_spacer, self._bottom_spacer],
+            spacing=0,
+            scroll=ft.ScrollMode.AUTO,
+            on_scroll=self._on_scroll,
+            on_scroll_interval=30,
+            **column_kwargs,
+        )
+
+    def __len__(self):
+        return len(self.items)
+
+    def set_items(self, items):
+        with self._lock:
+            self.items = list(items)
+            self._positions = {item: i for i, item in enumerate(self.items)}
+            self._controls = {}
+            self._pixels = 0.0
+        if self.control.page:
+            self.control.scroll_to(offset=0, duration=0)
+        self._render(force=True)
+
+    def extend(self, items):
+        with self._lock:
+            for item in items:
+                self._positions[item] = len(self.items)
+                self.items.append(item)
+        self._render(force=True)
+
+    def update_items(self, items, changed=()):
+        # Replaces the items without resetting the scroll position. Rows that are still listed
+        # keep their controls, except those for `changed` items, which are rebuilt.
+        with self._lock:
+            self.items = list(items)
+            self._positions = {item: i for i, item in enumerate(self.items)}
+            for item in changed:
+                self._controls.pop(item, None)
+        self._render(force=True)
+
+    def remove(self, item):
+        # Drops one row in place: the scroll position and the other rows' controls are kept.
+        with self._lock:
+            index = self._positions.pop(item, None)
+            if index is None:
+                return
+            del self.items[index]
+            for other in self.items[index:]:
+                self._positions[other] -= 1
+            self._controls.pop(item, None)
+        self._render(force=True)
+
+    def replace(self, item, new_item):
+        # Swaps one row for new_item at the same position; only that row is rebuilt.
+        with self._lock:
+            index = self._positions.pop(item, None)
+            if index is None:
+                return
+            self.items[index] = new_item
+            self._positions[new_item] = index
+            self._controls.pop(item, None)
+        self._render(force=True)
+
+    def index_of(self, item):
+        return self._positions.get(item)
+
+    def get_control(self, item):
+        # Returns None when the item is not currently materialized.
+        return self._controls.get(item)
+
+    def scroll_to_index(self, index):
+        with self._lock:
+            first, last = self._window
+            # Leave the view alone while the row is already comfortably on screen.
+            if first + self.overscan <= index < last - self.overscan - 1:
+                return
+            self._pixels = max(index * self.item_extent - self._viewport / 2, 0)
+        if self.control.page:
+            self.control.scroll_to(offset=self._pixels, duration=0)
+        self._render()
+
+    def _on_scroll(self, e):
+        with self._lock:
+            self._pixels = e.pixels or 0.0
+            if e.viewport_dimension:
+                self._viewport = e.viewport_dimension
+        self._render()
+
+    def _render(self, force=False):
+        with self._lock:
+            count = len(self.items)
+            first = max(int(self._pixels // self.item_extent) - self.overscan, 0)
+            last = min(math.ceil((self._pixels + self._viewport) / self.item_extent) + self.overscan, count)
+            first = min(first, last)
+            if not force and (first, last) == self._window:
+                return
+            self._window = (first, last)
+            visible = self.items[first:last]
+            # Rows that stay in the window keep their control, so only new rows are sent to the client.
+            controls = {item: self._controls.get(item) or self.build_item(item) for item in visible}
+            self._controls = controls
+            self._top_spacer.height = first * self.item_extent
+            self._bottom_spacer.height = (count - last) * self.item_extent
+            self.control.controls = [self._top_spacer, *controls.values(), self._bottom_spacer]
+        if self.control.page:
+            if self.ui is not None:
+                self.ui.update(self.control)
+            else:
+                self.control.update()
+        if self.on_window_changed:
+            self.on_window_changed(visible)
@@ -0,0 +1,322 @@
+# src/components/watcher.py
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+from components.scanner import IMAGE_EXTENSIONS
+
+CAPTION_EXTENSION = ".txt"
+# A batch is applied once events have been quiet this long...
+DEFAULT_DEBOUNCE = 0.5
+# ...or at least this often while a bulk copy keeps them coming.
+MAX_BATCH_DELAY = 2.0
+DEFAULT_POLL_INTERVAL = 2.0
+# A backend whose reads keep failing is retried with exponential backoff, and inotify is replaced
+# by polling after this many failures in a row.
+READ_ERROR_BACKOFF = 0.5
+MAX_READ_ERROR_BACKOFF = 30.0
+MAX_READ_FAILURES = 5
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# Files are reported once they are closed after writing or renamed into place (which is how
+# atomic writers publish them), not when they are created half-written.
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _is_hidden(name):
+    # Same rule as scan_images: hidden directories (e.g. .thumbnails) are not part of the folder.
+    return name.startswith(".")
+
+
+class _InotifyBackend:
+    # One watch per directory, added recursively and for directories created later.
+
+    def __init__(self, root, recursive, is_relevant):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.root = root
+        self.recursive = recursive
+        self.is_relevant = is_relevant
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}  # wd -> directory path
+        try:
+            self._watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch(self, directory):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch failed for {directory}: {os.strerror(errno)}")
+        self._dirs[wd] = directory
+
+    def _watch_tree(self, root):
+        # Returns the relevant files already inside root, so files created before their
+        # directory was watched aren't missed.
+        files = []
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            try:
+                self._watch(directory)
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        if self.is_relevant(entry.name):
+                            files.append(entry.path)
+                    elif (self.recursive and entry.is_dir(follow_symlinks=False)
+                          and not _is_hidden(entry.name)):
+                        pending.append(entry.path)
+                except OSError:
+                    continue
+        return files
+
+    def _unwatch_tree(self, root):
+        prefix = root + os.sep
+        for wd, directory in list(self._dirs.items()):
+            if directory == root or directory.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._dirs[wd]
+
+    def read(self, timeout):
+        # Returns the touched paths; None in the list means events were lost.
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        touched = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0"))
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                touched.append(None)
+                continue
+            directory = self._dirs.get(wd)
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            if directory is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if directory == self.root:
+                    touched.append(None)
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if not self.recursive or _is_hidden(name):
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        touched.extend(self._watch_tree(path))
+                    except OSError as e:
+                        print(f"Error watching {path}: {e}")
+                        touched.append(None)
+                elif mask & IN_MOVED_FROM:
+                    # Everything below it is gone from the folder; let the caller rescan.
+                    self._unwatch_tree(path)
+                    touched.append(None)
+                continue
+            if mask & IN_CREATE:
+                continue  # Reported by IN_CLOSE_WRITE once it has been written
+            if self.is_relevant(name):
+                touched.append(path)
+        return touched
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class _PollingBackend:
+    # Compares (mtime, size) snapshots of the relevant files. A full listing of a large tree takes
+    # a while, so the interval grows to ten times the last listing's duration.
+
+    def __init__(self, root, recursive, is_relevant, interval, stop_event):
+        self.root = root
+        self.recursive = recursive
+        self.is_relevant = is_relevant
+        self.interval = interval
+        self._stop = stop_event
+        self._snapshot, elapsed = self._take_snapshot()
+        self._next_poll = time.monotonic() + max(self.interval, elapsed * 10)
+
+    def _take_snapshot(self):
+        started = time.perf_counter()
+        snapshot = {}
+        pending = [self.root]
+        while pending:
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        if self.is_relevant(entry.name):
+                            stat = entry.stat()
+                            snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                    elif (self.recursive and entry.is_dir(follow_symlinks=False)
+                          and not _is_hidden(entry.name)):
+                        pending.append(entry.path)
+                except OSError:
+                    continue
+        return snapshot, time.perf_counter() - started
+
+    def read(self, timeout):
+        wait = self._next_poll - time.monotonic()
+        if wait > 0:
+            self._stop.wait(min(wait, timeout))
+            return []
+        snapshot, elapsed = self._take_snapshot()
+        previous, self._snapshot = self._snapshot, snapshot
+        self._next_poll = time.monotonic() + max(self.interval, elapsed * 10)
+        touched = [path for path, state in snapshot.items() if previous.get(path) != state]
+        touched.extend(path for path in previous if path not in snapshot)
+        return touched
+
+    def close(self):
+        pass
+
+
+class FolderWatcher:
+    # Watches a folder for images and caption sidecars being added, removed or rewritten by other
+    # programs. Events are collected and handed over in debounced batches on a background thread:
+    # on_changes(paths) gets the set of touched file paths, and it is up to the caller to check
+    # what they are now. on_changes(None) means events were lost (queue overflow, a directory
+    # moved away) and the caller should rescan the folder instead.
+    #
+    # Uses inotify on Linux and falls back to polling elsewhere, or when inotify is unavailable
+    # (e.g. the per-user watch limit is reached) or keeps failing.
+
+    def __init__(self, root, on_changes, extensions=IMAGE_EXTENSIONS, recursive=True,
+                 debounce=DEFAULT_DEBOUNCE, max_delay=MAX_BATCH_DELAY, poll_interval=DEFAULT_POLL_INTERVAL,
+                 use_polling=False):
+        self.root = os.path.abspath(root)
+        self.on_changes = on_changes
+        self.extensions = tuple(ext.lower() for ext in extensions) + (CAPTION_EXTENSION,)
+        self.recursive = recursive
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.use_polling = use_polling
+        self.backend_name = None
+        self._backend = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_relevant(self, name):
+        return name.lower().endswith(self.extensions)
+
+    def start(self):
+        # Sets up the watches on the calling thread, so changes made after start() returns are seen.
+        if not self.use_polling:
+            try:
+                self._backend = _InotifyBackend(self.root, self.recursive, self.is_relevant)
+                self.backend_name = "inotify"
+            except (OSError, AttributeError) as e:
+                print(f"inotify unavailable ({e}), polling {self.root} instead")
+        if self._backend is None:
+            self._start_polling()
+        self._thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        self._thread.start()
+
+    def _start_polling(self):
+        self._backend = _PollingBackend(self.root, self.recursive, self.is_relevant, self.poll_interval, self._stop)
+        self.backend_name = "polling"
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+
+    def _run(self):
+        pending = set()
+        rescan = False
+        first_event = last_event = None
+        failures = 0
+        try:
+            while not self._stop.is_set():
+                if first_event is None:
+                    timeout = 0.5
+                else:
+                    deadline = min(last_event + self.debounce, first_event + self.max_delay)
+                    timeout = min(max(deadline - time.monotonic(), 0), 0.5)
+                try:
+                    touched = self._backend.read(timeout)
+                except Exception as e:
+                    failures += 1
+                    if failures < MAX_READ_FAILURES or self.backend_name == "polling":
+                        delay = min(READ_ERROR_BACKOFF * 2 ** (failures - 1), MAX_READ_ERROR_BACKOFF)
+                        print(f"Error watching {self.root}: {e}; retrying in {delay:.1f}s")
+                        self._stop.wait(delay)
+                        continue
+                    print(f"Error watching {self.root}: {e}; polling instead after {failures} failures")
+                    self._backend.close()
+                    self._start_polling()
+                    touched = []
+                if failures:
+                    # Changes may have been missed while reads were failing: one rescan covers them.
+                    failures = 0
+                    touched = [*touched, None]
+                now = time.monotonic()
+                if touched:
+                    for path in touched:
+                        if path is None:
+                            rescan = True
+                        else:
+                            pending.add(path)
+                    if first_event is None:
+                        first_event = now
+                    last_event = now
+                if first_event is None or self._stop.is_set():
+                    continue
+                if now - last_event >= self.debounce or now - first_event >= self.max_delay:
+                    batch, pending = pending, set()
+                    first_event = last_event = None
+                    try:
+                        self.on_changes(None if rescan else batch)
+                    except Exception as e:
+                        print(f"Error applying folder changes: {e}")
+                    rescan = False
+        finally:
+            self._backend.close()
@@ -1,24 +1,79 @@
 # src/main.py
+import asyncio
 import flet as ft
 import os
+import threading
+import time
+from dataclasses import replace
 import openai
 from dotenv import load_dotenv
-import base64
 
-dotenv_loaded = load_dotenv()  # Load .env first to ensure it's loaded even if env var is set
-print(f"dotenv_loaded: {dotenv_loaded}")  # Debug print to check if dotenv was loaded
-openai_api_key = os.getenv("OPENAI_API_KEY")
-print(f"API Key after loading dotenv: {openai_api_key}")  # Debug print
-if not openai_api_key:
-    print(".env file did not contain OPENAI_API_KEY, or not loaded properly")  # Debug print
-openai.api_key = openai_api_key
+from components.batch import BatchCaptioner, DEFAULT_CONCURRENCY
+from components.batch_api import DEFAULT_JOB_DIR, BatchJob
+from components.caption_cache import CaptionCache
+from components.caption_store import CaptionStore
+from components.caption_writer import DEFAULT_FSYNC, FSYNC_POLICIES, CaptionWriter
+from components.captioning import DEFAULT_PROMPT, caption_image, error_caption
+from components.duplicates import DEFAULT_MAX_DISTANCE, HashCache, compute_hashes, group_duplicates
+from components.export import (
+    DEFAULT_EXPORT_FORMAT,
+    DEFAULT_SHARD_SIZE,
+    EXPORT_FORMATS,
+    ExportError,
+    export_dataset,
+)
+from components.metrics import MetricsRegistry, record_caption_result
+from components.packing import PackedCaptioner
+from components.prefetch import DEFAULT_PREFETCH_DISTANCE, PreviewCache
+from components.preprocess import (
+    DEFAULT_FORMAT,
+    DEFAULT_MAX_SIDE,
+    DEFAULT_QUALITY,
+    OUTPUT_FORMATS,
+    PreprocessOptions,
+    format_bytes,
+)
+from components.providers import (
+    DEFAULT_PROVIDER,
+    PROVIDERS_FILE,
+    Provider,
+    create_sync_client,
+    describe_providers,
+    get_async_client,
+    load_providers,
+)
+from components.ratelimit import DEFAULT_MAX_RETRIES, RequestScheduler
+from components.scanner import IMAGE_EXTENSIONS, parse_extensions, scan_images
+from components.search import CaptionIndex
+from components.sidecars import caption_path_for, read_caption
+from components.tags import TagStore
+from components.thumbnails import ThumbnailCache
+from components.ui_updates import Debouncer, UpdateScheduler
+from components.virtual_list import VirtualList
+from components.watcher import CAPTION_EXTENSION, FolderWatcher
+
+load_dotenv()  # Load .env first to ensure it's loaded even if env var is set
 
 TAGS_FILE = "tags.txt"
+CAPTION_CACHE_FILE = "caption_cache.sqlite3"
+CAPTION_STORE_FILE = "captions.sqlite3"
+THUMBNAIL_CACHE_DIR = ".thumbnails"
+METRICS_EXPORT_FILE = "metrics.prom"
+# Seconds between refreshes of the stats panel while it is open.
+STATS_REFRESH_INTERVAL = 1.0
+# Seconds of no typing before an edited caption is autosaved.
+AUTOSAVE_DELAY = 1.0
 
 # Set minimum widths as constants
 MIN_THUMBNAILS_WIDTH = 160
 MIN_CENTRAL_WIDTH = 400
 MIN_TAG_MANAGEMENT_WIDTH = 250
+# Every sidebar row is a 100px thumbnail with 5px padding on each side.
+THUMBNAIL_ROW_HEIGHT = 110
+# Every tag row is a fixed 40px high so the tag list can be virtualized too.
+TAG_ROW_HEIGHT = 40
+# Border colours that tell adjacent duplicate groups apart in the sidebar.
+DUPLICATE_GROUP_COLORS = (ft.Colors.AMBER, ft.Colors.LIGHT_BLUE, ft.Colors.PINK_200, ft.Colors.LIGHT_GREEN)
 
 def main(page: ft.Page):
     page.title = "Image Captioning Tool"
@@ -31,7 +86,7 @@ def main(page: ft.Page):
     def toggle_settings_visibility(e):
         nonlocal settings_column
         settings_column.visible = not settings_column.visible
-        page.update()
+        ui.update(settings_column)
 
     page.spacing = 0
 
@@ -65,27 +120,26 @@ def main(page: ft.Page):
     )
 
     page.snack_bar = ft.SnackBar(ft.Text(""))
+
+    # Handlers mark what changed with ui.update(...) instead of calling page.update() directly;
+    # everything marked within a frame goes out in one update.
+    ui = UpdateScheduler(page)
+    # Timings and counters from the hot paths, shown in the stats panel and exportable.
+    metrics = MetricsRegistry()
+
+    def show_message(message):
+        page.snack_bar.content = ft.Text(message)
+        page.snack_bar.open = True
+        ui.update(page.snack_bar)
     selected_folder_path = ft.Text("No folder selected", italic=True)
 
     # Initialize variables
     current_image_path = None
-    tags = []
+    current_folder = None
+    image_files = []
+    tag_store = TagStore(TAGS_FILE)
     editing_tag = None
 
-    def load_tags():
-        nonlocal tags
-        if os.path.exists(TAGS_FILE):
-            try:
-                loaded_tags = [line.strip() for line in open(TAGS_FILE) if line.strip()]
-                tags = loaded_tags if loaded_tags else ["cat", "dog", "house", "car"]
-            except Exception as e:
-                print(f"Error loading tags: {e}")
-                tags = ["cat", "dog", "house", "car"]
-        else:
-            tags = ["cat", "dog", "house", "car"]
-
-    load_tags()
-
     # Tag input field and add button
     tag_input_field = ft.TextField(
         label="Add New Tag",
@@ -96,110 +150,743 @@ def main(page: ft.Page):
     add_tag_button = ft.ElevatedButton("Add Tag")
     tag_input_row = ft.Column(controls=[tag_input_field, add_tag_button], width=150, tight=True)
 
-    # Tag list area (will fill available space inside the scrollable container)
-    tag_list_column = ft.Column()
-    tag_list_container = ft.Container(
-        content=tag_list_column,
-        expand=True,
-        padding=ft.padding.only(right=40)
+    # Prefix filter over the tag list, applied as you type.
+    tag_filter_field = ft.TextField(
+        hint_text="Filter tags",
+        width=150,
+        dense=True,
+        fill_color=ft.Colors.BLACK,
+        border_color=ft.Colors.GREY,
+        on_change=lambda e: update_tag_list(),
     )
 
     # Tag edit container (this area will remain fixed at the bottom)
     tag_edit_container = ft.Container()
 
-    def save_caption(image_path, caption_text):
+    # Inverted index over the captions of the current folder, used by the sidebar search box.
+    caption_index = CaptionIndex()
+
+    # Optional SQLite index of the captions, kept in sync with the .txt sidecars.
+    caption_store = CaptionStore(CAPTION_STORE_FILE)
+    store_status_text = ft.Text("", italic=True)
+
+    def get_store():
+        return caption_store if use_store_checkbox.value else None
+
+    def update_store_status():
+        if not (use_store_checkbox.value and current_folder):
+            store_status_text.value = ""
+            return
+        coverage = caption_store.coverage(current_folder)
+        store_status_text.value = (
+            f"Coverage: {coverage['captioned']}/{coverage['images']} captioned, "
+            f"{coverage['errors']} error captions"
+        )
+
+    def sync_store(folder, files):
+        # Runs on a background thread: one stat per image, and only changed sidecars are read.
+        caption_writer.flush()
+        started = time.perf_counter()
+        read = caption_store.import_sidecars(files)
+        removed = caption_store.prune(folder, files)
+        print(f"Caption index synced in {time.perf_counter() - started:.2f}s ({read} new or changed, {removed} removed)")
+        update_store_status()
+        ui.update()
+
+    def on_use_store_change(e):
+        if use_store_checkbox.value and current_folder:
+            page.run_thread(sync_store, current_folder, list(image_files))
+        else:
+            update_store_status()
+            ui.update()
+
+    def on_import_sidecars_click(e):
+        if current_folder:
+            page.run_thread(sync_store, current_folder, list(image_files))
+
+    def on_export_sidecars_click(e):
+        if not current_folder:
+            return
+        caption_writer.flush()  # Queued captions are newer than the index
+        written = caption_store.export_sidecars(current_folder)
+        show_message(f"Wrote {written} caption files from the index.")
+
+    use_store_checkbox = ft.Checkbox(label="Index captions in SQLite", value=False, on_change=on_use_store_change)
+    store_actions_row = ft.Row(
+        controls=[
+            ft.ElevatedButton("Import Sidecars", on_click=on_import_sidecars_click),
+            ft.ElevatedButton("Export Sidecars", on_click=on_export_sidecars_click),
+        ],
+        alignment=ft.MainAxisAlignment.CENTER,
+        spacing=10,
+    )
+
+    # Sidecars are written behind by a background thread: saving only queues the caption (and
+    # replaces one still queued for the same image), so neither the UI nor batch workers wait on
+    # the disk. Reads go through load_caption, which sees queued captions.
+    def on_caption_written(image_path, caption_text, result):
+        remember_caption_write(image_path)
+        if get_store():
+            caption_store.put(image_path, caption_text, result)
+
+    caption_write_errors = []  # image paths whose sidecar write failed, checked by batch apply
+
+    def on_caption_write_error(image_path, error):
+        print(f"Error writing caption for {image_path}: {error}")
+        caption_write_errors.append(image_path)
+        show_message(f"Error saving caption for {os.path.basename(image_path)}: {error}")
+
+    caption_writer = CaptionWriter(
+        DEFAULT_FSYNC, on_written=on_caption_written, on_error=on_caption_write_error, metrics=metrics
+    )
+    fsync_dropdown = ft.Dropdown(
+        value=DEFAULT_FSYNC,
+        label="Caption fsync",
+        tooltip="none: leave flushing to the OS. file: fsync every caption. full: also fsync folders.",
+        options=[ft.dropdown.Option(policy) for policy in FSYNC_POLICIES],
+        width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+
+    def on_fsync_change(e):
+        caption_writer.fsync = fsync_dropdown.value
+
+    fsync_dropdown.on_change = on_fsync_change
+
+    def save_caption(image_path, caption_text, notify=True, result=None):
+        # Batch captioning saves through here with notify=False so it doesn't pop a snack bar per image.
         if image_path:
-            caption_file_path = os.path.splitext(image_path)[0] + ".txt"
             try:
-                with open(caption_file_path, 'w') as f:
-                    f.write(caption_text)
-                page.snack_bar.content = ft.Text("Caption saved!")
+                with metrics.time("caption_save_seconds"):
+                    caption_writer.save(image_path, caption_text, result)
+                    caption_index.update(image_path, caption_text)
+                    preview_cache.update_caption(image_path, caption_text)
+                message = "Caption saved!"
             except Exception as e:
-                page.snack_bar.content = ft.Text(f"Error saving caption: {e}")
+                if not notify:
+                    raise
+                message = f"Error saving caption: {e}"
         else:
-            page.snack_bar.content = ft.Text("No image selected to save caption for.")
-        page.snack_bar.open = True
-        page.update()
+            message = "No image selected to save caption for."
+        if notify:
+            show_message(message)
 
     def load_caption(image_path):
         if image_path:
-            caption_file_path = os.path.splitext(image_path)[0] + ".txt"
-            if os.path.exists(caption_file_path):
-                try:
-                    return open(caption_file_path).read()
-                except Exception as e:
-                    print(f"Error loading caption: {e}")
-                    return ""
-            return ""
+            queued = caption_writer.get(image_path)
+            if queued is not None:
+                return queued
+            try:
+                with metrics.time("caption_load_seconds"):
+                    return read_caption(image_path)
+            except Exception as e:
+                print(f"Error loading caption: {e}")
+                return ""
         return ""
 
+    def is_captioned(image_path):
+        # A caption that only holds whitespace still counts as uncaptioned.
+        return bool(load_caption(image_path).strip())
+
+    # Optional autosave: an edited caption is written once typing pauses, not on every keystroke.
+    autosave_checkbox = ft.Checkbox(label="Autosave captions", value=False)
+
+    def autosave(image_path, caption_text):
+        try:
+            if caption_text != load_caption(image_path):
+                save_caption(image_path, caption_text, notify=False)
+        except Exception as e:
+            print(f"Error autosaving caption for {image_path}: {e}")
+
+    autosaver = Debouncer(AUTOSAVE_DELAY, autosave)
+
+    def schedule_autosave():
+        if autosave_checkbox.value and current_image_path:
+            autosaver.call(current_image_path, caption_input.value)
+
+    # Set while the caption box holds text that wasn't loaded from disk, so a caption rewritten by
+    # another program doesn't replace unsaved edits.
+    caption_edited = False
+
+    def on_caption_change(e):
+        nonlocal caption_edited
+        caption_edited = True
+        schedule_autosave()
+
+    caption_input.on_change = on_caption_change
+
     def on_save_button_click(e):
-        nonlocal current_image_path
+        nonlocal current_image_path, caption_edited
+        autosaver.cancel()
         save_caption(current_image_path, caption_input.value)
+        caption_edited = False
 
     save_button = ft.ElevatedButton("Save Caption", on_click=on_save_button_click)
     api_key_field = ft.Ref[ft.TextField]()  # Declare api_key_field as Ref
+
+    # Captioning backends: the hosted API plus any OpenAI-compatible servers listed in
+    # providers.json. The model, endpoint and max tokens of the selected one can be overridden here.
+    try:
+        providers = load_providers(PROVIDERS_FILE)
+    except ValueError as e:
+        print(f"Error loading providers: {e}")
+        providers = {DEFAULT_PROVIDER: Provider()}
+    provider_dropdown = ft.Dropdown(
+        value=DEFAULT_PROVIDER if DEFAULT_PROVIDER in providers else next(iter(providers)),
+        label="Provider",
+        options=[ft.dropdown.Option(name) for name in providers],
+        width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    model_field = ft.TextField(label="Model", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY)
+    base_url_field = ft.TextField(
+        label="Base URL (empty = OpenAI)", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    max_tokens_field = ft.TextField(label="Max Tokens", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY)
+
+    def show_provider_settings():
+        provider = providers[provider_dropdown.value]
+        model_field.value = provider.model
+        base_url_field.value = provider.base_url or ""
+        max_tokens_field.value = str(provider.max_tokens)
+
+    def on_provider_change(e):
+        show_provider_settings()
+        ui.update(model_field, base_url_field, max_tokens_field)
+
+    provider_dropdown.on_change = on_provider_change
+    show_provider_settings()
+
+    def get_provider():
+        provider = providers[provider_dropdown.value]
+        return replace(
+            provider,
+            model=(model_field.value or "").strip() or provider.model,
+            base_url=(base_url_field.value or "").strip() or provider.base_url,
+            max_tokens=read_int_field(max_tokens_field, provider.max_tokens) or provider.max_tokens,
+        )
+
     # Set a default prompt value here.
     prompt_field = ft.TextField(
-        value="Write a caption for this image as if it was going to be used to train a vision model.",
+        value=DEFAULT_PROMPT,
         label="Prompt", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
     )
     progress_bar = ft.ProgressBar()
+    concurrency_field = ft.TextField(
+        value=str(DEFAULT_CONCURRENCY),
+        label="Batch Concurrency", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
 
-    async def on_generate_caption_button_click(e):
-        nonlocal current_image_path, api_key_field, prompt_field, progress_bar
-        print("Generate Caption button clicked")
+    pack_size_field = ft.TextField(
+        value="1",
+        label="Images per Request (1 = no packing)", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
 
-        page.update()
-        api_key_from_field = api_key_field.current.value
-        print(f"API Key from field: {api_key_from_field}")
-        prompt = prompt_field.value
-        print(f"Prompt: {prompt}")
-        print(f"Current Image Path: {current_image_path}")
+    # Rate limits and retries: every request goes through one shared scheduler, which is
+    # rebuilt when these settings change.
+    rpm_field = ft.TextField(
+        value="0",
+        label="Requests per Minute (0 = unlimited)", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    tpm_field = ft.TextField(
+        value="0",
+        label="Tokens per Minute (0 = unlimited)", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    max_retries_field = ft.TextField(
+        value=str(DEFAULT_MAX_RETRIES),
+        label="Max Retries", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    scheduler = None
+    scheduler_settings = None
+
+    def read_int_field(field, default):
+        try:
+            return max(0, int(field.value))
+        except (TypeError, ValueError):
+            return default
+
+    def get_concurrency():
+        return read_int_field(concurrency_field, DEFAULT_CONCURRENCY) or DEFAULT_CONCURRENCY
 
-        api_key_to_use = api_key_from_field or openai.api_key
+    def get_scheduler(provider):
+        # Rate limits belong to a backend, so switching providers starts a fresh scheduler too. Its
+        # request timings are labelled with the provider for the stats panel.
+        nonlocal scheduler, scheduler_settings
+        settings = (
+            provider.name,
+            get_concurrency(),
+            read_int_field(rpm_field, 0),
+            read_int_field(tpm_field, 0),
+            read_int_field(max_retries_field, DEFAULT_MAX_RETRIES),
+        )
+        if scheduler is None or settings != scheduler_settings:
+            _, concurrency, rpm, tpm, max_retries = settings
+            scheduler = RequestScheduler(
+                max_concurrency=concurrency, rpm=rpm, tpm=tpm, max_retries=max_retries,
+                metrics=metrics.labeled(provider=provider.name),
+            )
+            scheduler_settings = settings
+        return scheduler
+
+    # Upload preprocessing: images are resized and re-encoded before being sent to the API.
+    max_side_field = ft.TextField(
+        value=str(DEFAULT_MAX_SIDE),
+        label="Max Image Side (px, 0 = no resize)", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    upload_format_dropdown = ft.Dropdown(
+        value=DEFAULT_FORMAT,
+        label="Upload Format",
+        options=[ft.dropdown.Option(fmt) for fmt in OUTPUT_FORMATS],
+        width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    quality_field = ft.TextField(
+        value=str(DEFAULT_QUALITY),
+        label="Upload Quality (1-100)", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    upload_stats_text = ft.Text("", italic=True)
+
+    # Responses are cached on disk by image content, prompt and request settings.
+    caption_cache = CaptionCache(CAPTION_CACHE_FILE)
+    use_cache_checkbox = ft.Checkbox(label="Use caption cache", value=True)
+    cache_stats_text = ft.Text("", italic=True)
+
+    def get_cache():
+        return caption_cache if use_cache_checkbox.value else None
+
+    def update_cache_stats():
+        stats = caption_cache.stats()
+        cache_stats_text.value = (
+            f"Cache: {stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%}), "
+            f"{stats['entries']} entries, {format_bytes(stats['bytes'])}"
+        )
 
-        if not api_key_to_use or not api_key_to_use.strip():  # Check for empty or whitespace API key
-            page.snack_bar.content = ft.Text("Please enter your OpenAI API key in the text field or set a non-empty OPENAI_API_KEY in the .env file.")
-            page.snack_bar.open = True
-            page.update()
+    def on_clear_cache_click(e):
+        caption_cache.clear()
+        update_cache_stats()
+        show_message("Caption cache cleared.")
+
+    clear_cache_button = ft.ElevatedButton("Clear Cache", on_click=on_clear_cache_click)
+    update_cache_stats()
+
+    def get_preprocess_options():
+        try:
+            max_side = int(max_side_field.value)
+        except (TypeError, ValueError):
+            max_side = DEFAULT_MAX_SIDE
+        try:
+            quality = min(100, max(1, int(quality_field.value)))
+        except (TypeError, ValueError):
+            quality = DEFAULT_QUALITY
+        return PreprocessOptions(
+            max_side=max_side,
+            output_format=upload_format_dropdown.value or DEFAULT_FORMAT,
+            quality=quality,
+        )
+
+    def show_upload_stats(original_bytes, upload_bytes, label="Last upload"):
+        ratio = original_bytes / upload_bytes if upload_bytes else 0
+        upload_stats_text.value = (
+            f"{label}: {format_bytes(original_bytes)} -> {format_bytes(upload_bytes)} ({ratio:.1f}x smaller)"
+        )
+
+    def get_api_key(provider):
+        api_key_to_use = provider.resolve_api_key(api_key_field.current.value)
+        if not api_key_to_use:
+            show_message(f"Please enter an API key in the text field or set {provider.api_key_env} in the .env file.")
+        return api_key_to_use
+
+    async def on_generate_caption_button_click(e):
+        nonlocal current_image_path, api_key_field, prompt_field, progress_bar, caption_edited
+        prompt = prompt_field.value
+
+        provider = get_provider()
+        api_key_to_use = get_api_key(provider)
+        if not api_key_to_use:
             return
 
         if current_image_path:
             progress_bar.visible = True
-            page.update()
+            ui.update(progress_bar)
             try:
                 generated_caption = await generate_caption_from_openai(
                     image_path=current_image_path,
                     prompt=prompt,
-                    page=page,
+                    provider=provider,
                     api_key=api_key_to_use
                 )
                 caption_input.value = generated_caption
+                caption_edited = True
             except Exception as e:
-                print(f"Error in generate_caption_from_openai: {e}")
-                page.snack_bar.content = ft.Text(f"Error generating caption: {e}")
-                page.snack_bar.open = True
+                show_message(f"Error generating caption: {e}")
             finally:
                 progress_bar.visible = False
-                page.update()
+                ui.update(progress_bar, caption_input)
         else:
-            page.snack_bar.content = ft.Text("No image selected to generate caption.")
-            page.snack_bar.open = True
-            page.update()
+            show_message("No image selected to generate caption.")
 
     generate_caption_button = ft.ElevatedButton("Generate Caption", on_click=on_generate_caption_button_click)
 
+    # Batch captioning over every image in the selected folder
+    batch_captioner = None
+    batch_progress_bar = ft.ProgressBar(value=0, visible=False)
+    batch_status_text = ft.Text("", italic=True)
+
+    async def run_batch_captioning(only_uncaptioned):
+        nonlocal batch_captioner
+        if batch_captioner is not None and batch_captioner.running:
+            show_message("A batch is already running.")
+            return
+
+        provider = get_provider()
+        api_key_to_use = get_api_key(provider)
+        if not api_key_to_use:
+            return
+
+        if only_uncaptioned and get_store() and current_folder:
+            # The index answers this without opening a sidecar per image.
+            targets = await asyncio.to_thread(caption_store.uncaptioned, current_folder)
+        elif only_uncaptioned:
+            # Checking thousands of sidecars is disk-bound, keep it off the event loop.
+            targets = await asyncio.to_thread(lambda: [p for p in image_files if not is_captioned(p)])
+        else:
+            targets = list(image_files)
+        copies = {}
+        copied = 0
+        if reuse_duplicates_checkbox.value and duplicate_group_of:
+            targets, copies, copied = await asyncio.to_thread(plan_duplicate_reuse, targets)
+        if not targets:
+            if copied:
+                batch_status_text.value = f"Copied {copied} captions from duplicates; nothing left to caption."
+            else:
+                batch_status_text.value = "Nothing to caption."
+            ui.update(batch_status_text)
+            show_message("No images to caption.")
+            return
+
+        concurrency = get_concurrency()
+        prompt = prompt_field.value
+        preprocess = get_preprocess_options()
+        cache = get_cache()
+        request_scheduler = get_scheduler(provider)
+        client = get_async_client(provider, api_key_to_use)
+        provider_metrics = metrics.labeled(provider=provider.name)
+        pack_size = read_int_field(pack_size_field, 1)
+        packer = None
+        if pack_size > 1:
+            packer = PackedCaptioner(
+                client, prompt, pack_size, model=provider.model, max_tokens=provider.max_tokens,
+                preprocess=preprocess, cache=cache, scheduler=request_scheduler, params=provider.params
+            )
+
+        async def caption_fn(image_path):
+            started = time.perf_counter()
+            if packer is not None:
+                result = await packer.caption(image_path)
+            else:
+                result = await caption_image(
+                    client, image_path, prompt, model=provider.model, max_tokens=provider.max_tokens,
+                    preprocess=preprocess, cache=cache, scheduler=request_scheduler, params=provider.params
+                )
+            provider_metrics.observe("caption_seconds", time.perf_counter() - started)
+            record_caption_result(provider_metrics, result, cache_enabled=cache is not None)
+            return result
+
+        def on_progress(image_path, result, error, stats):
+            finished = stats["done"] + stats["failed"]
+            batch_progress_bar.value = finished / stats["total"]
+            batch_status_text.value = (
+                f"Captioned {stats['done']}/{stats['total']} ({stats['cached']} cached, {stats['failed']} failed, "
+                f"{request_scheduler.stats['retries']} retries)"
+            )
+            update_cache_stats()
+            if error is not None:
+                print(f"Error captioning {image_path}: {error}")
+            elif image_path == current_image_path:
+                caption_input.value = load_caption(image_path)
+            # Called once per image; the scheduler turns thousands of these into one update per frame.
+            ui.update(batch_progress_bar, batch_status_text, cache_stats_text, caption_input)
+
+        def save_fn(image_path, result):
+            nonlocal copied
+            save_caption(image_path, result.caption, notify=False, result=result)
+            for other in copies.get(image_path, ()):
+                save_caption(other, result.caption, notify=False)
+            copied += len(copies.get(image_path, ()))
+
+        batch_captioner = BatchCaptioner(
+            caption_fn,
+            save_fn,
+            concurrency=concurrency,
+            on_progress=on_progress,
+        )
+        batch_progress_bar.value = 0
+        batch_progress_bar.visible = True
+        cancel_batch_button.visible = True
+        batch_status_text.value = f"Captioning {len(targets)} images..."
+        ui.update()
+        try:
+            stats = await batch_captioner.run(targets)
+        finally:
+            batch_progress_bar.visible = False
+            cancel_batch_button.visible = False
+        provider_metrics.inc("caption_wall_seconds_total", stats["elapsed"])
+        state = "Cancelled" if stats["cancelled"] else "Finished"
+        batch_status_text.value = (
+            f"{state}: {stats['done']} captioned ({stats['cached']} from cache), "
+            f"{stats['failed']} failed in {stats['elapsed']:.1f}s; "
+            f"{request_scheduler.stats['retries']} retries, {request_scheduler.stats['rate_limited']} rate limited"
+        )
+        if copied:
+            batch_status_text.value += f"; {copied} captions copied to duplicates"
+        if packer is not None:
+            batch_status_text.value += f"\n{packer.describe_savings()}"
+        if stats["upload_bytes"]:
+            show_upload_stats(stats["original_bytes"], stats["upload_bytes"], label="Batch upload")
+        update_store_status()
+        ui.update()
+
+    async def on_caption_all_click(e):
+        await run_batch_captioning(only_uncaptioned=False)
+
+    async def on_caption_uncaptioned_click(e):
+        await run_batch_captioning(only_uncaptioned=True)
+
+    def on_cancel_batch_click(e):
+        if batch_captioner is not None:
+            batch_captioner.cancel()
+            batch_status_text.value = "Cancelling..."
+            ui.update()
+
+    async def on_apply_batch_results_click(e):
+        # Picks up an offline Batch API job submitted from the CLI (`cli.py batch submit`) for this folder.
+        job_dir = os.path.join(current_folder, DEFAULT_JOB_DIR) if current_folder else None
+        if not job_dir or not BatchJob.exists(job_dir):
+            show_message("No batch job found for this folder.")
+            return
+        provider = get_provider()
+        api_key_to_use = get_api_key(provider)
+        if not api_key_to_use:
+            return
+        job = BatchJob.load(job_dir)
+        client = create_sync_client(provider, api_key_to_use)
+        batch_status_text.value = "Checking batch job..."
+        ui.update()
+
+        saved_paths = set()
+        errors_before = len(caption_write_errors)
+
+        def save_batch_result(image_path, result):
+            record_caption_result(metrics.labeled(provider=provider.name), result)
+            saved_paths.add(image_path)
+            save_caption(image_path, result.caption, notify=False, result=result)
+
+        def flush_batch_writes():
+            # A shard is only marked applied once all of its captions are on disk; otherwise it
+            # stays pending and the next apply downloads it again.
+            flushed = caption_writer.flush()
+            failed_writes = [path for path in caption_write_errors[errors_before:] if path in saved_paths]
+            if not flushed or failed_writes:
+                raise OSError(f"{len(failed_writes)} batch captions could not be written")
+
+        def apply_results():
+            job.refresh(client)
+            return job.apply(
+                client,
+                save_batch_result,
+                on_error=lambda image_path, error: print(f"Error captioning {image_path}: {error}"),
+                flush_fn=flush_batch_writes,
+            )
+
+        try:
+            applied, failed = await asyncio.to_thread(apply_results)
+        except openai.OpenAIError as error:
+            batch_status_text.value = f"Error applying batch results: {error}"
+            ui.update()
+            return
+        except OSError as error:
+            pending = sum(1 for shard in job.shards if not shard.get("applied"))
+            batch_status_text.value = f"{error}; {pending} shards still pending, apply again to retry"
+            ui.update()
+            return
+        pending = sum(1 for shard in job.shards if not shard.get("applied"))
+        batch_status_text.value = f"Applied {applied} batch captions ({failed} failed), {pending} shards pending"
+        if current_image_path:
+            caption_input.value = load_caption(current_image_path)
+        apply_search_filter()
+        update_store_status()
+        ui.update()
+
+    # Dataset export: the captioned images of the open folder as training shards (WebDataset tar
+    # or JSONL + images) in a folder picked on export, with a manifest of counts and checksums.
+    export_format_dropdown = ft.Dropdown(
+        value=DEFAULT_EXPORT_FORMAT,
+        label="Export Format",
+        options=[ft.dropdown.Option(fmt) for fmt in EXPORT_FORMATS],
+        width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    export_shard_size_field = ft.TextField(
+        value=str(DEFAULT_SHARD_SIZE),
+        label="Images per Export Shard", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    export_resize_checkbox = ft.Checkbox(label="Resize exported images with the upload settings", value=False)
+    exporting = False
+
+    def run_export(output_dir, files, root):
+        nonlocal exporting
+        started = time.perf_counter()
+
+        def on_progress(done, total):
+            batch_progress_bar.value = done / total
+            batch_status_text.value = f"Exporting {done}/{total} images..."
+            ui.update(batch_progress_bar, batch_status_text)
+
+        # Captions still queued for writing belong in the export.
+        caption_writer.flush()
+        try:
+            manifest = export_dataset(
+                files, root, output_dir,
+                export_format=export_format_dropdown.value or DEFAULT_EXPORT_FORMAT,
+                shard_size=read_int_field(export_shard_size_field, DEFAULT_SHARD_SIZE) or DEFAULT_SHARD_SIZE,
+                preprocess=get_preprocess_options() if export_resize_checkbox.value else None,
+                on_progress=on_progress,
+            )
+            skipped = manifest["skipped"]
+            batch_status_text.value = (
+                f"Exported {manifest['samples']} images into {len(manifest['shards'])} shards in "
+                f"{time.perf_counter() - started:.1f}s ({skipped['uncaptioned']} uncaptioned and "
+                f"{skipped['error_caption']} error captions skipped, {len(manifest['failed'])} failed)"
+            )
+        except (ExportError, OSError) as e:
+            batch_status_text.value = f"Error exporting dataset: {e}"
+        finally:
+            exporting = False
+            batch_progress_bar.visible = False
+            ui.update()
+
+    def on_export_directory_picked(e: ft.FilePickerResultEvent):
+        nonlocal exporting
+        if not e.path:
+            return
+        if exporting:
+            show_message("An export is already running.")
+            return
+        exporting = True
+        batch_progress_bar.value = 0
+        batch_progress_bar.visible = True
+        batch_status_text.value = "Exporting..."
+        ui.update()
+        page.run_thread(run_export, e.path, list(image_files), current_folder)
+
+    def on_export_dataset_click(e):
+        if not image_files:
+            show_message("No images loaded.")
+            return
+        export_directory_picker.get_directory_path(dialog_title="Export shards to")
+
+    export_directory_picker = ft.FilePicker(on_result=on_export_directory_picked)
+    page.overlay.append(export_directory_picker)
+
+    cancel_batch_button = ft.ElevatedButton("Cancel Batch", visible=False, on_click=on_cancel_batch_click)
+    batch_actions_row = ft.Row(
+        controls=[
+            ft.ElevatedButton("Caption All", on_click=on_caption_all_click),
+            ft.ElevatedButton("Caption Uncaptioned", on_click=on_caption_uncaptioned_click),
+            ft.ElevatedButton("Apply Batch Results", on_click=on_apply_batch_results_click),
+            ft.ElevatedButton("Export Dataset", on_click=on_export_dataset_click),
+            cancel_batch_button,
+        ],
+        alignment=ft.MainAxisAlignment.CENTER,
+        spacing=10,
+    )
+
+    # Stats panel: what the metrics registry has recorded this session (scan and thumbnail times,
+    # caption reads and writes, API latency, upload bytes, tokens, cache hit rates). It refreshes
+    # while it is open and can be exported as a Prometheus text file (.prom) or as CSV (.csv).
+    stats_text = ft.Text("", size=12, selectable=True)
+    stats_refreshing = False
+
+    def update_stats_panel():
+        lines = metrics.describe() or ["Nothing recorded yet."]
+        if preview_cache.hits or preview_cache.misses:
+            hit_rate = preview_cache.hits / (preview_cache.hits + preview_cache.misses)
+            lines.append(f"preview cache: {preview_cache.hits} hits / {preview_cache.misses} misses ({hit_rate:.0%})")
+        lines.append(f"caption writer: {caption_writer.stats['written']} written, "
+                     f"{caption_writer.stats['coalesced']} coalesced, {caption_writer.stats['errors']} errors")
+        lines.append(f"UI updates: {ui.requests} requested, {ui.flushes} sent")
+        lines.extend(f"provider {line}" for line in describe_providers(metrics))
+        stats_text.value = "\n".join(lines)
+
+    async def refresh_stats_panel():
+        nonlocal stats_refreshing
+        stats_refreshing = True
+        try:
+            while stats_column.visible:
+                update_stats_panel()
+                ui.update(stats_text)
+                await asyncio.sleep(STATS_REFRESH_INTERVAL)
+        finally:
+            stats_refreshing = False
+
+    def toggle_stats_visibility(e):
+        stats_column.visible = not stats_column.visible
+        ui.update(stats_column)
+        if stats_column.visible and not stats_refreshing:
+            page.run_task(refresh_stats_panel)
+
+    def on_metrics_export_picked(e: ft.FilePickerResultEvent):
+        if not e.path:
+            return
+        try:
+            metrics.export(e.path)
+            show_message(f"Metrics exported to {e.path}")
+        except OSError as ex:
+            show_message(f"Error exporting metrics: {ex}")
+
+    def on_reset_metrics_click(e):
+        metrics.reset()
+        update_stats_panel()
+        ui.update(stats_text)
+
+    metrics_export_picker = ft.FilePicker(on_result=on_metrics_export_picked)
+    page.overlay.append(metrics_export_picker)
+    stats_column = ft.Column(
+        visible=False,
+        controls=[
+            ft.Text("Performance Stats", style=ft.TextStyle(weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)),
+            stats_text,
+            ft.Row(
+                controls=[
+                    ft.ElevatedButton(
+                        "Export Metrics",
+                        tooltip="Save as a Prometheus text file (.prom) or as CSV (.csv)",
+                        on_click=lambda _: metrics_export_picker.save_file(
+                            file_name=METRICS_EXPORT_FILE, allowed_extensions=["prom", "csv"]
+                        ),
+                    ),
+                    ft.ElevatedButton("Reset", on_click=on_reset_metrics_click),
+                ],
+                alignment=ft.MainAxisAlignment.CENTER,
+                spacing=10,
+            ),
+        ],
+        spacing=10,
+        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+    )
+
     # Create a single row for caption actions so they appear centered under the caption input.
     caption_actions_row = ft.Row(
         controls=[
             save_button,
             generate_caption_button,
+            ft.ElevatedButton("Copy to Duplicates", on_click=lambda e: on_copy_to_duplicates_click(e)),
             ft.IconButton(
                 icon=ft.icons.SETTINGS,
                 tooltip="Show settings",
                 on_click=lambda e: toggle_settings_visibility(e),
             ),
+            ft.IconButton(
+                icon=ft.icons.QUERY_STATS,
+                tooltip="Show performance stats",
+                on_click=toggle_stats_visibility,
+            ),
         ],
         alignment=ft.MainAxisAlignment.CENTER,
         spacing=10,
@@ -210,6 +897,9 @@ def main(page: ft.Page):
             controls=[
                 caption_input,
                 caption_actions_row,
+                batch_actions_row,
+                batch_progress_bar,
+                batch_status_text,
             ],
             spacing=10,
             horizontal_alignment=ft.CrossAxisAlignment.CENTER,
@@ -217,111 +907,50 @@ def main(page: ft.Page):
         padding=10,
     )
 
-    async def generate_caption_from_openai(image_path, prompt, page, api_key):
-        openai.api_key = api_key  # Set API key here to ensure it's used in this function call
-        print("generate_caption_from_openai function entered")
-        print(f"Image Path: {image_path}")
-        print(f"API Key being used in generate_caption_from_openai: {openai.api_key}")
+    async def generate_caption_from_openai(image_path, prompt, provider, api_key):
+        provider_metrics = metrics.labeled(provider=provider.name)
         try:
-            print("Opening image file...")
-            with open(image_path, "rb") as image_file:
-                image_bytes = image_file.read()
-                print("Image file opened successfully")
-                print("Encoding image to base64...")
-                image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-                print("Image encoded to base64")
-                print(f"OpenAI API Key in generate_caption_from_openai: {openai.api_key}")
-                print("Calling OpenAI API...")
-                print(f"Prompt being sent to OpenAI: {prompt}")
-                print(f"Model being used: gpt-4o")
-                response = openai.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}},
-                            ],
-                        }
-                    ],
-                    max_tokens=300,
-                )
-                print("OpenAI API call successful")
-                print(f"Raw OpenAI API response: {response}")
-                print(f"OpenAI library version: {openai.__version__}")
-                caption_content = response.choices[0].message.content
-                print(f"Extracted caption content: {caption_content}")
-                return caption_content
+            started = time.perf_counter()
+            cache = get_cache()
+            result = await caption_image(
+                get_async_client(provider, api_key),
+                image_path,
+                prompt,
+                model=provider.model,
+                max_tokens=provider.max_tokens,
+                preprocess=get_preprocess_options(),
+                cache=cache,
+                scheduler=get_scheduler(provider),
+                params=provider.params,
+            )
+            elapsed = time.perf_counter() - started
+            provider_metrics.observe("caption_seconds", elapsed)
+            provider_metrics.inc("caption_wall_seconds_total", elapsed)
+            record_caption_result(provider_metrics, result, cache_enabled=cache is not None)
+            update_cache_stats()
+            if result.cached:
+                return result.caption
+            show_upload_stats(result.original_bytes, result.upload_bytes)
+            return result.caption
         except openai.APIError as e:
-            print(f"OpenAI API error: {e}")
-            page.snack_bar.content = ft.Text(f"OpenAI API error: {e}")
-            page.snack_bar.open = True
-            page.update()
-            return f"Error generating caption: OpenAI API error: {e}"
-        except FileNotFoundError:
+            print(f"API error from {provider.name}: {e}")
+            show_message(f"API error from {provider.name}: {e}")
+            return error_caption(e)
+        except FileNotFoundError as e:
             print(f"Error: Image file not found at path: {image_path}")
-            page.snack_bar.content = ft.Text("Error: Image file not found.")
-            page.snack_bar.open = True
-            page.update()
-            return "Error generating caption: Image file not found."
+            show_message("Error: Image file not found.")
+            return error_caption(e)
         except Exception as e:
             print(f"Unexpected error generating caption: {e}")
-            page.snack_bar.content = ft.Text(f"Unexpected error generating caption: {e}")
-            page.snack_bar.open = True
-            page.update()
-            return "Error generating caption."
-
-    def save_tags_to_file():
-        try:
-            with open(TAGS_FILE, 'w') as f:
-                for tag in tags:
-                    f.write(tag + "\n")
-        except Exception as e:
-            print(f"Error saving tags: {e}")
-
-    def delete_tag(tag_to_delete):
-        nonlocal tags
-        tags.remove(tag_to_delete)
-        save_tags_to_file()
-        update_tag_list()
-        page.snack_bar.content = ft.Text(f"Tag '{tag_to_delete}' deleted.")
-        page.snack_bar.open = True
-        page.update()
-
-    def edit_tag(tag_to_edit):
-        nonlocal editing_tag
-        editing_tag = tag_to_edit
-        update_tag_list()
-
-    def save_edited_tag(old_tag, new_tag):
-        nonlocal tags, editing_tag
-        if new_tag.strip() and new_tag.strip() != old_tag:
-            try:
-                tags[tags.index(old_tag)] = new_tag.strip()
-                save_tags_to_file()
-                page.snack_bar.content = ft.Text(f"Tag '{old_tag}' updated to '{new_tag.strip()}'.")
-            except ValueError:
-                page.snack_bar.content = ft.Text(f"Error updating tag '{old_tag}'. Tag not found.")
-            page.snack_bar.open = True
-        elif new_tag.strip() == old_tag:
-            page.snack_bar.content = ft.Text("Tag name unchanged.")
-            page.snack_bar.open = True
-        else:
-            page.snack_bar.content = ft.Text("Tag name cannot be empty.")
-            page.snack_bar.open = True
-        editing_tag = None
-        update_tag_list()
+            show_message(f"Unexpected error generating caption: {e}")
+            return error_caption(e)
 
-    def cancel_edit_tag(e):
-        nonlocal editing_tag
-        editing_tag = None
-        update_tag_list()
-
-    def update_tag_list():
-        tag_list_column.controls.clear()
-        for tag in tags:
-            row = ft.Row(
+    # The tag list is virtualized like the sidebar: only rows in view get controls, and adding,
+    # renaming or deleting a tag rebuilds just that tag's row. The filter box picks which tags
+    # are listed.
+    def build_tag_row(tag):
+        return ft.Container(
+            content=ft.Row(
                 controls=[
                     ft.Container(
                         content=ft.TextButton(
@@ -344,9 +973,24 @@ def main(page: ft.Page):
                     ),
                 ],
                 spacing=5
-            )
-            tag_list_column.controls.append(row)
+            ),
+            height=TAG_ROW_HEIGHT,
+        )
+
+    tag_list = VirtualList(build_tag_row, TAG_ROW_HEIGHT, ui=ui, expand=True)
+    tag_list_container = ft.Container(
+        content=tag_list.control,
+        expand=True,
+        padding=ft.padding.only(right=10)
+    )
+
+    def tag_matches_filter(tag):
+        return tag.lower().startswith((tag_filter_field.value or "").strip().lower())
+
+    def update_tag_list():
+        tag_list.set_items(tag_store.search(tag_filter_field.value or ""))
 
+    def update_tag_edit_panel():
         if editing_tag is not None:
             edit_field = ft.TextField(value=editing_tag, expand=True)
             tag_edit_container.content = ft.Column(
@@ -365,80 +1009,624 @@ def main(page: ft.Page):
             )
         else:
             tag_edit_container.content = None
+        ui.update(tag_edit_container)
 
-        tag_list_column.update()
-        tag_edit_container.update()
-        page.update()
+    def delete_tag(tag_to_delete):
+        nonlocal editing_tag
+        if tag_to_delete not in tag_store:
+            return
+        tag_store.remove(tag_to_delete)
+        tag_list.remove(tag_to_delete)
+        if editing_tag == tag_to_delete:
+            editing_tag = None
+            update_tag_edit_panel()
+        show_message(f"Tag '{tag_to_delete}' deleted.")
+
+    def edit_tag(tag_to_edit):
+        nonlocal editing_tag
+        editing_tag = tag_to_edit
+        update_tag_edit_panel()
+
+    def save_edited_tag(old_tag, new_tag):
+        nonlocal editing_tag
+        new_tag = new_tag.strip()
+        if new_tag == old_tag:
+            show_message("Tag name unchanged.")
+        else:
+            try:
+                tag_store.rename(old_tag, new_tag)
+            except KeyError:
+                show_message(f"Error updating tag '{old_tag}'. Tag not found.")
+            except ValueError as e:
+                show_message(str(e))
+            else:
+                if tag_matches_filter(new_tag):
+                    tag_list.replace(old_tag, new_tag)
+                else:
+                    tag_list.remove(old_tag)
+                show_message(f"Tag '{old_tag}' updated to '{new_tag}'.")
+        editing_tag = None
+        update_tag_edit_panel()
+
+    def cancel_edit_tag(e):
+        nonlocal editing_tag
+        editing_tag = None
+        update_tag_edit_panel()
 
     def on_tag_click(tag_text):
         caption_input.value += " " + tag_text
-        page.update()
+        ui.update(caption_input)
+        schedule_autosave()
 
     def add_tag(e):
-        nonlocal tags
         new_tag = tag_input_field.value.strip()
-        if new_tag and new_tag not in tags:
-            tags.append(new_tag)
-            save_tags_to_file()
-            update_tag_list()
+        if tag_store.add(new_tag):
+            if tag_matches_filter(new_tag):
+                tag_list.extend([new_tag])
             tag_input_field.value = ""
-            page.update()
+            ui.update(tag_input_field)
 
     add_tag_button.on_click = add_tag
 
-    def on_thumbnail_click(image_path):
-        def inner_click(e):
-            nonlocal current_image_path
-            current_image_path = image_path
+    # Display-sized previews and captions of the images around the current one are loaded
+    # in the background, so stepping through a folder doesn't wait on decoding or disk reads.
+    preview_cache = PreviewCache(read_caption_fn=load_caption)
+
+    def show_image(image_path):
+        nonlocal caption_edited
+        caption_edited = False
+        try:
+            entry = preview_cache.get(image_path) or preview_cache.load(image_path)
+        except Exception as e:
+            print(f"Error building preview for {image_path}: {e}")
+            image_display.content.src_base64 = None
             image_display.content.src = image_path
             caption_input.value = load_caption(image_path)
-            page.update()
-            print(f"Thumbnail clicked, current_image_path set to: {image_path}")
+            return
+        image_display.content.src = None
+        image_display.content.src_base64 = entry.image_base64
+        caption_input.value = entry.caption
+
+    def prefetch_neighbours(image_path):
+        index = thumbnail_list.index_of(image_path)
+        if index is None:
+            return
+        items = thumbnail_list.items
+        nearest_first = []
+        for distance in range(1, DEFAULT_PREFETCH_DISTANCE + 1):
+            for neighbour in (index + distance, index - distance):
+                if 0 <= neighbour < len(items):
+                    nearest_first.append(items[neighbour])
+        preview_cache.prefetch(nearest_first)
+
+    def select_image(image_path, scroll=False):
+        nonlocal current_image_path
+        # Save pending edits to the image they were typed for before the caption is replaced.
+        autosaver.flush()
+        current_image_path = image_path
+        show_image(image_path)
+        caption_index.update(image_path, caption_input.value)
+        if scroll:
+            index = thumbnail_list.index_of(image_path)
+            if index is not None:
+                thumbnail_list.scroll_to_index(index)
+        ui.update(image_display.content, caption_input)
+        prefetch_neighbours(image_path)
+
+    def step_image(offset):
+        items = thumbnail_list.items
+        if not items:
+            return
+        index = thumbnail_list.index_of(current_image_path)
+        index = 0 if index is None else min(max(index + offset, 0), len(items) - 1)
+        if items[index] != current_image_path:
+            select_image(items[index], scroll=True)
+
+    def on_keyboard(e: ft.KeyboardEvent):
+        # Alt + arrow keys step through the sidebar; plain arrows still move the caption cursor.
+        if not e.alt:
+            return
+        if e.key in ("Arrow Down", "Arrow Right"):
+            step_image(1)
+        elif e.key in ("Arrow Up", "Arrow Left"):
+            step_image(-1)
+
+    page.on_keyboard_event = on_keyboard
+
+    def on_thumbnail_click(image_path):
+        def inner_click(e):
+            select_image(image_path)
         return inner_click
 
+    # Thumbnails are built in a background process pool and cached on disk; the sidebar
+    # shows placeholders until they are ready.
+    thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR, metrics=metrics)
+    thumbnail_paths = {}  # image_path -> built thumbnail (or the original if building failed)
+
+    def make_thumbnail_image(src, image_path):
+        return ft.Image(
+            src=src,
+            width=100,
+            height=100,
+            fit=ft.ImageFit.CONTAIN,
+            border_radius=ft.border_radius.all(8),
+            tooltip=image_path,
+        )
+
+    def make_thumbnail_placeholder(image_path):
+        return ft.Container(
+            content=ft.Icon(ft.icons.IMAGE, color=ft.Colors.GREY_700),
+            width=100,
+            height=100,
+            bgcolor=ft.Colors.GREY_900,
+            border_radius=ft.border_radius.all(8),
+            alignment=ft.alignment.center,
+            tooltip=image_path,
+        )
+
+    def build_thumbnail_row(image_path):
+        thumb_path = thumbnail_paths.get(image_path)
+        group = duplicate_group_of.get(image_path)
+        return ft.Container(
+            content=ft.GestureDetector(
+                content=(
+                    make_thumbnail_image(thumb_path, image_path) if thumb_path
+                    else make_thumbnail_placeholder(image_path)
+                ),
+                on_tap=on_thumbnail_click(image_path),
+            ),
+            padding=5,
+            width=100,
+            height=THUMBNAIL_ROW_HEIGHT,
+            border=(
+                ft.border.all(2, DUPLICATE_GROUP_COLORS[group % len(DUPLICATE_GROUP_COLORS)])
+                if group is not None else None
+            ),
+        )
+
+    def set_thumbnail(image_path, thumb_path):
+        # Fall back to the original file if the thumbnail could not be built.
+        thumbnail_paths[image_path] = thumb_path or image_path
+        row = thumbnail_list.get_control(image_path)
+        if row is None:  # Scrolled out of view; the row picks it up when it is rebuilt
+            return None
+        row.content.content = make_thumbnail_image(thumbnail_paths[image_path], image_path)
+        return row.content
+
+    def on_thumbnail_ready(image_path, thumb_path):
+        slot = set_thumbnail(image_path, thumb_path)
+        if slot is not None:
+            ui.update(slot)
+
+    def request_thumbnails(paths):
+        # Runs on a background thread. Thumbnails already in the cache are swapped in
+        # together so a reopened folder doesn't send one update per image.
+        ready = []
+        for image_path in paths:
+            if image_path in thumbnail_paths:
+                continue
+            thumb_path = thumbnail_cache.request(image_path, on_thumbnail_ready)
+            if thumb_path:
+                slot = set_thumbnail(image_path, thumb_path)
+                if slot is not None and slot.page:
+                    ready.append(slot)
+        if ready:
+            ui.update(*ready)
+
+    def on_thumbnail_window_changed(paths):
+        # Only rows that are actually materialized get thumbnails.
+        missing = [image_path for image_path in paths if image_path not in thumbnail_paths]
+        if missing:
+            page.run_thread(request_thumbnails, missing)
+
+    # Left column (thumbnails): only the rows in view are built, so folder size doesn't matter.
+    thumbnail_list = VirtualList(
+        build_thumbnail_row,
+        THUMBNAIL_ROW_HEIGHT,
+        on_window_changed=on_thumbnail_window_changed,
+        ui=ui,
+        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        expand=True,
+    )
+
+    # Caption search filters the sidebar through caption_index.
+    search_status_text = ft.Text("", size=11, italic=True)
+
+    def apply_search_filter(changed=None):
+        # With `changed` (images whose rows must be rebuilt) the list is updated in place instead
+        # of being reset to the top, e.g. when the folder changes under the user.
+        results = caption_index.search(search_field.value or "")
+        set_items = thumbnail_list.set_items if changed is None else (
+            lambda items: thumbnail_list.update_items(items, changed)
+        )
+        if duplicates_only_checkbox.value:
+            # Members of a group are listed next to each other.
+            matches = [
+                image_path for group in duplicate_groups for image_path in group
+                if results is None or image_path in results
+            ]
+            set_items(matches)
+            search_status_text.value = f"{len(matches)} images in {len(duplicate_groups)} duplicate groups"
+        elif results is None:
+            set_items(image_files)
+            search_status_text.value = ""
+        else:
+            matches = [image_path for image_path in image_files if image_path in results]
+            set_items(matches)
+            search_status_text.value = f"{len(matches)} of {len(image_files)} images"
+        ui.update(search_status_text)
+
+    def filter_visible(image_paths):
+        # The images apply_search_filter would show out of image_paths, for rows streamed in by
+        # a scan while a search or the duplicates filter is active.
+        results = caption_index.search(search_field.value or "")
+        return [
+            image_path for image_path in image_paths
+            if (results is None or image_path in results)
+            and (not duplicates_only_checkbox.value or image_path in duplicate_group_of)
+        ]
+
+    search_field = ft.TextField(
+        hint_text="Search captions",
+        tooltip="All words must match. -word excludes; is:empty, is:error and is:captioned filter by caption state.",
+        dense=True,
+        fill_color=ft.Colors.BLACK,
+        border_color=ft.Colors.GREY,
+        on_change=lambda e: apply_search_filter(),
+    )
+
+    # Near-duplicate detection: perceptual hashes are computed in a process pool (and cached
+    # next to the thumbnails), then grouped by Hamming distance. Group members get a matching
+    # border in the sidebar and can share one caption.
+    hash_cache = None
+    duplicate_groups = []
+    duplicate_group_of = {}  # image_path -> index into duplicate_groups
+    duplicate_distance_field = ft.TextField(
+        value=str(DEFAULT_MAX_DISTANCE),
+        label="Duplicate Threshold (bits of 64)", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    reuse_duplicates_checkbox = ft.Checkbox(label="Caption one image per duplicate group in batches", value=False)
+    duplicates_only_checkbox = ft.Checkbox(label="Duplicates only", value=False, on_change=lambda e: apply_search_filter())
+
+    def find_duplicates(files, generation):
+        nonlocal hash_cache, duplicate_groups, duplicate_group_of
+        started = time.perf_counter()
+        if hash_cache is None:
+            hash_cache = HashCache(THUMBNAIL_CACHE_DIR)
+
+        def on_progress(done, total):
+            search_status_text.value = f"Hashing {done}/{total} images..."
+            ui.update(search_status_text)
+
+        hashes = compute_hashes(
+            files, hash_cache, should_stop=lambda: generation != scan_generation, on_progress=on_progress
+        )
+        if generation != scan_generation:
+            return
+        groups = group_duplicates(files, hashes, read_int_field(duplicate_distance_field, DEFAULT_MAX_DISTANCE))
+        duplicate_groups = groups
+        duplicate_group_of = {image_path: index for index, group in enumerate(groups) for image_path in group}
+        print(f"Found {len(groups)} duplicate groups in {time.perf_counter() - started:.2f}s")
+        apply_search_filter()  # Rebuilds the visible rows with their group borders
+        if not duplicates_only_checkbox.value:
+            search_status_text.value = f"{len(groups)} duplicate groups ({len(duplicate_group_of)} images)"
+        ui.update()
+
+    def on_find_duplicates_click(e):
+        if not image_files:
+            show_message("No images loaded.")
+            return
+        page.run_thread(find_duplicates, list(image_files), scan_generation)
+
+    find_duplicates_button = ft.TextButton("Find Duplicates", on_click=on_find_duplicates_click)
+
+    def copy_caption_to_duplicates(image_path, caption_text):
+        # Returns the number of other group members that were updated.
+        group = duplicate_group_of.get(image_path)
+        if group is None:
+            return 0
+        others = [other for other in duplicate_groups[group] if other != image_path]
+        for other in others:
+            save_caption(other, caption_text, notify=False)
+        return len(others)
+
+    def on_copy_to_duplicates_click(e):
+        if current_image_path not in duplicate_group_of:
+            message = "This image has no duplicates (run Find Duplicates first)."
+        else:
+            try:
+                save_caption(current_image_path, caption_input.value, notify=False)
+                count = copy_caption_to_duplicates(current_image_path, caption_input.value)
+                message = f"Caption copied to {count} duplicates."
+            except Exception as ex:
+                message = f"Error copying caption: {ex}"
+        show_message(message)
+
+    def plan_duplicate_reuse(targets):
+        # Keeps one image per duplicate group in the batch; the caption it gets is copied to the
+        # group's other targets. Groups with an already captioned member outside the batch are
+        # filled from that caption right away. Returns (targets to caption,
+        # {representative: other targets}, number of captions copied now).
+        target_set = set(targets)
+        sources = {}  # group -> captioned member outside the batch, or None
+        representatives = {}
+        copies = {}
+        remaining = []
+        copied = 0
+        for image_path in targets:
+            group = duplicate_group_of.get(image_path)
+            if group is None:
+                remaining.append(image_path)
+                continue
+            if group not in sources:
+                sources[group] = next(
+                    (other for other in duplicate_groups[group] if other not in target_set and is_captioned(other)),
+                    None,
+                )
+                if sources[group] is None:
+                    representatives[group] = image_path
+                    copies[image_path] = []
+                    remaining.append(image_path)
+                    continue
+            if sources[group] is not None:
+                save_caption(image_path, load_caption(sources[group]), notify=False)
+                copied += 1
+            else:
+                copies[representatives[group]].append(image_path)
+        return remaining, copies, copied
+
+    def index_captions(folder, files, generation):
+        # Runs on the scan thread once the folder is listed; the search box works on
+        # whatever has been indexed so far and is re-applied when indexing finishes.
+        started = time.perf_counter()
+        if get_store():
+            for image_path, caption in caption_store.captions(folder):
+                caption_index.update(image_path, caption)
+        else:
+            for image_path in files:
+                if generation != scan_generation:
+                    return
+                caption_index.update(image_path, load_caption(image_path))
+        print(f"Indexed {len(caption_index)} captions in {time.perf_counter() - started:.2f}s")
+        # Rows streamed in before their captions were indexed were filtered against a partial index.
+        if search_field.value or duplicates_only_checkbox.value:
+            apply_search_filter()
+
+    # The selected folder is watched for images and captions added, removed or rewritten by other
+    # programs. Changes arrive in debounced batches and are applied to the image list, caption
+    # index, store and thumbnails incrementally, so a bulk copy doesn't trigger a rescan.
+    folder_watcher = None
+    own_caption_writes = {}  # sidecar path -> (mtime_ns, size) of the app's last write
+
+    def remember_caption_write(image_path):
+        caption_file_path = caption_path_for(image_path)
+        try:
+            stat = os.stat(caption_file_path)
+        except OSError:
+            return
+        own_caption_writes[caption_file_path] = (stat.st_mtime_ns, stat.st_size)
+
+    def is_own_caption_write(caption_file_path):
+        try:
+            stat = os.stat(caption_file_path)
+        except OSError:
+            return False
+        return own_caption_writes.get(caption_file_path) == (stat.st_mtime_ns, stat.st_size)
+
+    def start_watcher(folder, generation, done):
+        nonlocal folder_watcher
+        stop_watcher()
+        watcher = FolderWatcher(
+            folder,
+            lambda paths: apply_folder_changes(paths, generation, done),
+            parse_extensions(extensions_field.value or ""),
+            recursive=recursive_checkbox.value,
+        )
+        watcher.start()
+        if generation != scan_generation:  # Another folder was picked meanwhile
+            watcher.stop()
+            return
+        folder_watcher = watcher
+        print(f"Watching {folder} for changes ({watcher.backend_name})")
+
+    def stop_watcher():
+        nonlocal folder_watcher
+        if folder_watcher is not None:
+            folder_watcher.stop()
+            folder_watcher = None
+
+    def on_watch_folder_change(e):
+        if watch_folder_checkbox.value and current_folder:
+            page.run_thread(start_watcher, current_folder, scan_generation, scan_done)
+        else:
+            stop_watcher()
+
+    watch_folder_checkbox = ft.Checkbox(label="Watch folder for changes", value=True, on_change=on_watch_folder_change)
+
+    def classify_folder_changes(paths, extensions):
+        # Checks what each touched path is now: (added, removed, modified, recaptioned) images.
+        known = set(image_files)
+        added, removed, modified, sidecars = [], set(), set(), []
+        for path in paths:
+            lower = path.lower()
+            if lower.endswith(extensions):
+                if path in known:
+                    (modified if os.path.isfile(path) else removed).add(path)
+                elif os.path.isfile(path):
+                    added.append(path)
+            elif lower.endswith(CAPTION_EXTENSION) and not is_own_caption_write(path):
+                sidecars.append(path)
+        recaptioned = set()
+        if sidecars:
+            images_by_stem = {}
+            for image_path in known:
+                images_by_stem.setdefault(os.path.splitext(image_path)[0], []).append(image_path)
+            for path in sidecars:
+                recaptioned.update(images_by_stem.get(os.path.splitext(path)[0], ()))
+        return sorted(added), removed, modified, recaptioned - removed
+
+    def apply_folder_changes(paths, generation, done):
+        # Runs on the watcher thread. Changes that arrive while the folder is still being listed
+        # wait for the listing, so every path can be checked against the complete image list.
+        nonlocal current_image_path, duplicate_groups, duplicate_group_of, caption_edited
+        done.wait()
+        if generation != scan_generation:
+            return
+        started = time.perf_counter()
+        extensions = parse_extensions(extensions_field.value or "")
+        if paths is None:
+            # Events were lost: diff a fresh listing against the image list instead.
+            print(f"Rescanning {current_folder} after missed folder events")
+            listed = set()
+            for chunk in scan_images(current_folder, extensions, recursive=recursive_checkbox.value):
+                listed.update(chunk)
+            paths = listed.symmetric_difference(image_files)
+        added, removed, modified, recaptioned = classify_folder_changes(paths, extensions)
+        if not (added or removed or modified or recaptioned):
+            return
+
+        current_index = thumbnail_list.index_of(current_image_path)
+        if removed:
+            if current_image_path in removed:
+                autosaver.cancel()  # Don't write a sidecar back next to a deleted image
+            image_files[:] = [image_path for image_path in image_files if image_path not in removed]
+            for image_path in removed:
+                caption_index.remove(image_path)
+                preview_cache.invalidate(image_path)
+                thumbnail_paths.pop(image_path, None)
+                own_caption_writes.pop(caption_path_for(image_path), None)
+                caption_writer.discard(image_path)
+            if get_store():
+                caption_store.remove(removed)
+            if duplicate_group_of:
+                groups = []
+                for group in duplicate_groups:
+                    group = [image_path for image_path in group if image_path not in removed]
+                    if len(group) > 1:
+                        groups.append(group)
+                duplicate_groups = groups
+                duplicate_group_of = {image_path: index for index, group in enumerate(groups) for image_path in group}
+        image_files.extend(added)
+        for image_path in modified:
+            # The thumbnail cache is keyed by mtime, so the row just needs to ask again.
+            thumbnail_paths.pop(image_path, None)
+            preview_cache.invalidate(image_path)
+        for image_path in (*added, *recaptioned):
+            caption = load_caption(image_path)
+            caption_index.update(image_path, caption)
+            preview_cache.update_caption(image_path, caption)
+        if get_store() and (added or recaptioned):
+            caption_store.import_sidecars([*added, *recaptioned])
+        apply_search_filter(changed=modified)
+
+        if current_image_path in removed:
+            items = thumbnail_list.items
+            if items:
+                select_image(items[min(current_index or 0, len(items) - 1)])
+            else:
+                current_image_path = None
+                image_display.content.src = None
+                image_display.content.src_base64 = None
+                caption_input.value = ""
+        elif current_image_path in modified or current_image_path in recaptioned:
+            edited_caption = caption_input.value if caption_edited else None
+            show_image(current_image_path)
+            if edited_caption is not None and edited_caption != caption_input.value:
+                caption_input.value = edited_caption
+                caption_edited = True
+                if current_image_path in recaptioned:
+                    show_message("The caption file changed on disk; your unsaved edits were kept.")
+        selected_folder_path.value = f"Selected directory: {current_folder} ({len(image_files)} images)"
+        update_store_status()
+        ui.update(image_display.content, caption_input, selected_folder_path, store_status_text)
+        print(
+            f"Applied folder changes in {time.perf_counter() - started:.2f}s: {len(added)} added, "
+            f"{len(removed)} removed, {len(modified)} modified, {len(recaptioned)} captions changed"
+        )
+
+    # Folders are scanned on a background thread and the sidebar is filled chunk by chunk,
+    # so the first images show up while a large tree is still being listed.
+    extensions_field = ft.TextField(
+        value=", ".join(IMAGE_EXTENSIONS),
+        label="Image Extensions", width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY
+    )
+    recursive_checkbox = ft.Checkbox(label="Include subfolders", value=True)
+    scan_generation = 0
+    scan_done = threading.Event()  # Set once the current folder is listed and indexed
+
+    def scan_folder(folder, generation, files, done):
+        try:
+            if watch_folder_checkbox.value:
+                start_watcher(folder, generation, done)
+            list_folder(folder, generation, files)
+        finally:
+            done.set()
+
+    def list_folder(folder, generation, files):
+        nonlocal current_image_path
+        started = time.perf_counter()
+        try:
+            for chunk in scan_images(
+                folder,
+                parse_extensions(extensions_field.value or ""),
+                recursive=recursive_checkbox.value,
+                should_stop=lambda: generation != scan_generation,
+            ):
+                if generation != scan_generation:  # Another folder was picked
+                    return
+                files.extend(chunk)
+                visible = filter_visible(chunk)
+                if visible:
+                    thumbnail_list.extend(visible)
+                if current_image_path is None:
+                    current_image_path = chunk[0]
+                    show_image(chunk[0])
+                    prefetch_neighbours(chunk[0])
+                selected_folder_path.value = (
+                    f"Scanning {folder}: {len(files)} images ({time.perf_counter() - started:.1f}s)"
+                )
+                ui.update(selected_folder_path, image_display.content, caption_input)
+        except Exception as ex:
+            print(f"Error listing images: {ex}")
+            selected_folder_path.value = "Error listing images"
+            ui.update()
+            return
+        elapsed = time.perf_counter() - started
+        metrics.observe("scan_seconds", elapsed)
+        metrics.inc("scanned_images_total", len(files))
+        print(f"Found {len(files)} image files in {elapsed:.2f}s")
+        selected_folder_path.value = f"Selected directory: {folder} ({len(files)} images, scanned in {elapsed:.1f}s)"
+        ui.update()
+        if get_store():
+            sync_store(folder, files)
+        index_captions(folder, files, generation)
+
     def on_directory_picked(e: ft.FilePickerResultEvent):
+        nonlocal current_image_path, current_folder, image_files, scan_generation, scan_done
+        nonlocal duplicate_groups, duplicate_group_of
+        autosaver.flush()
         if e.path:
-            print(f"Directory picked: {e.path}")
-            selected_folder_path.value = f"Selected directory: {e.path}"
+            stop_watcher()
+            current_folder = os.path.abspath(e.path)
+            selected_folder_path.value = f"Scanning {e.path}..."
+            scan_generation += 1
+            scan_done = threading.Event()
             image_files = []
-            try:
-                for filename in os.listdir(e.path):
-                    if filename.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".bmp")):
-                        image_files.append(os.path.join(e.path, filename))
-
-                thumbnails_column.controls.clear()
-                print(f"Found {len(image_files)} image files in directory")
-                for image_path in image_files:
-                    thumbnail_image = ft.Image(
-                        src=image_path,
-                        width=100,
-                        height=100,
-                        fit=ft.ImageFit.CONTAIN,
-                        border_radius=ft.border_radius.all(8),
-                        tooltip=image_path,
-                    )
-                    thumbnails_column.controls.append(
-                        ft.Container(
-                            content=ft.GestureDetector(
-                                content=thumbnail_image,
-                                on_tap=on_thumbnail_click(image_path),
-                            ),
-                            padding=5,
-                            width=100,
-                        )
-                    )
-                if image_files:
-                    current_image_path = image_files[0]
-                    image_display.content.src = image_files[0]
-                    caption_input.value = load_caption(image_files[0])
-                    print(f"Setting current_image_path to first image: {current_image_path}")
-                page.update()
-            except Exception as ex:
-                print(f"Error listing images: {ex}")
-                selected_folder_path.value = "Error listing images"
+            current_image_path = None
+            thumbnail_cache.cancel_pending()
+            thumbnail_paths.clear()
+            preview_cache.clear()
+            caption_index.clear()
+            duplicate_groups = []
+            duplicate_group_of = {}
+            duplicates_only_checkbox.value = False
+            search_field.value = ""
+            search_status_text.value = ""
+            thumbnail_list.set_items([])
+            page.run_thread(scan_folder, current_folder, scan_generation, image_files, scan_done)
         else:
             selected_folder_path.value = "Cancelled!"
-        page.update()
+        ui.update()
 
     directory_picker = ft.FilePicker(on_result=on_directory_picked)
     page.overlay.append(directory_picker)
@@ -447,13 +1635,18 @@ def main(page: ft.Page):
         on_click=lambda _: directory_picker.get_directory_path()
     )
 
-    # Left column (thumbnails)
-    thumbnails_column = ft.Column(
-        scroll=ft.ScrollMode.AUTO,
-        horizontal_alignment=ft.CrossAxisAlignment.CENTER
-    )
     image_thumbnails_container = ft.Container(
-        content=thumbnails_column,
+        content=ft.Column(
+            controls=[
+                search_field,
+                search_status_text,
+                find_duplicates_button,
+                duplicates_only_checkbox,
+                thumbnail_list.control,
+            ],
+            spacing=5,
+            expand=True,
+        ),
         width=MIN_THUMBNAILS_WIDTH,
         bgcolor=ft.Colors.BLACK,
         padding=10,
@@ -465,8 +1658,37 @@ def main(page: ft.Page):
         visible=False,
         controls=[
             ft.Text("Settings", style=ft.TextStyle(weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)),
-            ft.TextField(ref=api_key_field, label="OpenAI API Key", password=True, can_reveal_password=True, width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY),
+            ft.TextField(ref=api_key_field, label="API Key", password=True, can_reveal_password=True, width=300, fill_color=ft.Colors.BLACK, border_color=ft.Colors.GREY),
+            provider_dropdown,
+            model_field,
+            base_url_field,
+            max_tokens_field,
             prompt_field,
+            autosave_checkbox,
+            fsync_dropdown,
+            extensions_field,
+            recursive_checkbox,
+            watch_folder_checkbox,
+            concurrency_field,
+            pack_size_field,
+            duplicate_distance_field,
+            reuse_duplicates_checkbox,
+            rpm_field,
+            tpm_field,
+            max_retries_field,
+            max_side_field,
+            upload_format_dropdown,
+            quality_field,
+            upload_stats_text,
+            export_format_dropdown,
+            export_shard_size_field,
+            export_resize_checkbox,
+            use_cache_checkbox,
+            cache_stats_text,
+            clear_cache_button,
+            use_store_checkbox,
+            store_actions_row,
+            store_status_text,
             progress_bar,
         ],
         spacing=10,
@@ -480,11 +1702,11 @@ def main(page: ft.Page):
         controls=[
             ft.Text("Tags", style=ft.TextStyle(weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)),
             tag_input_row,
+            tag_filter_field,
             tag_list_container,
         ],
         spacing=10,
         expand=True,
-        scroll=ft.ScrollMode.AUTO,
     )
     tag_management_container = ft.Container(
         content=ft.Column(
@@ -508,6 +1730,7 @@ def main(page: ft.Page):
                 content=ft.Column([
                     caption_column,
                     settings_column,
+                    stats_column,
                     selected_folder_path,
                 ]),
                 padding=10,
@@ -568,5 +1791,14 @@ def main(page: ft.Page):
 
     update_tag_list()
 
+    def on_disconnect(e):
+        stop_watcher()
+        autosaver.flush()
+        caption_writer.close()
+        thumbnail_cache.shutdown()
+        preview_cache.shutdown()
+
+    page.on_disconnect = on_disconnect
+
 if __name__ == "__main__":
     ft.app(target=main)
@@ -0,0 +1,46 @@
+# tests/conftest.py
+# Shared fixtures. The components import each other as `components.x`, as when the app runs
+# from src/; the fake OpenAI-compatible server lives with the benchmarks.
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from components.providers import Provider, create_async_client  # noqa: E402
+from fake_server import FakeOpenAIServer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    with FakeOpenAIServer(latency=0.0, jitter=0.0) as fake:
+        yield fake
+
+
+@pytest.fixture
+def make_images(tmp_path):
+    def make(count, folder="images"):
+        directory = tmp_path / folder
+        directory.mkdir(exist_ok=True)
+        paths = []
+        for index in range(count):
+            path = directory / f"img{index:03d}.png"
+            Image.new("RGB", (32, 32), (index % 256, 0, 0)).save(path)
+            paths.append(str(path))
+        return paths
+    return make
+
+
+def fake_provider(server):
+    return Provider(name="fake", base_url=server.url, requires_api_key=False)
+
+
+def make_client(server):
+    # A fresh client per test: its connection pool belongs to the event loop of that test's
+    # asyncio.run(). Close it before the loop ends.
+    provider = fake_provider(server)
+    return create_async_client(provider, provider.resolve_api_key())
@@ -0,0 +1,96 @@
+# tests/test_batch.py
+import asyncio
+import threading
+from collections import Counter
+
+import openai
+
+from components.batch import BatchCaptioner
+from components.captioning import CaptionResult, caption_image
+from conftest import make_client
+
+
+def run_batch(server, paths, concurrency, cancel_after=None, latency=0.0):
+    # Captions `paths` through the fake server; returns (stats, saved, progress calls, batch).
+    server.latency = latency
+    saved = []
+    progress = []
+
+    async def main():
+        client = make_client(server)
+
+        async def caption_fn(image_path):
+            return await caption_image(client, image_path, "Describe the image.")
+
+        def on_progress(image_path, result, error, stats):
+            progress.append((image_path, result, error, stats))
+            if cancel_after is not None and len(progress) == cancel_after:
+                # Like the Cancel button: from another thread, while requests are in flight.
+                threading.Thread(target=batch.cancel).start()
+
+        batch = BatchCaptioner(
+            caption_fn, lambda image_path, result: saved.append((image_path, result)),
+            concurrency=concurrency, on_progress=on_progress,
+        )
+        try:
+            stats = await batch.run(paths)
+        finally:
+            await client.close()
+        return stats, batch
+
+    stats, batch = asyncio.run(main())
+    return stats, saved, progress, batch
+
+
+def test_in_flight_requests_stay_within_concurrency(server, make_images):
+    paths = make_images(24)
+    stats, saved, _, batch = run_batch(server, paths, concurrency=4, latency=0.05)
+    assert stats["done"] == 24
+    assert 1 < server.stats["max_in_flight"] <= 4
+    assert len(batch._workers) == 4
+
+
+def test_fewer_workers_than_concurrency_for_few_images(server, make_images):
+    paths = make_images(3)
+    stats, saved, _, batch = run_batch(server, paths, concurrency=16)
+    assert stats["done"] == 3
+    assert len(batch._workers) == 3
+    assert server.stats["max_in_flight"] <= 3
+
+
+def test_save_and_progress_called_once_per_image(server, make_images):
+    paths = make_images(10)
+    stats, saved, progress, batch = run_batch(server, paths, concurrency=3)
+    assert Counter(path for path, _ in saved) == Counter(paths)
+    assert Counter(call[0] for call in progress) == Counter(paths)
+    for image_path, result, error, stats_arg in progress:
+        assert isinstance(result, CaptionResult) and result.caption
+        assert error is None
+        assert stats_arg is batch.stats
+    assert stats["total"] == stats["done"] == 10
+    assert stats["prompt_tokens"] > 0 and stats["completion_tokens"] > 0
+
+
+def test_cancel_from_another_thread_keeps_completed_results(server, make_images):
+    paths = make_images(40)
+    stats, saved, progress, _ = run_batch(server, paths, concurrency=2, cancel_after=4, latency=0.05)
+    assert stats["cancelled"]
+    assert 4 <= stats["done"] < 40
+    # Every caption that finished was saved and reported; nothing else was.
+    assert sorted(path for path, _ in saved) == sorted(call[0] for call in progress if call[1] is not None)
+    assert len(saved) == stats["done"]
+
+
+def test_failing_image_does_not_stop_other_workers(server, make_images):
+    paths = make_images(12)
+    server.inject(400)
+    stats, saved, progress, _ = run_batch(server, paths, concurrency=4)
+    assert stats["failed"] == 1
+    assert stats["done"] == 11
+    failures = [call for call in progress if call[2] is not None]
+    assert len(failures) == 1
+    image_path, result, error, _ = failures[0]
+    assert result is None
+    assert isinstance(error, openai.BadRequestError)
+    assert image_path not in {path for path, _ in saved}
+    assert len(progress) == 12
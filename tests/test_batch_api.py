@@ -0,0 +1,169 @@
+# tests/test_batch_api.py
+import json
+import os
+
+import pytest
+
+import cli
+from components import batch_api
+from components.batch_api import BatchJob
+from components.providers import create_sync_client
+from conftest import fake_provider
+
+CONFIG = {"prompt": "Describe the image.", "model": "fake", "max_tokens": 40}
+
+
+@pytest.fixture
+def client(server):
+    provider = fake_provider(server)
+    client = create_sync_client(provider, provider.resolve_api_key())
+    yield client
+    client.close()
+
+
+def make_job(tmp_path, paths):
+    job = BatchJob(str(tmp_path / ".caption_batch"), os.path.dirname(paths[0]), CONFIG)
+    assert job.write_shards(paths) == []
+    return job
+
+
+def read_shard(job, shard):
+    with open(os.path.join(job.directory, shard["file"]), "rb") as f:
+        return f.read().splitlines(keepends=True)
+
+
+def run_job(job, client):
+    job.submit(client)
+    job.wait(client, poll_interval=0)
+    saved, errors = {}, {}
+    applied, failed = job.apply(
+        client, lambda image_path, result: saved.setdefault(image_path, result),
+        lambda image_path, error: errors.setdefault(image_path, error),
+    )
+    return applied, failed, saved, errors
+
+
+def test_write_shards_splits_at_the_request_limit(tmp_path, make_images, monkeypatch):
+    monkeypatch.setattr(batch_api, "MAX_SHARD_REQUESTS", 3)
+    paths = make_images(7)
+    job = make_job(tmp_path, paths)
+    assert [shard["requests"] for shard in job.shards] == [3, 3, 1]
+    custom_ids = []
+    for shard in job.shards:
+        lines = read_shard(job, shard)
+        assert len(lines) == shard["requests"]
+        assert sum(len(line) for line in lines) == shard["bytes"]
+        custom_ids += [json.loads(line)["custom_id"] for line in lines]
+        assert [json.loads(line)["custom_id"] for line in lines] == job.shard_custom_ids(shard)
+    assert [job.image_path(custom_id) for custom_id in custom_ids] == paths
+
+
+def test_write_shards_splits_at_the_byte_limit(tmp_path, make_images, monkeypatch):
+    paths = make_images(5)
+    probe = make_job(tmp_path / "probe", paths)
+    line_bytes = max(len(line) for line in read_shard(probe, probe.shards[0]))
+    limit = int(line_bytes * 2.5)
+    monkeypatch.setattr(batch_api, "MAX_SHARD_BYTES", limit)
+    job = make_job(tmp_path, paths)
+    assert [shard["requests"] for shard in job.shards] == [2, 2, 1]
+    for shard in job.shards:
+        assert shard["bytes"] <= limit
+        assert len(read_shard(job, shard)) == shard["requests"]
+
+
+def test_submit_is_idempotent(tmp_path, make_images, monkeypatch, server, client):
+    monkeypatch.setattr(batch_api, "MAX_SHARD_REQUESTS", 2)
+    job = make_job(tmp_path, make_images(6))
+    # An earlier run uploaded the first shard but failed before creating its batch.
+    with open(os.path.join(job.directory, job.shards[0]["file"]), "rb") as f:
+        job.shards[0]["input_file_id"] = client.files.create(file=f, purpose="batch").id
+    job.save()
+    assert job.submit(client) == 3
+    assert server.stats["files"] == 3
+    assert server.stats["batches"] == 3
+    assert server.batches[job.shards[0]["batch_id"]]["input_file_id"] == job.shards[0]["input_file_id"]
+
+    reloaded = BatchJob.load(job.directory)
+    assert reloaded.submit(client) == 0
+    assert server.stats["files"] == 3
+    assert server.stats["batches"] == 3
+    assert [shard["batch_id"] for shard in reloaded.shards] == [shard["batch_id"] for shard in job.shards]
+
+
+def test_apply_maps_results_by_custom_id(tmp_path, make_images, server, client):
+    paths = make_images(4)
+    job = make_job(tmp_path, paths)
+    applied, failed, saved, errors = run_job(job, client)
+    assert (applied, failed) == (4, 0)
+    assert sorted(saved) == paths
+    assert all(result.caption and result.prompt_tokens for result in saved.values())
+    assert errors == {}
+    assert job.finished
+    # Applying again downloads nothing.
+    assert job.apply(client, lambda *args: pytest.fail("applied twice")) == (0, 0)
+
+
+def test_apply_reports_errored_and_expired_requests(tmp_path, make_images, server, client):
+    paths = make_images(6)
+    job = make_job(tmp_path, paths)
+    server.batch_errors["img-1"] = 500
+    server.batch_errors["img-4"] = 400
+    server.batch_expired.update({"img-2", "img-5"})
+    applied, failed, saved, errors = run_job(job, client)
+    assert job.shards[0]["status"] == "expired"
+    assert (applied, failed) == (2, 4)
+    assert sorted(saved) == [paths[0], paths[3]]
+    assert sorted(errors) == [paths[1], paths[2], paths[4], paths[5]]
+    assert errors[paths[1]]["status_code"] == 500
+    assert errors[paths[2]]["code"] == "batch_expired"
+
+
+def test_apply_reports_requests_of_a_failed_batch(tmp_path, make_images, monkeypatch, server, client):
+    monkeypatch.setattr(batch_api, "MAX_SHARD_REQUESTS", 3)
+    paths = make_images(5)
+    job = make_job(tmp_path, paths)
+    server.fail_batches(1)
+    applied, failed, saved, errors = run_job(job, client)
+    assert [shard["status"] for shard in job.shards] == ["failed", "completed"]
+    assert (applied, failed) == (2, 3)
+    assert sorted(saved) == paths[3:]
+    assert sorted(errors) == paths[:3]
+    assert all("failed" in error["message"] for error in errors.values())
+    assert job.finished
+
+
+def test_apply_ignores_unknown_custom_ids(tmp_path, make_images, server, client, capsys):
+    paths = make_images(2)
+    job = make_job(tmp_path, paths)
+    job.submit(client)
+    job.refresh(client)
+    output_file = server.files[job.shards[0]["output_file_id"]]
+    lines = output_file["content"].splitlines(keepends=True)
+    stray = json.loads(lines[0])
+    stray["custom_id"] = "img-99"
+    # A stray id and a repeated line: neither is saved, and img-1 still counts once.
+    output_file["content"] = lines[0] + json.dumps(stray).encode() + b"\n" + lines[1] + lines[1]
+    saved = []
+    assert job.apply(client, lambda image_path, result: saved.append(image_path)) == (2, 0)
+    assert saved == paths
+    assert "img-99" in capsys.readouterr().out
+
+
+def test_cli_apply_keeps_a_shard_with_failed_writes_pending(tmp_path, make_images, server, capsys):
+    paths = make_images(3)
+    folder = os.path.dirname(paths[0])
+    options = ["--providers-file", str(tmp_path / "providers.json"), "--base-url", server.url, "--api-key", "test"]
+    assert cli.main(["batch", "submit", folder, *options]) == 0
+    # A directory where a sidecar should go makes its atomic replace fail.
+    blocker = os.path.splitext(paths[1])[0] + ".txt"
+    os.mkdir(blocker)
+
+    assert cli.main(["batch", "apply", folder, *options]) == 1
+    assert "run `batch apply` again" in capsys.readouterr().err
+    job = BatchJob.load(os.path.join(folder, batch_api.DEFAULT_JOB_DIR))
+    assert not job.shards[0].get("applied")
+
+    os.rmdir(blocker)
+    assert cli.main(["batch", "apply", folder, *options]) == 0
+    assert BatchJob.load(job.directory).finished
+    assert all(os.path.exists(os.path.splitext(path)[0] + ".txt") for path in paths)
@@ -0,0 +1,65 @@
+# tests/test_caption_cache.py
+import itertools
+import shutil
+import types
+
+from components import caption_cache
+from components.caption_cache import CaptionCache, hash_file
+from components.preprocess import PreprocessOptions
+
+
+def test_key_covers_image_content_prompt_and_model(tmp_path, make_images):
+    first, second = make_images(2)
+    copy = str(tmp_path / "copy.png")
+    shutil.copy(first, copy)
+    key = CaptionCache.make_key(hash_file(first), "Describe.", "gpt-4o", 300)
+    # Same bytes under another name: same key.
+    assert CaptionCache.make_key(hash_file(copy), "Describe.", "gpt-4o", 300) == key
+    others = [
+        CaptionCache.make_key(hash_file(second), "Describe.", "gpt-4o", 300),
+        CaptionCache.make_key(hash_file(first), "Describe briefly.", "gpt-4o", 300),
+        CaptionCache.make_key(hash_file(first), "Describe.", "gpt-4o-mini", 300),
+        CaptionCache.make_key(hash_file(first), "Describe.", "gpt-4o", 100),
+        CaptionCache.make_key(hash_file(first), "Describe.", "gpt-4o", 300, PreprocessOptions(max_side=256)),
+        CaptionCache.make_key(hash_file(first), "Describe.", "gpt-4o", 300, params={"temperature": 0.2}),
+    ]
+    assert len({key, *others}) == 7
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = itertools.count(1)
+    monkeypatch.setattr(caption_cache, "time", types.SimpleNamespace(time=lambda: next(clock)))
+    cache = CaptionCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+    try:
+        for index in range(10):
+            cache.put(f"key{index}", f"Caption {index}.")
+        assert cache.get("key0")[0] == "Caption 0."
+        cache.put("key10", "Caption 10.")
+        # Over the limit: evicted down to 95% (9 entries), oldest access first; key0 was just read.
+        assert cache.stats()["entries"] == 9
+        assert cache.get("key1") is None and cache.get("key2") is None
+        assert all(cache.get(f"key{index}") is not None for index in (0, 3, 10))
+    finally:
+        cache.close()
+
+    reopened = CaptionCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+    try:
+        assert reopened.stats()["entries"] == 9
+    finally:
+        reopened.close()
+
+
+def test_byte_limit_evicts_oldest_entries(tmp_path, monkeypatch):
+    clock = itertools.count(1)
+    monkeypatch.setattr(caption_cache, "time", types.SimpleNamespace(time=lambda: next(clock)))
+    cache = CaptionCache(str(tmp_path / "cache.sqlite3"), max_bytes=100)
+    try:
+        for index in range(4):
+            cache.put(f"key{index}", "x" * 30)
+        # 120 bytes: only the oldest entry has to go to get under 95.
+        assert cache.stats()["entries"] == 3
+        assert cache.stats()["bytes"] == 90
+        assert cache.get("key0") is None
+        assert all(cache.get(f"key{index}") is not None for index in (1, 2, 3))
+    finally:
+        cache.close()
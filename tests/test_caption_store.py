@@ -0,0 +1,28 @@
+# tests/test_caption_store.py
+import os
+
+from components.caption_store import CaptionStore
+
+
+def test_folder_queries_include_names_outside_the_bmp(tmp_path):
+    folder = tmp_path / "photos"
+    sibling = tmp_path / "photos0"
+    folder.mkdir()
+    sibling.mkdir()
+    inside = [str(folder / name) for name in ("a.png", "\U0001F600 smile.png", "\U00020000 ext-b.png")]
+    outside = str(sibling / "b.png")
+    store = CaptionStore(str(tmp_path / "captions.sqlite3"))
+    try:
+        for image_path in inside + [outside]:
+            store.put(image_path, None)
+        store.put(inside[0], "A caption.")
+
+        assert sorted(store.uncaptioned(str(folder))) == sorted(inside[1:])
+        assert store.coverage(str(folder)) == {"images": 3, "captioned": 1, "uncaptioned": 2, "errors": 0}
+        assert {row[0] for row in store.captions(str(folder))} == set(inside)
+        assert store.prune(str(folder), inside[:1]) == 2
+        assert store.uncaptioned(str(sibling)) == [outside]
+        assert store.export_sidecars(str(folder)) == 1
+        assert os.path.exists(str(folder / "a.txt"))
+    finally:
+        store.close()
@@ -0,0 +1,108 @@
+# tests/test_caption_writer.py
+import os
+import threading
+
+import pytest
+
+from components import caption_writer, sidecars
+from components.caption_writer import CaptionWriter
+from components.sidecars import read_caption
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    # Holds every sidecar write until the event is set; records the captions written.
+    event = threading.Event()
+    started = threading.Event()
+    writes = []
+    write_caption = caption_writer.write_caption
+
+    def gated_write(image_path, caption_text, fsync=False):
+        started.set()
+        event.wait(5)
+        writes.append((image_path, caption_text))
+        write_caption(image_path, caption_text, fsync)
+    monkeypatch.setattr(caption_writer, "write_caption", gated_write)
+    event.started = started
+    event.writes = writes
+    return event
+
+
+def test_repeated_saves_are_coalesced_and_readable_before_they_are_written(tmp_path, gate):
+    first, second = str(tmp_path / "a.png"), str(tmp_path / "b.png")
+    writer = CaptionWriter()
+    try:
+        writer.save(first, "first")
+        assert gate.started.wait(5)
+        # first is being written; the saves of second queue up behind it.
+        for caption in ("one", "two", "three"):
+            writer.save(second, caption)
+        assert writer.get(first) == "first"
+        assert writer.get(second) == "three"
+        assert read_caption(first) == ""
+        gate.set()
+        assert writer.flush(5)
+    finally:
+        writer.close()
+    assert gate.writes == [(first, "first"), (second, "three")]
+    assert writer.stats == {"saved": 4, "coalesced": 2, "written": 2, "errors": 0}
+    assert writer.get(second) is None
+    assert read_caption(second) == "three"
+
+
+def test_flush_waits_for_the_batch_being_written(tmp_path, gate):
+    image_path = str(tmp_path / "a.png")
+    writer = CaptionWriter()
+    try:
+        writer.save(image_path, "caption")
+        assert gate.started.wait(5)
+        assert not writer.flush(0.1)
+        flushed = []
+        waiter = threading.Thread(target=lambda: flushed.append(writer.flush(5)))
+        waiter.start()
+        waiter.join(0.1)
+        assert waiter.is_alive()
+        gate.set()
+        waiter.join(5)
+        assert flushed == [True]
+        assert read_caption(image_path) == "caption"
+    finally:
+        writer.close()
+
+
+def test_write_failure_reports_and_keeps_the_old_sidecar(tmp_path, monkeypatch):
+    image_path = str(tmp_path / "a.png")
+    (tmp_path / "a.txt").write_text("old caption")
+    replace = os.replace
+
+    def failing_replace(src, dst):
+        if dst.endswith("a.txt"):
+            raise OSError("disk full")
+        replace(src, dst)
+    monkeypatch.setattr(sidecars.os, "replace", failing_replace)
+    errors, written = [], []
+    writer = CaptionWriter(
+        on_written=lambda *args: written.append(args), on_error=lambda *args: errors.append(args)
+    )
+    try:
+        writer.save(image_path, "new caption")
+        assert writer.flush(5)
+    finally:
+        writer.close()
+    assert [(path, str(error)) for path, error in errors] == [(image_path, "disk full")]
+    assert written == []
+    assert writer.stats["errors"] == 1
+    assert read_caption(image_path) == "old caption"
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+
+def test_close_writes_queued_captions_and_rejects_new_ones(tmp_path):
+    image_path = str(tmp_path / "a.png")
+    written = []
+    writer = CaptionWriter(on_written=lambda *args: written.append(args))
+    writer.save(image_path, "caption", context="result")
+    writer.close()
+    assert written == [(image_path, "caption", "result")]
+    assert read_caption(image_path) == "caption"
+    with pytest.raises(RuntimeError):
+        writer.save(image_path, "too late")
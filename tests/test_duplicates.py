@@ -0,0 +1,43 @@
+# tests/test_duplicates.py
+import json
+import os
+
+from PIL import Image
+
+from components.duplicates import HashCache, compute_hashes
+
+
+def cached_paths(cache_dir):
+    with open(HashCache(str(cache_dir)).path, encoding="utf-8") as f:
+        return sorted(key.rsplit("|", 2)[0] for key in json.load(f))
+
+
+def test_hash_cache_drops_deleted_and_changed_images(tmp_path, make_images):
+    cache_dir = tmp_path / "cache"
+    paths = make_images(4)
+    other = make_images(2, folder="other")
+    compute_hashes(paths + other, HashCache(str(cache_dir)), max_workers=1)
+    assert cached_paths(cache_dir) == sorted(paths + other)
+
+    # One image deleted, one rewritten: the next scan of the folder hashes the rewritten one again
+    # and leaves neither old entry behind.
+    os.remove(paths[0])
+    Image.new("RGB", (48, 48), (0, 255, 0)).save(paths[1])
+    stat = os.stat(paths[1])
+    os.utime(paths[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    cache = HashCache(str(cache_dir))
+    hashes = compute_hashes(paths[1:], cache, max_workers=1)
+    assert sorted(hashes) == sorted(paths[1:])
+    assert len(cache._hashes) == 5
+    # The other folder wasn't part of this scan, so its entries are kept.
+    assert cached_paths(cache_dir) == sorted(paths[1:] + other)
+
+
+def test_hash_cache_saves_a_prune_without_new_hashes(tmp_path, make_images):
+    cache_dir = tmp_path / "cache"
+    paths = make_images(3)
+    compute_hashes(paths, HashCache(str(cache_dir)), max_workers=1)
+    os.remove(paths[2])
+    # Every remaining image is cached, so nothing is hashed, but the cache still shrinks.
+    compute_hashes(paths[:2], HashCache(str(cache_dir)), max_workers=1)
+    assert cached_paths(cache_dir) == sorted(paths[:2])
@@ -0,0 +1,79 @@
+# tests/test_export.py
+import json
+import os
+import tarfile
+
+from components.captioning import ERROR_PREFIX
+from components.export import _ShardWriter, export_dataset, verify_export
+from components.sidecars import write_caption
+
+
+def make_dataset(make_images):
+    paths = make_images(7)
+    for index, image_path in enumerate(paths[:5]):
+        write_caption(image_path, f"Caption {index}.")
+    write_caption(paths[6], f"{ERROR_PREFIX}: API error: timeout")
+    return paths
+
+
+def flip_byte(path, offset):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+
+def test_webdataset_export_round_trip(tmp_path, make_images):
+    paths = make_dataset(make_images)
+    output = tmp_path / "shards"
+    manifest = export_dataset(paths, os.path.dirname(paths[0]), str(output), "webdataset", shard_size=2, max_workers=1)
+    assert manifest["samples"] == 5
+    assert manifest["skipped"] == {"uncaptioned": 1, "error_caption": 1}
+    assert [shard["samples"] for shard in manifest["shards"]] == [2, 2, 1]
+    assert manifest["pattern"] == "shard-{000000..000002}.tar"
+    with tarfile.open(output / "shard-000001.tar") as tar:
+        assert tar.getnames() == [f"0000000{key}.{ext}" for key in (2, 3) for ext in ("png", "txt", "json")]
+        assert tar.extractfile("00000003.txt").read() == b"Caption 3."
+        meta = json.loads(tar.extractfile("00000003.json").read())
+        assert meta["path"] == "img003.png"
+        with open(paths[3], "rb") as f:
+            assert tar.extractfile("00000003.png").read() == f.read()
+        caption_offset = tar.getmember("00000003.txt").offset_data
+    assert verify_export(str(output)) == []
+
+    # A caption changed inside the tar: the shard no longer matches its checksum.
+    flip_byte(output / "shard-000001.tar", caption_offset)
+    os.remove(output / "shard-000002.tar")
+    assert verify_export(str(output)) == ["shard-000001.tar", "shard-000002.tar"]
+
+
+def test_jsonl_export_round_trip(tmp_path, make_images):
+    paths = make_dataset(make_images)
+    output = tmp_path / "shards"
+    manifest = export_dataset(paths, os.path.dirname(paths[0]), str(output), "jsonl", shard_size=2, max_workers=1)
+    assert [shard["images"] for shard in manifest["shards"]] == ["shard-000000", "shard-000001", "shard-000002"]
+    with open(output / "shard-000000.jsonl", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert [(line["key"], line["caption"], line["path"]) for line in lines] == [
+        ("00000000", "Caption 0.", "img000.png"), ("00000001", "Caption 1.", "img001.png"),
+    ]
+    assert os.path.exists(output / lines[1]["image"])
+    assert verify_export(str(output)) == []
+
+    # An image swapped for another one: its shard file is intact, but its sha256 isn't.
+    with open(output / lines[0]["image"], "wb") as f:
+        f.write(b"not the exported image")
+    assert verify_export(str(output)) == [lines[0]["image"]]
+    # A caption line edited in place.
+    text = (output / "shard-000001.jsonl").read_text(encoding="utf-8")
+    (output / "shard-000001.jsonl").write_text(text.replace("Caption 2.", "Caption 9."), encoding="utf-8")
+    assert verify_export(str(output)) == [lines[0]["image"], "shard-000001.jsonl"]
+
+
+def test_discarded_jsonl_shard_leaves_nothing_behind(tmp_path):
+    writer = _ShardWriter(str(tmp_path), 0, "jsonl")
+    sample = {"image": b"image bytes", "ext": "png", "caption": "A caption.", "mtime": 0}
+    writer.add("00000000", sample, {"path": "a.png", "width": 1, "height": 1, "sha256": ""})
+    writer.discard()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,65 @@
+# tests/test_manifest.py
+import json
+import os
+
+from components.captioning import CaptionResult
+from components.manifest import Manifest
+
+CONFIG = {"prompt": "Describe the image.", "model": "fake", "max_tokens": 40}
+RESULT = CaptionResult(caption="A caption.", model="fake", prompt="Describe the image.")
+
+
+def open_manifest(tmp_path):
+    return Manifest(str(tmp_path / "manifest.jsonl"), str(tmp_path), CONFIG)
+
+
+def image(tmp_path, name):
+    return os.path.join(str(tmp_path), name)
+
+
+def test_torn_last_line_is_dropped_before_appending(tmp_path):
+    manifest = open_manifest(tmp_path)
+    manifest.record(image(tmp_path, "a.png"), RESULT)
+    manifest.close()
+    with open(manifest.path, "a", encoding="utf-8") as f:
+        f.write('{"path": "b.png", "sta')  # the crash
+
+    manifest = open_manifest(tmp_path)
+    assert manifest.done == {"a.png"}
+    manifest.record(image(tmp_path, "c.png"), RESULT)
+    manifest.close()
+
+    manifest = open_manifest(tmp_path)
+    manifest.close()
+    assert manifest.done == {"a.png", "c.png"}
+    with open(manifest.path, encoding="utf-8") as f:
+        assert [json.loads(line).get("path") for line in f] == [None, "a.png", "c.png"]
+
+
+def test_complete_last_line_without_newline_is_kept(tmp_path):
+    manifest = open_manifest(tmp_path)
+    manifest.record(image(tmp_path, "a.png"), RESULT)
+    manifest.close()
+    with open(manifest.path, "rb+") as f:
+        f.truncate(os.path.getsize(manifest.path) - 1)
+
+    manifest = open_manifest(tmp_path)
+    manifest.record(image(tmp_path, "b.png"), error=ValueError("bad image"))
+    manifest.close()
+
+    manifest = open_manifest(tmp_path)
+    manifest.close()
+    assert manifest.done == {"a.png"}
+    assert manifest.failed == {"b.png"}
+
+
+def test_torn_settings_line_is_written_again(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    path.write_text('{"config": {"pro')
+    manifest = open_manifest(tmp_path)
+    manifest.record(image(tmp_path, "a.png"), RESULT)
+    manifest.close()
+
+    manifest = open_manifest(tmp_path)
+    manifest.close()
+    assert manifest.done == {"a.png"}
@@ -0,0 +1,69 @@
+# tests/test_metrics.py
+import csv
+import io
+
+from components.metrics import DEFAULT_BUCKETS, MetricsRegistry
+
+
+def make_registry():
+    metrics = MetricsRegistry(namespace="test")
+    local = metrics.labeled(provider="local")
+    local.observe("api_request_seconds", 0.003)
+    local.observe("api_request_seconds", 0.3)
+    local.inc("prompt_tokens_total", 800)
+    metrics.inc("prompt_tokens_total", 5, provider='a "quoted"\\name')
+    return metrics
+
+
+def test_prometheus_exposition_of_labeled_series():
+    lines = make_registry().to_prometheus().splitlines()
+    name = "test_api_request_seconds"
+    # One HELP and TYPE per family, before all of its series (the unlabeled one included).
+    assert lines.count(f"# TYPE {name} histogram") == 1
+    assert lines.count("# TYPE test_prompt_tokens_total counter") == 1
+    series = [index for index, line in enumerate(lines) if line.startswith(f"{name}_")]
+    help_line = lines.index(f"# HELP {name} Latency of one chat completion request, per attempt")
+    assert help_line < lines.index(f"# TYPE {name} histogram") < series[0]
+    assert series == list(range(series[0], series[-1] + 1))
+
+    buckets = {
+        line.split("{")[1].split("}")[0]: int(line.rsplit(" ", 1)[1])
+        for line in lines if line.startswith(f'{name}_bucket{{provider="local"')
+    }
+    assert len(buckets) == len(DEFAULT_BUCKETS) + 1
+    assert buckets['provider="local",le="0.001"'] == 0
+    assert buckets['provider="local",le="0.005"'] == 1
+    assert buckets['provider="local",le="0.25"'] == 1
+    assert buckets['provider="local",le="0.5"'] == 2
+    assert buckets['provider="local",le="+Inf"'] == 2
+    assert f'{name}_count{{provider="local"}} 2' in lines
+    assert any(line.startswith(f'{name}_sum{{provider="local"}} 0.30') for line in lines)
+    assert f"{name}_count 0" in lines
+    assert 'test_prompt_tokens_total{provider="local"} 800' in lines
+    assert 'test_prompt_tokens_total{provider="a \\"quoted\\"\\\\name"} 5' in lines
+    assert "test_prompt_tokens_total 0" in lines
+
+
+def test_csv_header_and_rows():
+    rows = list(csv.reader(io.StringIO(make_registry().to_csv())))
+    assert rows[0] == [
+        "timestamp", "name", "labels", "type", "value", "count", "sum", "mean", "min", "max", "p50", "p95", "p99"
+    ]
+    by_series = {(row[1], row[2]): row for row in rows[1:]}
+    assert all(len(row) == len(rows[0]) for row in rows)
+    timer = by_series[("api_request_seconds", "provider=local")]
+    assert timer[3:6] == ["timer", "", "2"]
+    assert float(timer[6]) == 0.303
+    assert float(timer[8]) == 0.003 and float(timer[9]) == 0.3
+    assert 0.003 <= float(timer[10]) <= float(timer[11]) <= float(timer[12]) <= 0.3
+    counter = by_series[("prompt_tokens_total", "provider=local")]
+    assert counter[3:5] == ["counter", "800"]
+    assert by_series[("prompt_tokens_total", "")][4] == "0"
+
+
+def test_export_picks_the_format_from_the_extension(tmp_path):
+    metrics = make_registry()
+    metrics.export(str(tmp_path / "metrics.csv"))
+    metrics.export(str(tmp_path / "metrics.prom"))
+    assert (tmp_path / "metrics.csv").read_text().startswith("timestamp,name,labels")
+    assert (tmp_path / "metrics.prom").read_text().startswith("# HELP test_")
@@ -0,0 +1,93 @@
+# tests/test_packing.py
+import asyncio
+import json
+
+import pytest
+
+from components.packing import PackedCaptioner, PackedResponseError, parse_packed_captions
+from conftest import make_client
+
+PROMPT = "Describe the image."
+SINGLE_CAPTION = "A synthetic caption of a few coloured rectangles on a plain background."
+
+
+def caption_all(server, paths, pack_size=4):
+    # Captions the first image alone (the calibration request), then the rest concurrently.
+    async def main():
+        client = make_client(server)
+        packer = PackedCaptioner(client, PROMPT, pack_size)
+        try:
+            first = await packer.caption(paths[0])
+            rest = await asyncio.gather(*(packer.caption(image_path) for image_path in paths[1:]))
+        finally:
+            await client.close()
+        return [first, *rest], packer
+    return asyncio.run(main())
+
+
+def test_parse_packed_captions():
+    assert parse_packed_captions('{"captions": {"2": "b", "1": "a"}}', 2) == ["a", "b"]
+    assert parse_packed_captions('{"1": "a"}', 1) == ["a"]
+    for content in ("not json", '["a"]', '{"captions": {"1": "a"}}', '{"captions": {"1": "a", "2": " "}}', None):
+        with pytest.raises(PackedResponseError):
+            parse_packed_captions(content, 2)
+
+
+def test_images_are_captioned_in_packs(server, make_images):
+    paths = make_images(9)
+    results, packer = caption_all(server, paths)
+    assert results[0].caption == SINGLE_CAPTION
+    # Each image gets the caption for its own number in its pack.
+    assert [result.caption for result in results[1:]] == [
+        f"A synthetic caption for image {number}." for number in (1, 2, 3, 4) * 2
+    ]
+    assert server.stats["requests"] == 3
+    assert packer.stats["packed_requests"] == 2
+    assert packer.stats["packed_images"] == 8
+    assert packer.stats["fallbacks"] == 0
+    assert all(result.prompt_tokens > 0 for result in results)
+    assert packer.token_savings() is not None
+
+
+@pytest.mark.parametrize("reply", [
+    "Sorry, here are the captions: ...",
+    json.dumps({"captions": {"1": "Only one caption."}}),
+])
+def test_malformed_or_short_reply_falls_back_to_single_requests(server, make_images, reply):
+    paths = make_images(5)
+    server.inject(200)  # the calibration request
+    server.inject(200, content=reply)
+    results, packer = caption_all(server, paths)
+    assert [result.caption for result in results] == [SINGLE_CAPTION] * 5
+    assert packer.stats["fallbacks"] == 1
+    assert packer.stats["packed_requests"] == 0
+    assert packer.stats["single_images"] == 5
+    assert server.stats["requests"] == 1 + 1 + 4
+
+
+def test_no_fallback_requests_for_cancelled_callers(server, make_images):
+    paths = make_images(5)
+    server.inject(200)
+    server.inject(200, content="not json")
+
+    async def main():
+        client = make_client(server)
+        packer = PackedCaptioner(client, PROMPT, 4)
+        try:
+            await packer.caption(paths[0])
+            server.latency = 0.2
+            tasks = [asyncio.create_task(packer.caption(image_path)) for image_path in paths[1:]]
+            await asyncio.sleep(0.1)
+            # Like a cancelled batch: the callers give up while the pack is in flight.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*packer._tasks)
+        finally:
+            await client.close()
+        return packer
+
+    packer = asyncio.run(main())
+    assert packer.stats["fallbacks"] == 1
+    assert packer.stats["single_images"] == 1
+    assert server.stats["requests"] == 2
@@ -0,0 +1,132 @@
+# tests/test_ratelimit.py
+import asyncio
+import time
+
+import openai
+import pytest
+
+from components.captioning import ERROR_PREFIX, caption_image, error_caption, estimate_request_tokens
+from components.ratelimit import RequestScheduler
+from conftest import make_client
+
+PROMPT = "Describe the image."
+
+
+def run(server, coroutine_fn):
+    # Runs coroutine_fn(client) on a fresh event loop with its own client.
+    async def main():
+        client = make_client(server)
+        try:
+            return await coroutine_fn(client)
+        finally:
+            await client.close()
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("headers", [{"retry-after": "0.3"}, {"retry-after-ms": "300"}])
+def test_429_pauses_every_request_for_retry_after(server, make_images, headers):
+    image_path, other_path = make_images(2)
+    scheduler = RequestScheduler(max_concurrency=4, base_delay=0.01)
+    server.inject(429, headers=headers)
+
+    async def scenario(client):
+        started = time.monotonic()
+        first = asyncio.create_task(caption_image(client, image_path, PROMPT, scheduler=scheduler))
+        while not scheduler.stats["rate_limited"]:
+            await asyncio.sleep(0.005)
+        # Started after the 429: it has to wait out the same pause, not just the failed request.
+        second = await caption_image(client, other_path, PROMPT, scheduler=scheduler)
+        second_elapsed = time.monotonic() - started
+        first = await first
+        return first, second, second_elapsed, time.monotonic() - started
+
+    first, second, second_elapsed, elapsed = run(server, scenario)
+    assert first.caption and second.caption
+    assert second_elapsed >= 0.3
+    assert elapsed >= 0.3
+    assert scheduler.stats["rate_limited"] == 1
+    assert scheduler.stats["retries"] == 1
+    assert scheduler.stats["requests"] == 3
+    assert scheduler.stats["paused_seconds"] > 0
+    assert server.stats["rate_limited"] == 1
+
+
+def test_500_is_retried_until_it_succeeds(server, make_images):
+    image_path, = make_images(1)
+    scheduler = RequestScheduler(max_retries=2, base_delay=0.01)
+    server.inject(500, count=2)
+    result = run(server, lambda client: caption_image(client, image_path, PROMPT, scheduler=scheduler))
+    assert result.caption
+    assert scheduler.stats["retries"] == 2
+    assert scheduler.stats["server_errors"] == 2
+
+
+def test_500_gives_up_after_max_retries_with_an_error_caption(server, make_images):
+    image_path, = make_images(1)
+    scheduler = RequestScheduler(max_retries=2, base_delay=0.01)
+    server.inject(500, count=3)
+    with pytest.raises(openai.InternalServerError) as excinfo:
+        run(server, lambda client: caption_image(client, image_path, PROMPT, scheduler=scheduler))
+    assert scheduler.stats["requests"] == 3
+    assert scheduler.stats["retries"] == 2
+    assert server.stats["server_errors"] == 3
+    caption = error_caption(excinfo.value)
+    assert caption.startswith(ERROR_PREFIX)
+    assert "API error" in caption
+
+
+def test_400_is_not_retried(server, make_images):
+    image_path, = make_images(1)
+    scheduler = RequestScheduler(max_retries=5, base_delay=0.01)
+    server.inject(400)
+    with pytest.raises(openai.BadRequestError):
+        run(server, lambda client: caption_image(client, image_path, PROMPT, scheduler=scheduler))
+    assert scheduler.stats["requests"] == 1
+    assert scheduler.stats["retries"] == 0
+    assert server.stats["requests"] == 1
+
+
+def caption_all(server, paths, scheduler, max_tokens=40):
+    async def scenario(client):
+        started = time.monotonic()
+        results = await asyncio.gather(*(
+            caption_image(client, image_path, PROMPT, max_tokens=max_tokens, scheduler=scheduler)
+            for image_path in paths
+        ))
+        return results, time.monotonic() - started
+    return run(server, scenario)
+
+
+def test_rpm_bucket_throttles_requests(server, make_images):
+    paths = make_images(30)
+    # 2 requests per 0.1 s window: 20/s with a burst of one second's worth (20).
+    scheduler = RequestScheduler(rpm=2, rate_window=0.1)
+    results, elapsed = caption_all(server, paths, scheduler)
+    assert all(result.caption for result in results)
+    # The 10 requests beyond the burst are spaced 50 ms apart.
+    assert elapsed >= 0.4
+    assert server.stats["requests"] == 30
+
+    unthrottled = RequestScheduler()
+    _, fast_elapsed = caption_all(server, paths, unthrottled)
+    assert fast_elapsed < elapsed
+
+
+def test_tpm_bucket_throttles_tokens(server, make_images):
+    paths = make_images(8)
+    # With this max_tokens the estimate matches what the fake server reports, so the bucket
+    # isn't corrected afterwards.
+    max_tokens = 550
+    estimate = estimate_request_tokens(PROMPT, 32, 32, max_tokens)
+    fill_rate = 480 / 0.1  # tokens per second, and the bucket's capacity
+    scheduler = RequestScheduler(tpm=480, rate_window=0.1)
+    results, elapsed = caption_all(server, paths, scheduler, max_tokens)
+    assert all(result.caption for result in results)
+    assert results[0].prompt_tokens + results[0].completion_tokens == estimate
+    # Each request takes its estimate from the bucket before it is sent, and the bucket only
+    # refills at fill_rate.
+    assert elapsed >= (len(paths) * estimate - fill_rate) / fill_rate
+    assert elapsed >= 0.25
+
+    _, fast_elapsed = caption_all(server, paths, RequestScheduler(), max_tokens)
+    assert fast_elapsed < elapsed
@@ -0,0 +1,66 @@
+# tests/test_search.py
+from components.captioning import ERROR_PREFIX
+from components.search import CaptionIndex
+
+
+def make_index():
+    index = CaptionIndex()
+    index.update("cat.png", "A black cat on a sofa.")
+    index.update("cats.png", "Two cats in the garden.")
+    index.update("dog.png", "A dog chasing a black cat.")
+    index.update("empty.png", "")
+    index.update("error.png", f"{ERROR_PREFIX}: API error: timeout")
+    return index
+
+
+def test_empty_query_does_not_filter():
+    index = make_index()
+    assert index.search("") is None
+    assert index.search("   ") is None
+
+
+def test_last_term_matches_as_a_prefix():
+    index = make_index()
+    assert index.search("cat") == {"cat.png", "cats.png", "dog.png"}
+    assert index.search("bl") == {"cat.png", "dog.png"}
+    # Only the last term: an earlier "cat" must be the whole word.
+    assert index.search("cat black") == {"cat.png", "dog.png"}
+    assert index.search("cats gard") == {"cats.png"}
+    assert index.search("BLACK Sof") == {"cat.png"}
+
+
+def test_minus_excludes_a_word():
+    index = make_index()
+    assert index.search("cats -dog") == {"cats.png"}
+    # "cat" isn't the last term here, so it is matched as a whole word.
+    assert index.search("cat -dog") == {"cat.png"}
+    assert index.search("-black") == {"cats.png", "empty.png", "error.png"}
+    # A lone "-" (an exclusion still being typed) filters nothing out.
+    assert index.search("-") == {"cat.png", "cats.png", "dog.png", "empty.png", "error.png"}
+
+
+def test_status_filters():
+    index = make_index()
+    assert index.search("is:empty") == {"empty.png"}
+    assert index.search("is:error") == {"error.png"}
+    assert index.search("is:captioned") == {"cat.png", "cats.png", "dog.png", "error.png"}
+    assert index.search("is:captioned -is") == {"cat.png", "cats.png", "dog.png", "error.png"}
+    assert index.search("is:captioned black") == {"cat.png", "dog.png"}
+
+
+def test_vocabulary_follows_updates_and_removals():
+    index = make_index()
+    assert index.search("sof") == {"cat.png"}
+    index.update("cat.png", "A ginger cat asleep.")
+    assert index.search("sof") == set()
+    assert index.search("gin") == {"cat.png"}
+    index.remove("cat.png")
+    assert index.search("gin") == set()
+    assert "cat.png" not in index
+    index.update("new.png", "A sofa by the window.")
+    assert index.search("sof") == {"new.png"}
+    index.update("error.png", "Fixed caption.")
+    assert index.search("is:error") == set()
+    index.update("empty.png", "Now captioned.")
+    assert index.search("is:empty") == set()
+    assert len(index) == 5
@@ -0,0 +1,28 @@
+# tests/test_tags.py
+from components.tags import TagStore
+
+
+def test_add_appends_after_a_last_line_without_newline(tmp_path):
+    path = tmp_path / "tags.txt"
+    path.write_text("cat\ndog", encoding="utf-8")
+    store = TagStore(str(path))
+    assert store.add("house")
+    assert path.read_text(encoding="utf-8") == "cat\ndog\nhouse\n"
+    assert list(TagStore(str(path))) == ["cat", "dog", "house"]
+
+
+def test_add_appends_one_line_per_tag(tmp_path):
+    path = tmp_path / "tags.txt"
+    path.write_text("cat\n", encoding="utf-8")
+    store = TagStore(str(path))
+    assert store.add("chat noir")
+    assert not store.add("cat")
+    assert store.add(" dog ")
+    assert path.read_text(encoding="utf-8") == "cat\nchat noir\ndog\n"
+
+
+def test_add_writes_the_defaults_first(tmp_path):
+    path = tmp_path / "tags.txt"
+    store = TagStore(str(path), defaults=("cat", "dog"))
+    assert store.add("car")
+    assert list(TagStore(str(path))) == ["cat", "dog", "car"]
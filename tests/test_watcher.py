@@ -0,0 +1,85 @@
+# tests/test_watcher.py
+import threading
+import time
+
+import pytest
+
+from components import watcher
+from components.watcher import FolderWatcher
+
+
+class FailingBackend:
+    # Stands in for inotify: the first `failures` reads raise, later ones see nothing.
+    failures = 0
+
+    def __init__(self, root, recursive, is_relevant):
+        self.reads = []
+        self.closed = False
+
+    def read(self, timeout):
+        self.reads.append(time.monotonic())
+        if len(self.reads) <= self.failures:
+            raise OSError("read failed")
+        time.sleep(timeout)
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def changes(monkeypatch):
+    monkeypatch.setattr(watcher, "_InotifyBackend", FailingBackend)
+    monkeypatch.setattr(watcher, "READ_ERROR_BACKOFF", 0.02)
+    calls = []
+    event = threading.Event()
+
+    def on_changes(paths):
+        calls.append(paths)
+        event.set()
+    return calls, event, on_changes
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_failing_reads_back_off_and_rescan_once(tmp_path, changes, monkeypatch):
+    calls, event, on_changes = changes
+    monkeypatch.setattr(FailingBackend, "failures", 3)
+    folder = FolderWatcher(str(tmp_path), on_changes, debounce=0.05)
+    folder.start()
+    try:
+        assert event.wait(5)
+        backend = folder._backend
+        wait_for(lambda: len(backend.reads) >= 6)
+    finally:
+        folder.stop()
+    assert folder.backend_name == "inotify"
+    assert calls == [None]
+    gaps = [later - earlier for earlier, later in zip(backend.reads, backend.reads[1:4])]
+    assert gaps[0] >= 0.02 and gaps[1] >= 0.04 and gaps[2] >= 0.08
+
+
+def test_persistent_failures_switch_to_polling(tmp_path, changes, monkeypatch):
+    calls, event, on_changes = changes
+    monkeypatch.setattr(FailingBackend, "failures", 1000)
+    folder = FolderWatcher(str(tmp_path), on_changes, debounce=0.05, poll_interval=0.05)
+    folder.start()
+    try:
+        inotify = folder._backend
+        assert event.wait(5)
+        assert inotify.closed
+        assert len(inotify.reads) == watcher.MAX_READ_FAILURES
+        assert folder.backend_name == "polling"
+        assert calls == [None]
+
+        image_path = tmp_path / "new.png"
+        image_path.write_bytes(b"png")
+        wait_for(lambda: len(calls) == 2)
+    finally:
+        folder.stop()
+    assert calls[1] == {str(image_path)}